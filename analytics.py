@@ -1,23 +1,28 @@
 """
 analytics.py
-Compute MDD, volatility, Sharpe ratio, etc. for either 4h or daily data.
+Compute MDD, volatility, Sharpe ratio, etc. for bars of any interval (4h, daily, ...).
 """
 
 import logging
 import numpy as np
 import pandas as pd
+from cache_manager import interval_step
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def compute_analytics(df, frequency='4h'):
+def compute_analytics(df=None, frequency='4h', context=None):
     """
     df should have columns ['Date','Close','Return'].
     frequency='4h' => annual_factor ~ sqrt(2190)
     frequency='1d' => annual_factor ~ sqrt(365)
+    (sqrt of the bars per 365-day year for any interval, 1.0 if unknown).
+    If a ScenarioContext is passed, its frame is used instead of df.
     """
     try:
-        if df.empty:
+        if context is not None:
+            df = context.frame
+        if df is None or df.empty:
             raise ValueError("DataFrame is empty in compute_analytics.")
 
         df = df.copy()
@@ -31,11 +36,9 @@ def compute_analytics(df, frequency='4h'):
         df['Drawdown'] = df['Cumulative'] / df['CumulativeMax'] - 1
         max_drawdown = df['Drawdown'].min()
 
-        if frequency == '4h':
-            annual_factor = np.sqrt(2190)
-        elif frequency == '1d':
-            annual_factor = np.sqrt(365)
-        else:
+        try:
+            annual_factor = np.sqrt(pd.Timedelta(days=365) / interval_step(frequency))
+        except (KeyError, ValueError):
             annual_factor = 1.0
 
         vol = df['Return'].std() * annual_factor
@@ -0,0 +1,5 @@
+"""
+benchmarks
+Stand-alone timing scripts for the backtest pipeline.
+Run them from the repository root, e.g. `python -m benchmarks.bench_blind_dca`.
+"""
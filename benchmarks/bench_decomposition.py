@@ -0,0 +1,64 @@
+"""
+bench_decomposition.py
+Compare the monolithic CBC solve with the month-by-month decomposition
+(decomposition.py) on a long synthetic 4h range, for several worker counts.
+
+Both run on the presolved bars. For each run the wall time, the coins bought
+and the gap against the fast_solver bound are printed.
+
+    python -m benchmarks.bench_decomposition --years 10 --workers 1 2 4 8
+"""
+
+import argparse
+import time
+import pandas as pd
+from pulp import PULP_CBC_CMD, value
+from optimization_model import define_ilp_model
+from fast_solver import solve_dca_greedy, coin_weights
+from presolve import presolve_bars
+from decomposition import solve_decomposed
+from solver import SOLVER_GAP_REL
+from benchmarks.synthetic import synthetic_4h_frame
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=float, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    df = synthetic_4h_frame("2014-01-01", args.years, seed=args.seed)
+    limits = (50000.0, 700.0, 250.0, 60.0, 100.0)
+    total, monthly, weekly, min_invest, per_buy_max = limits
+    date_index = pd.DatetimeIndex(df['Date'])
+    month_codes = pd.factorize(date_index.to_period('M'))[0]
+    week_codes  = pd.factorize(date_index.to_period('W'))[0]
+    opens = df['Open'].to_numpy(dtype=float)
+    c = coin_weights(opens)
+
+    x0, info = solve_dca_greedy(opens, month_codes, week_codes, *limits)
+    keep, stats = presolve_bars(df['Date'].values, opens, month_codes, week_codes,
+                                total, monthly, weekly, min_invest)
+    bound = info['upper_bound']
+    print(f"{len(df)} bars, {stats['kept']} after presolve, {month_codes.max() + 1} months")
+    print(f"{'run':>16} {'seconds':>8} {'coins':>12} {'gap':>9}")
+    print(f"{'greedy':>16} {'':>8} {info['objective']:>12.6f} {(bound - info['objective']) / bound:>9.2e}")
+
+    t0 = time.perf_counter()
+    model, invest_vars, _ = define_ilp_model(df.iloc[keep].reset_index(drop=True), *limits)
+    model.solve(PULP_CBC_CMD(msg=0, gapRel=SOLVER_GAP_REL))
+    cbc_s = time.perf_counter() - t0
+    cbc_obj = value(model.objective)
+    print(f"{'cbc':>16} {cbc_s:>8.2f} {cbc_obj:>12.6f} {(bound - cbc_obj) / bound:>9.2e}")
+
+    for workers in args.workers:
+        t0 = time.perf_counter()
+        x, dec_info = solve_decomposed(opens, month_codes, week_codes, *limits, x0, info['relaxed_plan'],
+                                       keep, SOLVER_GAP_REL, workers=workers)
+        dec_s = time.perf_counter() - t0
+        coins = c @ x
+        print(f"{f'decomposed x{workers}':>16} {dec_s:>8.2f} {coins:>12.6f} {(bound - coins) / bound:>9.2e}"
+              f"   ({dec_info['rounds']} rounds)")
+
+if __name__ == "__main__":
+    main()
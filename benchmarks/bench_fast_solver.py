@@ -0,0 +1,79 @@
+"""
+bench_fast_solver.py
+Cross-check the greedy/Lagrangian solver (fast_solver.py) against CBC on
+randomized instances and compare latency.
+
+For every instance it checks that the greedy plan is feasible, that the
+certified upper bound is not below CBC's objective, and reports how far the
+greedy objective is from CBC's.
+
+    python -m benchmarks.bench_fast_solver --instances 20
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from pulp import PULP_CBC_CMD, LpStatus, value
+from optimization_model import define_ilp_model
+from fast_solver import solve_dca_greedy, coin_weights
+from benchmarks.synthetic import synthetic_4h_frame
+
+def random_instance(rng):
+    years = float(rng.choice([0.5, 1.0, 2.0]))
+    df = synthetic_4h_frame(f"2021-0{rng.integers(1, 10)}-0{rng.integers(1, 10)}", years, seed=int(rng.integers(1_000_000)))
+    per_buy_max = float(rng.choice([50, 100, 200]))
+    min_invest  = float(rng.choice([5, 20, 0.6 * per_buy_max]))
+    weekly  = float(rng.choice([1, 2.5, 4])) * per_buy_max
+    monthly = float(rng.choice([2, 3.3, 5])) * weekly
+    total   = float(rng.choice([3, 6, 20])) * monthly
+    return df, (total, monthly, weekly, min_invest, per_buy_max)
+
+def check_feasible(x, month_codes, week_codes, limits, tol=1e-6):
+    total, monthly, weekly, min_invest, per_buy_max = limits
+    bought = x[x > 0]
+    return (x.sum() <= total + tol
+            and np.bincount(month_codes, weights=x).max() <= monthly + tol
+            and np.bincount(week_codes, weights=x).max() <= weekly + tol
+            and (bought >= min_invest - tol).all()
+            and (bought <= per_buy_max + tol).all())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    cbc_times, fast_times, certified = [], [], 0
+    print(f"{'bars':>6} {'cbc ms':>9} {'fast ms':>8} {'gap vs cbc':>11} {'cert. gap':>10}")
+    for _ in range(args.instances):
+        df, limits = random_instance(rng)
+        date_index = pd.DatetimeIndex(df['Date'])
+        month_codes = pd.factorize(date_index.to_period('M'))[0]
+        week_codes  = pd.factorize(date_index.to_period('W'))[0]
+
+        t0 = time.perf_counter()
+        model, _, _ = define_ilp_model(df, *limits)
+        model.solve(PULP_CBC_CMD(msg=0))
+        cbc_s = time.perf_counter() - t0
+        assert LpStatus[model.status] == "Optimal"
+        cbc_obj = value(model.objective)
+
+        t0 = time.perf_counter()
+        x, info = solve_dca_greedy(df['Open'].to_numpy(), month_codes, week_codes, *limits)
+        fast_s = time.perf_counter() - t0
+
+        coins = coin_weights(df['Open'].to_numpy()) @ x
+        assert check_feasible(x, month_codes, week_codes, limits), "greedy plan violates a constraint"
+        assert info['upper_bound'] >= cbc_obj * (1 - 1e-6), "upper bound below CBC objective"
+        certified += info['certified']
+        cbc_times.append(cbc_s)
+        fast_times.append(fast_s)
+        print(f"{len(df):>6} {cbc_s * 1000:>9.1f} {fast_s * 1000:>8.1f} {(cbc_obj - coins) / cbc_obj:>+11.1e} {info['gap']:>10.1e}")
+
+    print(f"\ncertified within tolerance: {certified}/{args.instances} (others fall back to CBC)")
+    print(f"median latency  cbc: {np.median(cbc_times) * 1000:.1f} ms   greedy: {np.median(fast_times) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
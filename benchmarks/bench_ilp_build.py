@@ -0,0 +1,91 @@
+"""
+bench_ilp_build.py
+Build time and peak Python memory of define_ilp_model on 1, 3 and 5 years
+of synthetic 4h bars, against the original per-month/per-week filtering
+version. Also checks that both write byte-identical LP files.
+
+    python -m benchmarks.bench_ilp_build
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pulp import LpMaximize, LpProblem, LpVariable, lpSum, LpBinary, LpContinuous
+from optimization_model import define_ilp_model
+from benchmarks.synthetic import synthetic_4h_frame
+
+LIMITS = (50000.0, 2000.0, 600.0, 20.0, 200.0)
+
+def legacy_define_ilp_model(df, total_investment, monthly_limit, weekly_limit,
+                            min_invest, per_buy_max):
+    """The original builder, kept here only as the baseline."""
+    df = df.copy()
+    df.set_index('Date', inplace=True)
+    periods = df.index.tolist()
+    model = LpProblem(name="asset-buying-optimization", sense=LpMaximize)
+    invest_vars = {}
+    invest_binaries = {}
+    for period in periods:
+        var_name = period.strftime("%Y%m%d_%H%M")
+        invest_vars[period] = LpVariable(f"invest_{var_name}", lowBound=0, upBound=per_buy_max, cat=LpContinuous)
+        invest_binaries[period] = LpVariable(f"binary_{var_name}", cat=LpBinary)
+    objective_terms = []
+    for period in periods:
+        open_price = float(df.loc[period, 'Open'])
+        if open_price <= 0:
+            open_price = 1e-9
+        objective_terms.append(invest_vars[period] * (1.0 / open_price))
+    model += lpSum(objective_terms), "TotalCoins"
+    model += (lpSum(invest_vars.values()) <= total_investment), "TotalInvestment"
+    df['Month'] = df.index.to_period('M')
+    for m in df['Month'].unique():
+        subset_idx = df[df['Month'] == m].index
+        model += (lpSum(invest_vars[i] for i in subset_idx) <= monthly_limit), f"MonthLimit_{m}"
+    df['Week'] = df.index.to_period('W')
+    for w in df['Week'].unique():
+        subset_idx = df[df['Week'] == w].index
+        model += (lpSum(invest_vars[i] for i in subset_idx) <= weekly_limit), f"WeekLimit_{w}"
+    for period in periods:
+        model += invest_vars[period] >= (min_invest * invest_binaries[period])
+        model += invest_vars[period] <= (per_buy_max * invest_binaries[period])
+    return model, invest_vars, invest_binaries
+
+def measure(build, df):
+    """Wall time of an untraced build, then peak traced memory of a second build."""
+    t0 = time.perf_counter()
+    model = build(df, *LIMITS)[0]
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    build(df, *LIMITS)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return model, elapsed, peak
+
+def lp_text(model):
+    fd, path = tempfile.mkstemp(suffix=".lp")
+    os.close(fd)
+    try:
+        model.writeLP(path)
+        with open(path) as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 3, 5])
+    args = parser.parse_args()
+
+    print(f"{'years':>5} {'bars':>6} {'legacy s':>9} {'new s':>7} {'legacy MiB':>11} {'new MiB':>8} {'identical':>9}")
+    for years in args.years:
+        df = synthetic_4h_frame("2019-01-01", years)
+        old_model, old_s, old_peak = measure(legacy_define_ilp_model, df)
+        new_model, new_s, new_peak = measure(define_ilp_model, df)
+        same = lp_text(old_model) == lp_text(new_model)
+        print(f"{years:>5} {len(df):>6} {old_s:>9.2f} {new_s:>7.2f} "
+              f"{old_peak / 2**20:>11.1f} {new_peak / 2**20:>8.1f} {str(same):>9}")
+
+if __name__ == "__main__":
+    main()
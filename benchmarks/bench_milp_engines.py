@@ -0,0 +1,55 @@
+"""
+bench_milp_engines.py
+Cross-check the MILP engines of milp_solvers.py on the randomized instances
+of bench_fast_solver: every engine solves the same model, its plan is checked
+against all limits, and the wall times and objectives are compared.
+
+    python -m benchmarks.bench_milp_engines --instances 10
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from fast_solver import coin_weights
+from milp_solvers import available_engines, get_engine
+from solver import SOLVER_GAP_REL, SOLVER_TIME_LIMIT
+from benchmarks.bench_fast_solver import random_instance, check_feasible
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    engines = available_engines()
+    rng = np.random.default_rng(args.seed)
+    print(f"{'bars':>6} " + " ".join(f"{name + ' ms':>10} {name + ' coins':>14}" for name in engines))
+    seconds = {name: [] for name in engines}
+    for _ in range(args.instances):
+        df, limits = random_instance(rng)
+        date_index = pd.DatetimeIndex(df['Date'])
+        month_codes = pd.factorize(date_index.to_period('M'))[0]
+        week_codes  = pd.factorize(date_index.to_period('W'))[0]
+        c = coin_weights(df['Open'].to_numpy(dtype=float))
+
+        row, objectives = [], []
+        for name in engines:
+            _, engine = get_engine(name)
+            t0 = time.perf_counter()
+            x, status, _ = engine(df, month_codes, week_codes, *limits, 0.1, None,
+                                  SOLVER_TIME_LIMIT, SOLVER_GAP_REL, 1, None)
+            elapsed = time.perf_counter() - t0
+            assert status == "optimal", f"{name}: {status}"
+            assert check_feasible(x, month_codes, week_codes, limits), f"{name} plan breaks a limit"
+            seconds[name].append(elapsed)
+            objectives.append(c @ x)
+            row.append(f"{elapsed * 1000:>10.1f} {c @ x:>14.8f}")
+        best = max(objectives)
+        assert all(obj >= best * (1 - SOLVER_GAP_REL) for obj in objectives), "engines disagree beyond the MIP gap"
+        print(f"{len(df):>6} " + " ".join(row))
+
+    print("\nmedian seconds: " + ", ".join(f"{name} {np.median(s):.3f}" for name, s in seconds.items()))
+
+if __name__ == "__main__":
+    main()
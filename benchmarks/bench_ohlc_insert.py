@@ -0,0 +1,93 @@
+"""
+bench_ohlc_insert.py
+Rows per second of insert_ohlc_data (COPY into a staging table, one set-based
+upsert) against the previous path (row dicts, one INSERT ... ON CONFLICT per
+row through executemany). Both insert fresh rows and then upsert the same
+rows again, as convert_gold_to_usd does with the whole gold table.
+
+Needs the Postgres of credentials.py; writes crypto_ohlc rows of the symbol
+BENCH_SYMBOL and deletes them (and their coverage) afterwards.
+
+    python -m benchmarks.bench_ohlc_insert --rows 1000 10000 50000
+"""
+
+import time
+import argparse
+from cache_manager import insert_ohlc_data
+from database_manager import get_connection, put_connection, init_db
+from benchmarks.synthetic import synthetic_ohlc_frame
+
+BENCH_SYMBOL = "BENCHUSDT"
+
+def insert_executemany(rows):
+    """The previous insert_ohlc_data body for crypto_ohlc (on the typed columns)."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.executemany('''
+            INSERT INTO crypto_ohlc (symbol, interval, bar_time, open, high, low, close)
+            VALUES (%s, '4h', %s::timestamp AT TIME ZONE 'UTC', %s, %s, %s, %s)
+            ON CONFLICT (symbol, interval, bar_time)
+            DO UPDATE SET
+                open  = EXCLUDED.open,
+                high  = EXCLUDED.high,
+                low   = EXCLUDED.low,
+                close = EXCLUDED.close
+        ''', [(r['symbol'], r['date'], r['open'], r['high'], r['low'], r['close']) for r in rows])
+        conn.commit()
+        cur.close()
+    finally:
+        put_connection(conn)
+
+def cleanup():
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM crypto_ohlc WHERE symbol=%s", (BENCH_SYMBOL,))
+        cur.execute("DELETE FROM ohlc_coverage WHERE table_name='crypto_ohlc' AND symbol=%s", (BENCH_SYMBOL,))
+        conn.commit()
+        cur.close()
+    finally:
+        put_connection(conn)
+
+def _rate(func, arg, n):
+    t0 = time.perf_counter()
+    func(arg)
+    return n / (time.perf_counter() - t0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    init_db()
+    print(f"{'rows':>7} {'old insert/s':>13} {'old upsert/s':>13} {'copy insert/s':>14} {'copy upsert/s':>14}")
+    try:
+        for n in args.rows:
+            df = synthetic_ohlc_frame("2014-01-01", n / (365 * 6) + 1 / 365, interval='4h').iloc[:n]
+            columns = {
+                'symbol': BENCH_SYMBOL,
+                'date': df['Date'],
+                'open': df['Open'],
+                'high': df['High'],
+                'low': df['Low'],
+                'close': df['Close']
+            }
+            rows = [
+                {'symbol': BENCH_SYMBOL, 'date': d, 'open': o, 'high': h, 'low': l, 'close': c}
+                for d, o, h, l, c in zip(df['Date'].dt.strftime("%Y-%m-%d %H:%M:%S"), df['Open'],
+                                         df['High'], df['Low'], df['Close'])
+            ]
+
+            cleanup()
+            old_insert = _rate(insert_executemany, rows, n)
+            old_upsert = _rate(insert_executemany, rows, n)
+            cleanup()
+            copy_insert = _rate(lambda data: insert_ohlc_data("crypto_ohlc", data), columns, n)
+            copy_upsert = _rate(lambda data: insert_ohlc_data("crypto_ohlc", data), columns, n)
+            print(f"{n:>7} {old_insert:>13,.0f} {old_upsert:>13,.0f} {copy_insert:>14,.0f} {copy_upsert:>14,.0f}")
+    finally:
+        cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+bench_presolve.py
+Measure how much presolve.py shrinks the ILP and check its effect on the
+optimum, on the randomized instances of bench_fast_solver.
+
+For every instance the full model, the dominance-pruned model and the
+daily-coarsened model are solved by CBC. The pruned objective must equal the
+full one within SOLVER_GAP_REL, the tolerance all solves run with; the
+coarsened objective is reported with its proven gap against the Lagrangian
+bound of the full model.
+
+    python -m benchmarks.bench_presolve --instances 10
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from pulp import PULP_CBC_CMD, LpStatus, value
+from optimization_model import define_ilp_model
+from fast_solver import solve_dca_greedy
+from presolve import presolve_bars
+from solver import SOLVER_GAP_REL
+from benchmarks.bench_fast_solver import random_instance
+
+def solve_subset(df, keep, limits):
+    t0 = time.perf_counter()
+    model, _, _ = define_ilp_model(df.iloc[keep].reset_index(drop=True), *limits)
+    model.solve(PULP_CBC_CMD(msg=0, gapRel=SOLVER_GAP_REL))
+    assert LpStatus[model.status] == "Optimal"
+    return value(model.objective), time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'bars':>6} {'pruned':>7} {'daily':>6} {'full ms':>8} {'pruned ms':>10} {'daily ms':>9} "
+          f"{'pruned diff':>12} {'daily gap':>10}")
+    speedups = []
+    for _ in range(args.instances):
+        df, limits = random_instance(rng)
+        total, monthly, weekly, min_invest, _ = limits
+        date_index = pd.DatetimeIndex(df['Date'])
+        month_codes = pd.factorize(date_index.to_period('M'))[0]
+        week_codes  = pd.factorize(date_index.to_period('W'))[0]
+        opens = df['Open'].to_numpy(dtype=float)
+        presolve_args = (df['Date'].values, opens, month_codes, week_codes, total, monthly, weekly, min_invest)
+
+        full_obj, full_s = solve_subset(df, np.arange(len(df)), limits)
+        keep, _ = presolve_bars(*presolve_args)
+        pruned_obj, pruned_s = solve_subset(df, keep, limits)
+        daily_keep, _ = presolve_bars(*presolve_args, coarsen=True)
+        daily_obj, daily_s = solve_subset(df, daily_keep, limits)
+        _, info = solve_dca_greedy(opens, month_codes, week_codes, *limits)
+
+        assert abs(pruned_obj - full_obj) <= SOLVER_GAP_REL * full_obj, "dominance pruning changed the optimum"
+        daily_gap = (info['upper_bound'] - daily_obj) / info['upper_bound']
+        speedups.append(full_s / pruned_s)
+        print(f"{len(df):>6} {len(keep):>7} {len(daily_keep):>6} {full_s * 1000:>8.1f} {pruned_s * 1000:>10.1f} "
+              f"{daily_s * 1000:>9.1f} {(full_obj - pruned_obj) / full_obj:>+12.1e} {daily_gap:>10.1e}")
+
+    print(f"\nmedian speedup from dominance pruning: {np.median(speedups):.1f}x (optimum unchanged on all instances)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+suite.py
+Time every pipeline stage on synthetic data, offline, and write the results
+as JSON so runs on different commits can be compared.
+
+Stages (each timed separately, prices injected through a ScenarioContext):
+  blind_dca     simulate_blind_dca
+  ilp_build     define_ilp_model
+  optimize      solve_asset_optimization
+  analytics     compute_analytics
+  plot          plot_scenario (optimized plan)
+  excel_export  optimized and blind plans to .xlsx
+
+    python -m benchmarks.suite --intervals 1d 4h 1h --years 1 5 10
+    python -m benchmarks.suite --years 1 --compare benchmarks/results/<commit>.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from scenario_context import ScenarioContext
+from blind_dca import simulate_blind_dca
+from optimization_model import define_ilp_model
+from solver import solve_asset_optimization, SOLVER_BACKEND
+from analytics import compute_analytics
+from visualization import plot_scenario
+from benchmarks.synthetic import synthetic_ohlc_frame, INTERVALS
+
+START_DATE = "2014-01-01"
+LIMITS = dict(total_investment=50000.0, monthly_limit=700.0, weekly_limit=250.0,
+              min_invest=60.0, per_buy_max=100.0)
+BLIND_FREQUENCY_DAYS = 7
+STAGES = ('blind_dca', 'ilp_build', 'optimize', 'analytics', 'plot', 'excel_export')
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+        return out.stdout.strip(), dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def _timed(func, repeat):
+    runs, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - t0)
+    return runs, result
+
+def run_case(interval, years, seed, repeat, backend, out_dir):
+    """Time every stage on one synthetic series; returns a list of result dicts."""
+    df = synthetic_ohlc_frame(START_DATE, years, interval, seed)
+    end_date = df['Date'].iloc[-1].strftime("%Y-%m-%d")
+    ctx = ScenarioContext('crypto', df, START_DATE, end_date, symbol='SYNUSDT', interval=interval)
+    common = dict(start_date=START_DATE, end_date=end_date, symbol='SYNUSDT', context=ctx)
+
+    timings = {}
+    timings['blind_dca'], (blind_df, _) = _timed(lambda: simulate_blind_dca(
+        'crypto', LIMITS['total_investment'], frequency_days=BLIND_FREQUENCY_DAYS, **common), repeat)
+    timings['ilp_build'], _ = _timed(lambda: define_ilp_model(
+        df, *LIMITS.values(), 0.1, ctx), repeat)
+    timings['optimize'], opt = _timed(lambda: solve_asset_optimization(
+        'crypto', **LIMITS, backend=backend, **common), repeat)
+    opt_df = opt[0]
+    timings['analytics'], _ = _timed(lambda: compute_analytics(frequency=interval, context=ctx), repeat)
+    png = os.path.join(out_dir, "optimized.png")
+    timings['plot'], _ = _timed(lambda: plot_scenario('SYNUSDT', "Optimized", opt_df, None, png, context=ctx), repeat)
+    timings['excel_export'], _ = _timed(lambda: (opt_df.to_excel(os.path.join(out_dir, "optimized.xlsx"), index=False),
+                                                 blind_df.to_excel(os.path.join(out_dir, "blind.xlsx"), index=False)),
+                                        repeat)
+
+    return [{
+        'stage': stage,
+        'interval': interval,
+        'years': years,
+        'bars': len(df),
+        'median_s': float(np.median(timings[stage])),
+        'min_s': float(np.min(timings[stage])),
+        'runs_s': timings[stage]
+    } for stage in STAGES]
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r['stage'], r['interval'], r['years']): r['median_s'] for r in baseline['results']}
+    print(f"\nvs {baseline_path} (commit {baseline['meta'].get('commit')})")
+    print(f"{'stage':>13} {'interval':>8} {'years':>5} {'old s':>9} {'new s':>9} {'ratio':>7}")
+    matched = [r for r in results if (r['stage'], r['interval'], r['years']) in old]
+    if not matched:
+        print("no common cases")
+    for r in matched:
+        before = old[(r['stage'], r['interval'], r['years'])]
+        print(f"{r['stage']:>13} {r['interval']:>8} {r['years']:>5g} {before:>9.3f} {r['median_s']:>9.3f} "
+              f"{r['median_s'] / before if before > 0 else float('nan'):>7.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--intervals', nargs='+', default=['1d', '4h', '1h'], choices=sorted(INTERVALS))
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', default=SOLVER_BACKEND)
+    parser.add_argument('--output', help="JSON file (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier JSON output to compare against")
+    args = parser.parse_args()
+    if any(not 1 <= y <= 10 for y in args.years):
+        parser.error("--years must be between 1 and 10")
+
+    commit, dirty = _git_commit()
+    output = args.output or os.path.join("benchmarks", "results", f"{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    results = []
+    print(f"{'stage':>13} {'interval':>8} {'years':>5} {'bars':>7} {'median s':>9} {'min s':>9}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for interval in args.intervals:
+            for years in args.years:
+                for r in run_case(interval, years, args.seed, args.repeat, args.backend, out_dir):
+                    results.append(r)
+                    print(f"{r['stage']:>13} {interval:>8} {years:>5g} {r['bars']:>7} "
+                          f"{r['median_s']:>9.3f} {r['min_s']:>9.3f}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit,
+            'dirty': dirty,
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
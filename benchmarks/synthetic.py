@@ -0,0 +1,41 @@
+"""
+synthetic.py
+Seeded synthetic OHLC series for the benchmarks, in the frame layout the
+data layer returns ([Date, Open, High, Low, Close, Return]), so every stage
+can be timed on injected data without Postgres, Binance or Navasan.
+"""
+
+import numpy as np
+import pandas as pd
+
+# bars per day of every supported interval
+INTERVALS = {'1h': 24, '4h': 6, '1d': 1}
+BAR_VOLATILITY_4H = 0.01
+
+def synthetic_ohlc_frame(start_date, years, interval='4h', seed=42, start_price=20000.0):
+    """
+    Geometric random walk with the same daily volatility at every interval
+    (BAR_VOLATILITY_4H per 4h bar). Each bar opens at the previous close.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval '{interval}', expected one of {sorted(INTERVALS)}.")
+    bars_per_day = INTERVALS[interval]
+    rng = np.random.default_rng(seed)
+    n = int(years * 365 * bars_per_day)
+    dates = pd.date_range(start=start_date, periods=n, freq=interval if interval != '1d' else 'D')
+    sigma = BAR_VOLATILITY_4H * np.sqrt(6 / bars_per_day)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, sigma, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    df = pd.DataFrame({
+        'Date': dates,
+        'Open': open_,
+        'High': np.maximum(open_, close) * 1.002,
+        'Low':  np.minimum(open_, close) * 0.998,
+        'Close': close,
+    })
+    df['Return'] = df['Close'].pct_change()
+    return df
+
+def synthetic_4h_frame(start_date, years, seed=42):
+    """Random-walk 4h bars [Date, Open, High, Low, Close, Return]."""
+    return synthetic_ohlc_frame(start_date, years, '4h', seed)
@@ -1,97 +1,313 @@
 # binance_data.py
+"""
+binance_data.py
+Downloads Binance klines into crypto_ohlc.
+
+A range is split into windows of BINANCE_PAGE_LIMIT candles that are fetched
+concurrently over one keep-alive session. Every response reports the
+request weight used in the current minute (X-MBX-USED-WEIGHT-1M); once it
+passes BINANCE_WEIGHT_SOFT_LIMIT new requests wait for the next minute, and
+429/418 answers are retried after Retry-After. Other failures back off
+exponentially, up to BINANCE_MAX_RETRIES attempts per window. Pages are
+decoded straight into column arrays.
+
+Every interval of BINANCE_INTERVALS has its own bars and coverage in
+crypto_ohlc. A gap of a coarser interval whose bars are all covered by
+finer cached bars is resampled from them instead of downloaded. Long gaps
+are downloaded and stored BINANCE_CHUNK_WINDOWS windows at a time, so 1m
+ranges never sit in memory whole.
+"""
+
 import requests
 import logging
 import time
-from datetime import datetime
-from cache_manager import get_missing_date_ranges, insert_ohlc_data
-from database_manager import init_db
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from cache_manager import (get_missing_date_ranges, insert_ohlc_data, record_coverage, interval_step,
+                           coverage_gaps, materialize_resampled)
+from database_manager import init_db, OHLC_TABLE_INTERVALS
+from metrics import timer, count, register_gauges
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 BINANCE_API_URL = "https://api.binance.com/api/v3/klines"
-INTERVAL = "4h"  # or "1d"
+INTERVAL = OHLC_TABLE_INTERVALS["crypto_ohlc"]  # default interval
+BINANCE_INTERVALS = ('1m', '15m', '1h', '4h', '1d')  # each divides the next, all epoch-aligned
+BINANCE_PAGE_LIMIT = 1000
+BINANCE_MAX_WORKERS = 4
+BINANCE_CHUNK_WINDOWS = 50  # windows downloaded and stored per batch (50k bars)
+BINANCE_WEIGHT_LIMIT = 6000       # request weight per minute allowed by Binance
+BINANCE_WEIGHT_SOFT_LIMIT = int(0.8 * BINANCE_WEIGHT_LIMIT)  # hold new requests above this until the minute rolls over
+BINANCE_MAX_RETRIES = 5
+BINANCE_BACKOFF_BASE = 1.0
+BINANCE_BACKOFF_MAX = 30.0
+BINANCE_TIMEOUT = (5, 30)  # connect, read seconds
+
+KLINE_COLUMNS = ('open_time', 'open', 'high', 'low', 'close')
 
 def date_to_millis(date_str):
-    dt = datetime.strptime(date_str, "%Y-%m-%d")
-    return int(dt.timestamp() * 1000)
+    return datetime_to_millis(datetime.strptime(date_str, "%Y-%m-%d"))
+
+def datetime_to_millis(dt):
+    """Naive UTC datetime -> epoch milliseconds."""
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def millis_to_datetime(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+def interval_to_millis(interval):
+    """'4h' -> 14400000."""
+    return int(interval_step(interval).total_seconds() * 1000)
+
+class WeightThrottle:
+    """Tracks the used weight Binance reports and holds requests back near the limit."""
+
+    def __init__(self, soft_limit=BINANCE_WEIGHT_SOFT_LIMIT):
+        self.soft_limit = soft_limit
+        self.used_weight = 0
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                if self.blocked_until <= now and self.used_weight >= self.soft_limit:
+                    # The used weight resets on the minute boundary
+                    self.blocked_until = (now // 60 + 1) * 60 + 0.5
+                    logger.info(f"Binance used weight {self.used_weight} >= {self.soft_limit}, "
+                                f"pausing {self.blocked_until - now:.1f}s.")
+                    self.used_weight = 0
+                delay = self.blocked_until - now
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def update(self, headers):
+        used = headers.get('X-MBX-USED-WEIGHT-1M')
+        if used is not None:
+            with self._lock:
+                self.used_weight = int(used)
+
+    def block_for(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+throttle = WeightThrottle()
+register_gauges(lambda: [('dca_binance_used_weight', "Last request weight used per minute reported by Binance.",
+                          throttle.used_weight, {})])
+
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BINANCE_MAX_WORKERS)
+            _session.mount("https://", adapter)
+        return _session
+
+def _decode_klines(data):
+    """Binance kline rows -> {column: array} for KLINE_COLUMNS."""
+    if not data:
+        return {c: np.empty(0, dtype=np.int64 if c == 'open_time' else float) for c in KLINE_COLUMNS}
+    cols = list(zip(*data))
+    klines = {'open_time': np.fromiter(cols[0], dtype=np.int64, count=len(data))}
+    for i, c in enumerate(KLINE_COLUMNS[1:], start=1):
+        klines[c] = np.array(cols[i], dtype=float)
+    return klines
+
+def _fetch_page(symbol_pair, interval, start_ts, end_ts):
+    """One klines request with throttling and retries; returns the decoded page."""
+    params = {
+        "symbol": symbol_pair,
+        "interval": interval,
+        "startTime": start_ts,
+        "endTime": end_ts,
+        "limit": BINANCE_PAGE_LIMIT
+    }
+    session = _get_session()
+    for attempt in range(1, BINANCE_MAX_RETRIES + 1):
+        throttle.wait()
+        try:
+            with timer('dca_external_request_seconds', service='binance'):
+                resp = session.get(BINANCE_API_URL, params=params, timeout=BINANCE_TIMEOUT)
+            count('dca_external_requests_total', service='binance', outcome=str(resp.status_code))
+            throttle.update(resp.headers)
+            if resp.status_code in (418, 429):
+                retry_after = float(resp.headers.get('Retry-After', 60))
+                throttle.block_for(retry_after)
+                logger.warning(f"Binance rate limit ({resp.status_code}) for {symbol_pair}, "
+                               f"retrying after {retry_after:.0f}s.")
+                continue
+            resp.raise_for_status()
+            return _decode_klines(resp.json())
+        except Exception as e:
+            if not isinstance(e, requests.HTTPError):  # HTTP errors are counted by status above
+                count('dca_external_requests_total', service='binance', outcome='error')
+            if attempt == BINANCE_MAX_RETRIES:
+                raise
+            delay = min(BINANCE_BACKOFF_MAX, BINANCE_BACKOFF_BASE * 2 ** (attempt - 1))
+            logger.warning(f"Error fetching Binance klines for {symbol_pair} (attempt {attempt}), "
+                           f"retrying in {delay:.0f}s: {e}")
+            time.sleep(delay)
+    raise RuntimeError(f"Binance kept rate limiting {symbol_pair} after {BINANCE_MAX_RETRIES} attempts.")
 
-def download_binance_klines(symbol_pair, interval, start_ts, end_ts):
+def _fetch_window(symbol_pair, interval, start_ts, end_ts):
+    """All klines of [start_ts, end_ts]; normally a single page."""
+    pages = []
+    cur_ts = start_ts
+    while cur_ts <= end_ts:
+        page = _fetch_page(symbol_pair, interval, cur_ts, end_ts)
+        if not len(page['open_time']):
+            break
+        pages.append(page)
+        cur_ts = int(page['open_time'][-1]) + interval_to_millis(interval)
+        if len(page['open_time']) < BINANCE_PAGE_LIMIT:
+            break
+    return pages
+
+def download_binance_klines(symbol_pair, interval, start_ts, end_ts, max_workers=BINANCE_MAX_WORKERS):
     """
-    Download klines from Binance in the given TS range. Returns raw klines array.
+    Download klines opening in [start_ts, end_ts] from Binance. Returns
+    ({column: array} for KLINE_COLUMNS sorted by open_time, [(start_ts, end_ts)]
+    of the windows fetched completely). Windows that still fail after
+    BINANCE_MAX_RETRIES are logged and left out.
     """
-    all_klines = []
-    limit = 1000
-    cur_ts = start_ts
-    while cur_ts < end_ts:
-        params = {
-            "symbol": symbol_pair,
-            "interval": interval,
-            "startTime": cur_ts,
-            "endTime": end_ts,
-            "limit": limit
-        }
+    step_ms = interval_to_millis(interval)
+    window_ms = BINANCE_PAGE_LIMIT * step_ms
+    windows = [(ts, min(ts + window_ms - step_ms, end_ts)) for ts in range(start_ts, end_ts + 1, window_ms)]
+    logger.debug(f"Fetching {symbol_pair} {interval} klines in {len(windows)} windows.")
+
+    def fetch(window):
         try:
-            resp = requests.get(BINANCE_API_URL, params=params)
-            resp.raise_for_status()
-            data = resp.json()
-            if not data:
-                break
-            all_klines.extend(data)
-            last_close_time = data[-1][6]
-            cur_ts = last_close_time + 1
-            time.sleep(0.4)  # rate limit
+            return _fetch_window(symbol_pair, interval, *window)
         except Exception as e:
-            logger.error(f"Error fetching Binance klines for {symbol_pair}: {e}", exc_info=True)
-            time.sleep(2)
-    return all_klines
+            logger.error(f"Giving up on Binance klines for {symbol_pair} "
+                         f"{window[0]}..{window[1]}: {e}", exc_info=True)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as pool:
+        results = list(pool.map(fetch, windows))
+    fetched = [w for w, pages in zip(windows, results) if pages is not None]
+    pages = [page for window_pages in results if window_pages for page in window_pages]
+
+    if not pages:
+        return _decode_klines([]), fetched
+    klines = {c: np.concatenate([p[c] for p in pages]) for c in KLINE_COLUMNS}
+    _, first = np.unique(klines['open_time'], return_index=True)
+    return {c: v[first] for c, v in klines.items()}, fetched
+
+def _contiguous(windows, step_ms):
+    """Merge adjacent (start_ts, end_ts) windows into runs."""
+    runs = []
+    for start, end in windows:
+        if runs and start - runs[-1][1] <= step_ms:
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([start, end])
+    return runs
 
 def binance_klines_to_ohlc(klines, symbol_pair):
-    from datetime import datetime
-    results = []
-    for k in klines:
-        open_time_ms = k[0]
-        open_price   = float(k[1])
-        high_price   = float(k[2])
-        low_price    = float(k[3])
-        close_price  = float(k[4])
-
-        dt_str = datetime.utcfromtimestamp(open_time_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
-
-        results.append({
-            'symbol': symbol_pair,
-            'date': dt_str,
-            'open': open_price,
-            'high': high_price,
-            'low':  low_price,
-            'close':close_price
-        })
-    return results
-
-def download_binance_data(symbol_pair, start_date, end_date):
-    logger.info(f"=== Downloading {symbol_pair} data for {start_date} to {end_date} ===")
+    """Decoded klines -> crypto_ohlc columns for insert_ohlc_data."""
+    return pd.DataFrame({
+        'symbol': symbol_pair,
+        'date': pd.to_datetime(klines['open_time'], unit='ms'),
+        'open': klines['open'],
+        'high': klines['high'],
+        'low': klines['low'],
+        'close': klines['close']
+    })
+
+def _floor_bar(t, step):
+    return t - (t - datetime(1970, 1, 1)) % step
+
+def _covered_bars(symbol_pair, interval, source, first, last):
+    """Runs of `interval` bars in [first, last] whose `source` bars are all covered."""
+    step, source_step = interval_step(interval), interval_step(source)
+    source_last = last + step - source_step
+    runs, cursor = [], first
+    gaps = coverage_gaps("crypto_ohlc", first, source_last, symbol=symbol_pair, interval=source)
+    for gap_start, gap_end in gaps + [(source_last + source_step, None)]:
+        if gap_start > cursor:
+            run_first = _floor_bar(cursor + step - source_step, step)  # first bar opening at or after cursor
+            run_last = _floor_bar(gap_start, step) - step
+            if run_first <= run_last:
+                runs.append((run_first, run_last))
+        if gap_end is not None:
+            cursor = gap_end + source_step
+    return runs
+
+def _resample_from_finer(symbol_pair, interval, first, last):
+    """
+    Build the `interval` bars of [first, last] that finer cached intervals
+    cover (coarsest source first); returns the [(first, last)] runs still
+    missing.
+    """
+    step = interval_step(interval)
+    missing = [(first, last)]
+    for source in sorted((i for i in BINANCE_INTERVALS if interval_step(i) < step),
+                         key=interval_step, reverse=True):
+        remaining = []
+        for gap_first, gap_last in missing:
+            cursor = gap_first
+            for run_first, run_last in _covered_bars(symbol_pair, interval, source, gap_first, gap_last):
+                materialize_resampled("crypto_ohlc", run_first, run_last, source, interval, symbol=symbol_pair)
+                if run_first > cursor:
+                    remaining.append((cursor, run_first - step))
+                cursor = run_last + step
+            if cursor <= gap_last:
+                remaining.append((cursor, gap_last))
+        missing = remaining
+    return missing
+
+def _download_range(symbol_pair, interval, first, last):
+    """Download, store and mark as covered the bars [first, last], one batch of windows at a time."""
+    step_ms = interval_to_millis(interval)
+    chunk_ms = BINANCE_CHUNK_WINDOWS * BINANCE_PAGE_LIMIT * step_ms
+    start_ts, end_ts = datetime_to_millis(first), datetime_to_millis(last)
+    for chunk_start in range(start_ts, end_ts + 1, chunk_ms):
+        chunk_end = min(chunk_start + chunk_ms - step_ms, end_ts)
+        klines, fetched = download_binance_klines(symbol_pair, interval, chunk_start, chunk_end)
+        if len(klines['open_time']):
+            ohlc = binance_klines_to_ohlc(klines, symbol_pair)
+            insert_ohlc_data("crypto_ohlc", ohlc, interval=interval)
+        else:
+            logger.warning(f"No klines fetched from Binance for {symbol_pair} {interval} in range "
+                           f"{millis_to_datetime(chunk_start)}..{millis_to_datetime(chunk_end)}")
+        # Bars Binance has no data for (before listing, outages) are covered too
+        for run_start, run_end in _contiguous(fetched, step_ms):
+            record_coverage("crypto_ohlc", millis_to_datetime(run_start), millis_to_datetime(run_end),
+                            symbol=symbol_pair, interval=interval)
+
+def download_binance_data(symbol_pair, start_date, end_date, interval=INTERVAL):
+    if interval not in BINANCE_INTERVALS:
+        raise ValueError(f"Unsupported interval {interval!r}; use one of {', '.join(BINANCE_INTERVALS)}.")
+    logger.info(f"=== Downloading {symbol_pair} {interval} data for {start_date} to {end_date} ===")
     init_db()  # ensure tables exist
 
     try:
-        missing_ranges = get_missing_date_ranges("crypto_ohlc", start_date, end_date, symbol=symbol_pair)
+        missing_ranges = get_missing_date_ranges("crypto_ohlc", start_date, end_date,
+                                                 symbol=symbol_pair, interval=interval)
     except ValueError as e:
         logger.error(f"Error checking missing range for {symbol_pair}: {e}", exc_info=True)
         # fallback
         logger.info(f"Forcing a full download for {symbol_pair}.")
-        missing_ranges = [(start_date, end_date)]
+        missing_ranges = [(datetime.strptime(start_date, "%Y-%m-%d"), datetime.strptime(end_date, "%Y-%m-%d"))]
 
     if not missing_ranges:
         logger.info(f"{symbol_pair} data fully cached for that range. No download needed.")
         return
 
-    for (m_start, m_end) in missing_ranges:
-        logger.info(f"Downloading missing range: {m_start} to {m_end} for {symbol_pair}")
-        start_ts = date_to_millis(m_start)
-        end_ts   = date_to_millis(m_end)
-        klines   = download_binance_klines(symbol_pair, INTERVAL, start_ts, end_ts)
-        if klines:
-            ohlc = binance_klines_to_ohlc(klines, symbol_pair)
-            insert_ohlc_data("crypto_ohlc", ohlc)
-        else:
-            logger.warning(f"No klines fetched from Binance for {symbol_pair} in range {m_start}..{m_end}")
+    for (gap_start, gap_end) in missing_ranges:
+        for (m_start, m_end) in _resample_from_finer(symbol_pair, interval, gap_start, gap_end):
+            logger.info(f"Downloading missing range: {m_start} to {m_end} for {symbol_pair}")
+            _download_range(symbol_pair, interval, m_start, m_end)
     logger.info(f"=== Finished {symbol_pair} data updates ===")
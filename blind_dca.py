@@ -6,65 +6,62 @@ or "gold" if we want to do gold.
 """
 
 import logging
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
 from data_preprocessing import get_crypto_data, get_gold_data
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def simulate_blind_dca(asset_type, total_investment, start_date, end_date, frequency_days, symbol=None):
+def build_schedule(start_date, end_date, frequency_days):
     """
-    asset_type: "crypto" or "gold"
-    symbol: if asset_type="crypto", specify e.g. "BTCUSDT"
-    We fetch the relevant data, do blind DCA, return plan_df, summary.
+    Every `frequency_days` days from start_date up to and including end_date,
+    as a datetime64[ns] array.
     """
-    logger.info(f"simulate_blind_dca({asset_type}), freq={frequency_days} days, symbol={symbol}")
-    if asset_type == "crypto":
-        if not symbol:
-            raise ValueError("Must provide 'symbol' for crypto DCA.")
-        df = get_crypto_data(symbol, start_date, end_date)
-    else:
-        df = get_gold_data(start_date, end_date)
+    start = np.datetime64(start_date, 'D')
+    end   = np.datetime64(end_date, 'D')
+    schedule = np.arange(start, end + np.timedelta64(1, 'D'), np.timedelta64(int(frequency_days), 'D'))
+    return schedule.astype('datetime64[ns]')
+
+def map_schedule_to_bars(bar_dates, schedule):
+    """
+    For each scheduled date, the index of the first bar on or after it.
+    Dates past the last bar fall back to the last bar.
+    bar_dates must be sorted ascending.
+    """
+    idx = np.searchsorted(bar_dates, schedule, side='left')
+    return np.minimum(idx, len(bar_dates) - 1)
 
+def run_blind_dca(df, asset_type, total_investment, start_date, end_date, frequency_days, symbol=None):
+    """
+    Blind DCA on an already loaded [Date, Open, Close] frame (sorted by Date).
+    Every schedule date is mapped to its bar in one searchsorted pass.
+    Returns plan_df, summary.
+    """
     if df.empty:
         raise Exception(f"No data for {asset_type} in range. Cannot do DCA.")
-    
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    end_dt   = datetime.strptime(end_date,   "%Y-%m-%d")
-    schedule_dates = []
-    current_date = start_dt
-    while current_date <= end_dt:
-        schedule_dates.append(current_date)
-        current_date += timedelta(days=frequency_days)
-
-    n_investments = len(schedule_dates)
+
+    schedule = build_schedule(start_date, end_date, frequency_days)
+    n_investments = len(schedule)
     if n_investments == 0:
         raise Exception("No DCA investment dates generated. Check date range/frequency.")
 
+    bar_dates = df['Date'].values
+    opens     = df['Open'].to_numpy(dtype=float)
+    idx = map_schedule_to_bars(bar_dates, schedule)
+
     amount_per_invest = total_investment / n_investments
-    plan = []
-    for sch_date in schedule_dates:
-        row_candidate = df[df['Date'] >= sch_date]
-        if row_candidate.empty:
-            row = df.iloc[-1]
-        else:
-            row = row_candidate.iloc[0]
-        buy_date = row['Date']
-        buy_price = row['Open']
-        coins = 0.0
-        if buy_price > 0:
-            coins = amount_per_invest / buy_price
-
-        plan.append({
-            "Date": buy_date,
-            "Investment (USDT)": amount_per_invest,
-            "Buy Price (USDT)": buy_price,
-            "Coins Purchased": coins,
-            "Frequency": frequency_days
-        })
-
-    plan_df = pd.DataFrame(plan)
+    buy_prices = opens[idx]
+    coins = np.zeros(n_investments)
+    np.divide(amount_per_invest, buy_prices, out=coins, where=buy_prices > 0)
+
+    plan_df = pd.DataFrame({
+        "Date": df['Date'].iloc[idx].reset_index(drop=True),
+        "Investment (USDT)": np.full(n_investments, amount_per_invest),
+        "Buy Price (USDT)": buy_prices,
+        "Coins Purchased": coins,
+        "Frequency": frequency_days
+    })
     total_coins = plan_df['Coins Purchased'].sum()
     final_price = df['Close'].iloc[-1]
     portfolio_value = total_coins * final_price
@@ -83,3 +80,92 @@ def simulate_blind_dca(asset_type, total_investment, start_date, end_date, frequ
     }
     logger.info(f"Blind DCA {asset_type} => profit={profit:.2f}, port_value={portfolio_value:.2f}")
     return plan_df, summary
+
+def run_blind_dca_sweep(df, asset_type, total_investment, start_date, end_date, frequencies, symbol=None):
+    """
+    Evaluate blind DCA for many frequencies at once on a loaded frame.
+    Row f of the schedule matrix holds start + k*freq[f] days, padded past
+    its own end date; all cells are mapped to bars in one searchsorted call.
+    Returns a DataFrame with one row per frequency.
+    """
+    if df.empty:
+        raise Exception(f"No data for {asset_type} in range. Cannot do DCA.")
+
+    freqs = np.asarray(list(frequencies), dtype=np.int64)
+    if freqs.size == 0 or (freqs <= 0).any():
+        raise ValueError("Frequencies must be a non-empty list of positive day counts.")
+
+    start = np.datetime64(start_date, 'D')
+    end   = np.datetime64(end_date, 'D')
+    n_days = int((end - start) / np.timedelta64(1, 'D'))
+    if n_days < 0:
+        raise Exception("No DCA investment dates generated. Check date range/frequency.")
+
+    n_investments = n_days // freqs + 1
+    steps = np.arange(n_investments.max())
+    offsets = freqs[:, None] * steps[None, :]
+    valid = steps[None, :] < n_investments[:, None]
+
+    schedule = (start + offsets.astype('timedelta64[D]')).astype('datetime64[ns]')
+    bar_dates = df['Date'].values
+    opens     = df['Open'].to_numpy(dtype=float)
+    idx = map_schedule_to_bars(bar_dates, schedule.ravel()).reshape(schedule.shape)
+    buy_prices = opens[idx]
+
+    amount_per_invest = total_investment / n_investments
+    coins = np.zeros(buy_prices.shape)
+    np.divide(amount_per_invest[:, None], buy_prices, out=coins, where=valid & (buy_prices > 0))
+    total_coins = coins.sum(axis=1)
+
+    final_price = df['Close'].iloc[-1]
+    portfolio_value = total_coins * final_price
+    result = pd.DataFrame({
+        "asset": asset_type,
+        "symbol": symbol,
+        "frequency_days": freqs,
+        "n_investments": n_investments,
+        "total_invested": float(total_investment),
+        "total_coins": total_coins,
+        "final_price": final_price,
+        "portfolio_value": portfolio_value,
+        "profit": portfolio_value - total_investment
+    })
+    logger.info(f"Blind DCA sweep {asset_type}: {len(freqs)} frequencies, best={result.loc[result['profit'].idxmax(), 'frequency_days']}d")
+    return result
+
+def sweep_blind_dca(asset_type, total_investment, start_date, end_date, frequencies, symbol=None, context=None):
+    """
+    Load the price series once and evaluate every frequency in `frequencies`
+    (e.g. range(1, 91)). Returns one row per frequency with invested,
+    coins, value and profit.
+    """
+    logger.info(f"sweep_blind_dca({asset_type}), symbol={symbol}")
+    if context is not None:
+        df = context.frame
+    elif asset_type == "crypto":
+        if not symbol:
+            raise ValueError("Must provide 'symbol' for crypto DCA.")
+        df = get_crypto_data(symbol, start_date, end_date)
+    else:
+        df = get_gold_data(start_date, end_date)
+
+    return run_blind_dca_sweep(df, asset_type, total_investment, start_date, end_date, frequencies, symbol)
+
+def simulate_blind_dca(asset_type, total_investment, start_date, end_date, frequency_days, symbol=None, context=None):
+    """
+    asset_type: "crypto" or "gold"
+    symbol: if asset_type="crypto", specify e.g. "BTCUSDT"
+    context: optional ScenarioContext; if given no data is fetched
+    We fetch the relevant data, do blind DCA, return plan_df, summary.
+    """
+    logger.info(f"simulate_blind_dca({asset_type}), freq={frequency_days} days, symbol={symbol}")
+    if context is not None:
+        df = context.frame
+    elif asset_type == "crypto":
+        if not symbol:
+            raise ValueError("Must provide 'symbol' for crypto DCA.")
+        df = get_crypto_data(symbol, start_date, end_date)
+    else:
+        df = get_gold_data(start_date, end_date)
+
+    return run_blind_dca(df, asset_type, total_investment, start_date, end_date, frequency_days, symbol)
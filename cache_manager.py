@@ -2,205 +2,615 @@
 """
 cache_manager.py
 Contains utility functions for:
-  - Determining missing date ranges (symbol-based for crypto_ohlc)
-  - Inserting OHLC data (using PostgreSQL ON CONFLICT)
-  - Fetching cached data
+  - Determining missing bar ranges from the coverage manifest (ohlc_coverage)
+  - Inserting OHLC data (COPY into a staging table, then ON CONFLICT upsert)
+  - Fetching cached data (binary COPY decoded straight into NumPy columns),
+    whole or in time chunks
+  - Resampling cached bars to a coarser interval (materialized in the table)
+  - Refreshing the derived tables (usd_ffill_ohlc, gold_usd_ohlc) over the
+    bars their sources changed
+  - Notifying in-process caches when OHLC rows change
 """
 
+import io
 import logging
 import datetime
-from database_manager import get_connection, put_connection, init_db
+import numpy as np
+import pandas as pd
+from database_manager import (get_connection, put_connection, init_db, OHLC_TABLE_INTERVALS, INTERVAL_UNITS,
+                              DERIVED_OHLC_SOURCES)
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def insert_ohlc_data(table_name, ohlc_data):
-    """
-    Insert or upsert multiple rows into:
-      - crypto_ohlc (symbol, date, open, high, low, close)
-      - gold_ohlc   (date, open, high, low, close)
-      - usd_ohlc    (date, open, high, low, close)
+OHLC_COLUMNS = ('open', 'high', 'low', 'close')
+OHLC_TABLE_KEYS = {
+    "crypto_ohlc": ('symbol', 'interval', 'bar_time'),
+    "gold_ohlc": ('interval', 'bar_time'),
+    "usd_ohlc": ('interval', 'bar_time'),
+    "usd_ffill_ohlc": ('interval', 'bar_time'),
+    "gold_usd_ohlc": ('interval', 'bar_time'),
+}
+# Decimals of the converted gold_usd_ohlc prices
+GOLD_USD_DECIMALS = 4
+# Bars per chunk of iter_ohlc_columns (rounded to whole days)
+OHLC_CHUNK_BARS = 200000
+# Date strings passed to the insert listeners (compared with 'YYYY-MM-DD' ranges)
+OHLC_DATE_FORMATS = {
+    "crypto_ohlc": "%Y-%m-%d %H:%M:%S",
+    "gold_ohlc": "%Y-%m-%d",
+    "usd_ohlc": "%Y-%m-%d",
+    "usd_ffill_ohlc": "%Y-%m-%d",
+    "gold_usd_ohlc": "%Y-%m-%d",
+}
+
+_insert_listeners = []
 
-    Using PostgreSQL "ON CONFLICT DO UPDATE" to mimic "INSERT OR REPLACE".
+def add_insert_listener(callback):
     """
-    try:
-        if not ohlc_data:
-            logger.warning(f"No data to insert into {table_name}. Skipping.")
-            return
+    Register `callback(table_name, symbols, min_date, max_date, interval)` to
+    be called after insert_ohlc_data (or a derived table refresh) changed
+    rows. `symbols` is a set for crypto_ohlc and None for the symbol-less
+    tables; [min_date, max_date] spans the changed bars.
+    """
+    _insert_listeners.append(callback)
 
-        conn = get_connection()
-        cur = conn.cursor()
+def _notify_insert(table_name, symbols, first, last, interval):
+    fmt = OHLC_DATE_FORMATS[table_name]
+    for callback in _insert_listeners:
+        try:
+            callback(table_name, symbols, first.strftime(fmt), last.strftime(fmt), interval)
+        except Exception as e:
+            logger.error(f"Insert listener failed for {table_name}: {e}", exc_info=True)
 
-        if table_name == "crypto_ohlc":
-            # Upsert by (symbol,date)
-            sql = f"""
-            INSERT INTO {table_name} (symbol, date, open, high, low, close)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (symbol, date)
-            DO UPDATE SET
-                open  = EXCLUDED.open,
-                high  = EXCLUDED.high,
-                low   = EXCLUDED.low,
-                close = EXCLUDED.close
-            """
-
-            rows_to_insert = []
-            for row in ohlc_data:
-                rows_to_insert.append((
-                    row.get('symbol', ''),
-                    row.get('date', ''),
-                    row.get('open', 0.0),
-                    row.get('high', 0.0),
-                    row.get('low',  0.0),
-                    row.get('close',0.0)
-                ))
-            cur.executemany(sql, rows_to_insert)
-            logger.info(f"Upserted {len(rows_to_insert)} records into {table_name}.")
+def interval_step(interval):
+    """'4h' -> timedelta(hours=4)."""
+    return datetime.timedelta(**{INTERVAL_UNITS[interval[-1]]: int(interval[:-1])})
 
-        else:
-            # gold_ohlc or usd_ohlc, upsert by (date)
-            sql = f"""
-            INSERT INTO {table_name} (date, open, high, low, close)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (date)
-            DO UPDATE SET
-                open  = EXCLUDED.open,
-                high  = EXCLUDED.high,
-                low   = EXCLUDED.low,
-                close = EXCLUDED.close
-            """
-
-            rows_to_insert = []
-            for row in ohlc_data:
-                rows_to_insert.append((
-                    row.get('date', ''),
-                    row.get('open', 0.0),
-                    row.get('high', 0.0),
-                    row.get('low',  0.0),
-                    row.get('close',0.0)
-                ))
-            cur.executemany(sql, rows_to_insert)
-            logger.info(f"Upserted {len(rows_to_insert)} records into {table_name}.")
+def _coverage_key(table_name, symbol, interval):
+    return table_name, symbol if table_name == "crypto_ohlc" else '', interval or OHLC_TABLE_INTERVALS[table_name]
+
+def _merge_coverage(cur, table_name, symbol, interval, start, end):
+    """Merge [start, end] with every overlapping or adjacent run of the manifest."""
+    step = interval_step(interval)
+    cur.execute('''
+        WITH merged AS (
+            DELETE FROM ohlc_coverage
+            WHERE table_name=%s AND symbol=%s AND interval=%s
+              AND start_at <= %s AND end_at >= %s
+            RETURNING start_at, end_at
+        )
+        INSERT INTO ohlc_coverage (table_name, symbol, interval, start_at, end_at)
+        SELECT %s, %s, %s, LEAST(%s, MIN(start_at)), GREATEST(%s, MAX(end_at)) FROM merged
+        ON CONFLICT (table_name, symbol, interval, start_at)
+        DO UPDATE SET end_at = GREATEST(ohlc_coverage.end_at, EXCLUDED.end_at)
+    ''', (table_name, symbol, interval, end + step, start - step,
+          table_name, symbol, interval, start, end))
 
+def _bar_runs(dates, step):
+    """Sorted bar time strings -> [(first, last)] runs of consecutive bars."""
+    t = np.unique(pd.to_datetime(pd.Series(dates)).to_numpy())
+    if not len(t):
+        return []
+    breaks = np.flatnonzero(np.diff(t) > np.timedelta64(step))
+    firsts = t[np.r_[0, breaks + 1]]
+    lasts = t[np.r_[breaks, len(t) - 1]]
+    return [(pd.Timestamp(a).to_pydatetime(), pd.Timestamp(b).to_pydatetime()) for a, b in zip(firsts, lasts)]
+
+def _record_inserted_coverage(cur, table_name, frame, interval):
+    step = interval_step(interval)
+    groups = frame.groupby('symbol')['bar_time'] if table_name == "crypto_ohlc" else [('', frame['bar_time'])]
+    for symbol, dates in groups:
+        for first, last in _bar_runs(dates, step):
+            _merge_coverage(cur, table_name, symbol, interval, first, last)
+
+@timed('dca_db_seconds', op='record_coverage')
+def record_coverage(table_name, start, end, symbol=None, interval=None):
+    """
+    Mark the bars [start, end] (datetimes, inclusive) of table_name as fetched,
+    including bars the provider has no data for (weekends, outages, before
+    listing), so they are not reported as gaps again.
+    """
+    table_name, symbol, interval = _coverage_key(table_name, symbol, interval)
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        _merge_coverage(cur, table_name, symbol, interval, start, end)
         conn.commit()
         cur.close()
+    finally:
         put_connection(conn)
 
+def _ohlc_frame(table_name, ohlc_data, interval):
+    """
+    Row dicts, a DataFrame or {column: array} -> DataFrame with the table's
+    columns, one row per key (last one wins). Bar times come from a 'date'
+    (or 'bar_time') column of strings or datetimes, taken as UTC.
+    """
+    frame = ohlc_data if isinstance(ohlc_data, pd.DataFrame) else pd.DataFrame(ohlc_data)
+    if 'bar_time' not in frame.columns:
+        frame = frame.rename(columns={'date': 'bar_time'})
+    keys = OHLC_TABLE_KEYS[table_name]
+    frame = frame.reindex(columns=list(keys) + list(OHLC_COLUMNS))
+    frame['interval'] = interval
+    if table_name == "crypto_ohlc":
+        frame['symbol'] = frame['symbol'].fillna('')
+    bar_time = pd.to_datetime(frame['bar_time'], utc=True)
+    frame['bar_time'] = bar_time.dt.tz_localize(None)
+    return frame.dropna(subset=['bar_time']).drop_duplicates(subset=list(keys), keep='last')
+
+@timed('dca_db_seconds', op='insert_ohlc_data')
+def insert_ohlc_data(table_name, ohlc_data, interval=None):
+    """
+    Insert or upsert multiple rows into:
+      - crypto_ohlc (symbol, interval, bar_time, open, high, low, close)
+      - gold_ohlc   (interval, bar_time, open, high, low, close)
+      - usd_ohlc    (interval, bar_time, open, high, low, close)
+    (usd_ffill_ohlc and gold_usd_ohlc are derived, see refresh_usd_ffill and
+    refresh_gold_usd).
+
+    `ohlc_data` is a list of row dicts, a DataFrame or a dict of columns
+    (arrays) with a 'date' column of UTC strings or datetimes. The rows are
+    COPYed into a temporary staging table and merged with one INSERT ...
+    ON CONFLICT DO UPDATE, which leaves rows with unchanged prices alone.
+    The runs of inserted bars are merged into the coverage manifest and, for
+    sources of a derived table, the changed bar range is logged in
+    ohlc_changes, all in the same transaction; `interval` defaults to the
+    table's OHLC_TABLE_INTERVALS.
+    """
+    try:
+        interval = interval or OHLC_TABLE_INTERVALS[table_name]
+        frame = _ohlc_frame(table_name, ohlc_data, interval)
+        if frame.empty:
+            logger.warning(f"No data to insert into {table_name}. Skipping.")
+            return
+
+        keys = OHLC_TABLE_KEYS[table_name]
+        columns = ", ".join(frame.columns)
+        updates = ",\n                    ".join(f"{c} = EXCLUDED.{c}" for c in OHLC_COLUMNS)
+        current = ", ".join(f"t.{c}" for c in OHLC_COLUMNS)
+        incoming = ", ".join(f"EXCLUDED.{c}" for c in OHLC_COLUMNS)
+        buf = io.StringIO()
+        frame.to_csv(buf, sep='\t', header=False, index=False, na_rep='\\N',
+                     date_format="%Y-%m-%d %H:%M:%S+00")
+        buf.seek(0)
+
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"CREATE TEMP TABLE ohlc_staging (LIKE {table_name}) ON COMMIT DROP")
+            cur.copy_expert(f"COPY ohlc_staging ({columns}) FROM STDIN", buf)
+            cur.execute(f"""
+            WITH upserted AS (
+                INSERT INTO {table_name} AS t ({columns})
+                SELECT {columns} FROM ohlc_staging
+                ON CONFLICT ({", ".join(keys)})
+                DO UPDATE SET
+                    {updates}
+                WHERE ({current}) IS DISTINCT FROM ({incoming})
+                RETURNING bar_time
+            )
+            SELECT COUNT(*), MIN(bar_time) AT TIME ZONE 'UTC', MAX(bar_time) AT TIME ZONE 'UTC' FROM upserted
+            """)
+            changed, first_changed, last_changed = cur.fetchone()
+            logger.info(f"Upserted {len(frame)} records into {table_name} ({changed} new or changed).")
+            _record_inserted_coverage(cur, table_name, frame, interval)
+            if changed:
+                _log_changes(cur, table_name, interval, first_changed, last_changed)
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            put_connection(conn)
+        if changed:
+            symbols = set(frame['symbol']) if table_name == "crypto_ohlc" else None
+            _notify_insert(table_name, symbols, first_changed, last_changed, interval)
+
     except Exception as e:
         logger.error(f"Error inserting data into {table_name}: {e}", exc_info=True)
         raise
 
-def get_cached_dates_for_crypto(symbol):
+def coverage_gaps(table_name, first, last, symbol=None, interval=None):
     """
-    Returns a set of all 'date' values stored in crypto_ohlc for the given symbol.
+    Bars of [first, last] (datetimes, inclusive bar open times, capped at the
+    last closed bar) not in the coverage manifest, as [(first, last)] gaps.
     """
+    table_name, symbol, interval = _coverage_key(table_name, symbol, interval)
+    step = interval_step(interval)
+    now = datetime.datetime.utcnow()
+    last_closed = now - (now - datetime.datetime(1970, 1, 1)) % step - step
+    last = min(last, last_closed)
+    if last < first:
+        return []
+
+    conn = get_connection()
     try:
-        conn = get_connection()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT date FROM crypto_ohlc
-            WHERE symbol=%s
-        """, (symbol,))
-        rows = cur.fetchall()
+        cur.execute('''
+            SELECT start_at, end_at FROM ohlc_coverage
+            WHERE table_name=%s AND symbol=%s AND interval=%s
+              AND start_at <= %s AND end_at >= %s
+            ORDER BY start_at
+        ''', (table_name, symbol, interval, last, first))
+        covered = cur.fetchall()
         cur.close()
+    finally:
         put_connection(conn)
-        return set(r[0] for r in rows)
 
+    gaps = []
+    cursor = first
+    for run_start, run_end in covered:
+        if run_start > cursor:
+            gaps.append((cursor, min(run_start - step, last)))
+        cursor = max(cursor, run_end + step)
+    if cursor <= last:
+        gaps.append((cursor, last))
+    return gaps
+
+@timed('dca_db_seconds', op='get_missing_date_ranges')
+def get_missing_date_ranges(table_name, start_date, end_date, symbol=None, interval=None):
+    """
+    Determine which bars of [start_date, end_date] are not cached, from the
+    coverage manifest. If table_name == "crypto_ohlc", coverage is per symbol
+    (need symbol param); gold_ohlc and usd_ohlc ignore symbol.
+
+    Bars run from start_date 00:00 to end_date 00:00 (UTC), capped at the last
+    closed bar. Returns a list of (first, last) datetimes, one per gap, both
+    inclusive bar open times.
+    """
+    try:
+        if table_name == "crypto_ohlc" and not symbol:
+            raise ValueError("Must provide 'symbol' for crypto coverage check.")
+        first = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        last  = datetime.datetime.strptime(end_date,   "%Y-%m-%d")
+        gaps = coverage_gaps(table_name, first, last, symbol=symbol, interval=interval)
+
+        if not gaps:
+            logger.info(f"No missing dates in {table_name} for {symbol} from {start_date} to {end_date}.")
+        else:
+            logger.info(f"{len(gaps)} gaps in {table_name} for {symbol} from {start_date} to {end_date}.")
+        return gaps
+
+    except ValueError:
+        raise
     except Exception as e:
-        logger.error(f"Error getting cached dates for {symbol} in crypto_ohlc: {e}", exc_info=True)
-        return set()
+        logger.error(f"Error getting missing date ranges for {table_name}: {e}", exc_info=True)
+        return []
+
+# Binary COPY of (bar time in epoch microseconds, open, high, low, close):
+# every tuple has the same width, so NumPy reads the whole buffer at once.
+_COPY_HEADER_BYTES = 19  # signature (11), flags (4), header extension length (4)
+_COPY_ROW_DTYPE = np.dtype([
+    ('fields', '>i2'),
+    ('t_len', '>i4'), ('bar_time', '>i8'),
+    ('o_len', '>i4'), ('open', '>f8'),
+    ('h_len', '>i4'), ('high', '>f8'),
+    ('l_len', '>i4'), ('low', '>f8'),
+    ('c_len', '>i4'), ('close', '>f8'),
+])
 
-def get_cached_dates(table_name):
+def _range_filter(start_date, end_date, symbol, interval):
+    """WHERE clause and params: bars with open time in [start_date, end_date] (UTC), or unbounded."""
+    clauses, params = ["interval = %s"], [interval]
+    if symbol is not None:
+        clauses.append("symbol = %s")
+        params.append(symbol)
+    if start_date is not None:
+        clauses.append("bar_time >= (%s::timestamp AT TIME ZONE 'UTC')")
+        params.append(start_date)
+    if end_date is not None:
+        clauses.append("bar_time <= (%s::timestamp AT TIME ZONE 'UTC')")
+        params.append(end_date)
+    return " AND ".join(clauses), params
+
+@timed('dca_db_seconds', op='fetch_ohlc_columns')
+def fetch_ohlc_columns(table_name, start_date=None, end_date=None, symbol=None, interval=None):
     """
-    For gold_ohlc or usd_ohlc, we just return all date strings in that table.
+    Bars of table_name (and symbol, for crypto_ohlc) opening in
+    [start_date, end_date] as {'bar_time': datetime64[us] (UTC),
+    'open'/'high'/'low'/'close': float64}, sorted by bar_time. NULL prices
+    come back as NaN.
     """
+    where, params = _range_filter(start_date, end_date, symbol, interval or OHLC_TABLE_INTERVALS[table_name])
+    conn = get_connection()
     try:
-        conn = get_connection()
         cur = conn.cursor()
-        cur.execute(f"SELECT date FROM {table_name}")
-        rows = cur.fetchall()
+        query = cur.mogrify(f'''
+            COPY (
+                SELECT (EXTRACT(EPOCH FROM bar_time) * 1000000)::bigint,
+                       COALESCE(open, 'NaN'), COALESCE(high, 'NaN'),
+                       COALESCE(low, 'NaN'), COALESCE(close, 'NaN')
+                FROM {table_name}
+                WHERE {where}
+                ORDER BY bar_time
+            ) TO STDOUT WITH (FORMAT binary)
+        ''', params).decode()
+        buf = io.BytesIO()
+        cur.copy_expert(query, buf)
         cur.close()
+    finally:
         put_connection(conn)
-        return set(r[0] for r in rows)
-    except Exception as e:
-        logger.error(f"Error getting cached dates for {table_name}: {e}", exc_info=True)
-        return set()
 
-def get_missing_date_ranges(table_name, start_date, end_date, symbol=None):
-    """
-    Determine which portions of [start_date, end_date] are not cached.
-    If table_name == "crypto_ohlc", we do symbol-based coverage. (Need symbol param)
-    If table_name in ("gold_ohlc","usd_ohlc"), we do coverage ignoring symbol.
+    data = buf.getbuffer()
+    start = _COPY_HEADER_BYTES + int.from_bytes(data[15:19], 'big')
+    rows = np.frombuffer(data[start:len(data) - 2], dtype=_COPY_ROW_DTYPE)  # minus the -1 trailer
+    columns = {'bar_time': rows['bar_time'].astype(np.int64).astype('datetime64[us]')}
+    for c in OHLC_COLUMNS:
+        columns[c] = rows[c].astype(np.float64)
+    return columns
 
-    Returns a list of (start, end) tuples for missing daily coverage.
-    Currently returns at most one chunk if partially missing.
+def iter_ohlc_columns(table_name, start, end, symbol=None, interval=None, chunk_bars=OHLC_CHUNK_BARS):
     """
-    try:
-        start_dt = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt   = datetime.datetime.strptime(end_date,   "%Y-%m-%d")
+    fetch_ohlc_columns over [start, end] (datetimes) in consecutive windows of
+    whole days holding about chunk_bars bars each; yields the non-empty
+    chunks in time order. Windows start at `start`, so bars of a coarser
+    interval aligned with `start` never straddle two chunks.
+    """
+    interval = interval or OHLC_TABLE_INTERVALS[table_name]
+    window = datetime.timedelta(days=max(1, (chunk_bars * interval_step(interval)).days))
+    cursor = start
+    while cursor <= end:
+        window_end = min(cursor + window - datetime.timedelta(microseconds=1), end)
+        columns = fetch_ohlc_columns(table_name, cursor, window_end, symbol=symbol, interval=interval)
+        if len(columns['bar_time']):
+            yield columns
+        cursor += window
 
-        all_required = []
-        delta_days = (end_dt - start_dt).days
-        for i in range(delta_days+1):
-            day = (start_dt + datetime.timedelta(days=i))
-            all_required.append(day)
+def resample_ohlc_columns(columns, interval):
+    """
+    Sorted bar columns -> bars of the coarser `interval` (epoch-aligned, as
+    Binance opens 1h/4h/1d klines): first open, highest high, lowest low,
+    last close of each bucket. Buckets without source bars are left out.
+    """
+    step_us = interval_step(interval) // datetime.timedelta(microseconds=1)
+    t = columns['bar_time'].astype('datetime64[us]').astype(np.int64)
+    if not len(t):
+        return {c: columns[c][:0] for c in ('bar_time',) + OHLC_COLUMNS}
+    buckets = t - t % step_us
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+    return {
+        'bar_time': buckets[starts].astype('datetime64[us]'),
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': columns['close'][ends]
+    }
 
+def materialize_resampled(table_name, first, last, source_interval, interval, symbol=None):
+    """
+    Build the `interval` bars [first, last] from the cached `source_interval`
+    bars (which must cover them), chunk by chunk, store them with
+    insert_ohlc_data and mark the range as covered. Returns the bar count.
+    """
+    source_last = last + interval_step(interval) - interval_step(source_interval)
+    bars = 0
+    for chunk in iter_ohlc_columns(table_name, first, source_last, symbol=symbol, interval=source_interval):
+        frame = pd.DataFrame(resample_ohlc_columns(chunk, interval))
         if table_name == "crypto_ohlc":
-            if not symbol:
-                raise ValueError("Must provide 'symbol' for crypto coverage check.")
-            cached_dates = get_cached_dates_for_crypto(symbol)
-        else:
-            cached_dates = get_cached_dates(table_name)
+            frame['symbol'] = symbol
+        insert_ohlc_data(table_name, frame, interval=interval)
+        bars += len(frame)
+    record_coverage(table_name, first, last, symbol=symbol, interval=interval)
+    logger.info(f"Built {bars} {interval} bars of {table_name} ({symbol or '-'}) "
+                f"from {source_interval} bars for {first}..{last}.")
+    return bars
 
-        # Convert cached to daily datetimes by substring
-        cached_datetimes = set()
-        for d_str in cached_dates:
-            day_str = d_str[:10]  # "YYYY-MM-DD"
-            try:
-                c_dt = datetime.datetime.strptime(day_str, "%Y-%m-%d")
-                cached_datetimes.add(c_dt)
-            except:
-                pass
+def _log_changes(cur, table_name, interval, first, last):
+    """Log the changed bars [first, last] of table_name for every derived table computed from it."""
+    for derived_table, sources in DERIVED_OHLC_SOURCES.items():
+        if table_name in sources:
+            cur.execute('''
+                INSERT INTO ohlc_changes (derived_table, table_name, interval, min_at, max_at)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (derived_table, table_name, interval, first, last))
 
-        missing = sorted(d for d in all_required if d not in cached_datetimes)
-        if not missing:
-            logger.info(f"No missing dates in {table_name} for {symbol or ''} from {start_date} to {end_date}.")
-            return []
+def _consume_changes(cur, derived_table, interval):
+    """
+    Lock derived_table against other refreshes (reads go on) and take its
+    logged source changes. Returns (first, last) of the changed bars,
+    (None, None) to rebuild everything while derived_table is empty, or None
+    when nothing changed.
+    """
+    cur.execute(f"LOCK TABLE {derived_table} IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(f'''
+        WITH consumed AS (
+            DELETE FROM ohlc_changes WHERE derived_table = %s AND interval = %s
+            RETURNING min_at, max_at
+        )
+        SELECT MIN(min_at), MAX(max_at), NOT EXISTS (SELECT 1 FROM {derived_table}) FROM consumed
+    ''', (derived_table, interval))
+    first, last, empty = cur.fetchone()
+    if empty:
+        return None, None
+    if first is None:
+        return None
+    return first, last
 
-        return [(missing[0].strftime("%Y-%m-%d"), missing[-1].strftime("%Y-%m-%d"))]
+def _bar_bounds(alias):
+    """Bars of `alias` in [%(first)s, %(last)s] (UTC, unbounded when NULL)."""
+    return (f"{alias}.bar_time >= COALESCE((%(first)s::timestamp AT TIME ZONE 'UTC'), '-infinity') AND "
+            f"{alias}.bar_time <= COALESCE((%(last)s::timestamp AT TIME ZONE 'UTC'), 'infinity')")
 
-    except Exception as e:
-        logger.error(f"Error getting missing date ranges for {table_name}: {e}", exc_info=True)
-        return []
-
-def fetch_cached_data(table_name, start_date, end_date):
+def _refresh_derived(table_name, select_sql):
     """
-    Retrieve data from table_name for [start_date, end_date], ignoring symbol.
-    Typically used for gold_ohlc or usd_ohlc.
-    For crypto_ohlc by symbol, you'd do a separate custom query.
+    Make the bars of table_name in the changed range equal to `select_sql`
+    (interval, bar_time, open, high, low, close rows; may use %(interval)s,
+    %(first)s, %(last)s): upsert the rows that differ, delete the bars it no
+    longer yields, log the change for dependent tables. `select_sql` must
+    return every bar of table_name in [%(first)s, %(last)s]. Returns the
+    number of rows written or removed.
     """
+    interval = OHLC_TABLE_INTERVALS[table_name]
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in OHLC_COLUMNS)
+    current = ", ".join(f"t.{c}" for c in OHLC_COLUMNS)
+    incoming = ", ".join(f"EXCLUDED.{c}" for c in OHLC_COLUMNS)
+    conn = get_connection()
     try:
-        conn = get_connection()
         cur = conn.cursor()
+        changes = _consume_changes(cur, table_name, interval)
+        if changes is None:
+            conn.commit()
+            cur.close()
+            logger.info(f"{table_name} is up to date.")
+            return 0
+        first, last = changes
+
         cur.execute(f'''
-          SELECT date, open, high, low, close
-          FROM {table_name}
-          WHERE date >= %s AND date <= %s
-          ORDER BY date ASC
-        ''', (start_date, end_date))
-        rows = cur.fetchall()
+            WITH computed AS (
+                {select_sql}
+            ), removed AS (
+                DELETE FROM {table_name} d
+                WHERE d.interval = %(interval)s AND {_bar_bounds("d")}
+                  AND NOT EXISTS (SELECT 1 FROM computed c WHERE c.bar_time = d.bar_time)
+                RETURNING bar_time
+            ), written AS (
+                INSERT INTO {table_name} AS t (interval, bar_time, {", ".join(OHLC_COLUMNS)})
+                SELECT * FROM computed
+                ON CONFLICT (interval, bar_time)
+                DO UPDATE SET {updates}
+                WHERE ({current}) IS DISTINCT FROM ({incoming})
+                RETURNING bar_time
+            ), touched AS (
+                SELECT bar_time FROM removed UNION ALL SELECT bar_time FROM written
+            )
+            SELECT COUNT(*), MIN(bar_time) AT TIME ZONE 'UTC', MAX(bar_time) AT TIME ZONE 'UTC' FROM touched
+        ''', {'interval': interval, 'first': first, 'last': last})
+        touched, first_touched, last_touched = cur.fetchone()
+        if touched:
+            _log_changes(cur, table_name, interval, first_touched, last_touched)
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        put_connection(conn)
+
+    logger.info(f"Refreshed {table_name} over {first or 'all'}..{last or 'all'}: {touched} rows written or removed.")
+    if touched:
+        _notify_insert(table_name, None, first_touched, last_touched, interval)
+    return touched
+
+@timed('dca_db_seconds', op='refresh_usd_ffill')
+def refresh_usd_ffill():
+    """
+    Forward-fill usd_ohlc into usd_ffill_ohlc (one row per day up to the
+    newest quote, each day carrying the latest quote at or before it). Only
+    the days from the last quote before the first changed one up to the
+    next unchanged quote (or the newest one) are recomputed: a window
+    function pairs every quote
+    with the next one and generate_series expands it over the days between.
+    Returns the number of usd_ffill_ohlc rows written or removed.
+    """
+    raw = "usd_ohlc"
+    # Quotes from the last one before the first changed day (its days up to
+    # the next quote change too) to the first one after the last changed day.
+    return _refresh_derived("usd_ffill_ohlc", f'''
+                SELECT %(interval)s AS interval, day AS bar_time, q.open, q.high, q.low, q.close
+                FROM (
+                    SELECT r.*, LEAD(r.bar_time) OVER (ORDER BY r.bar_time) AS next_at
+                    FROM {raw} r
+                    WHERE r.interval = %(interval)s
+                      AND r.bar_time >= COALESCE((SELECT MAX(p.bar_time) FROM {raw} p
+                                                  WHERE p.interval = %(interval)s
+                                                    AND p.bar_time < (%(first)s::timestamp AT TIME ZONE 'UTC')),
+                                                 '-infinity')
+                      AND r.bar_time <= COALESCE((SELECT MIN(n.bar_time) FROM {raw} n
+                                                  WHERE n.interval = %(interval)s
+                                                    AND n.bar_time > (%(last)s::timestamp AT TIME ZONE 'UTC')),
+                                                 'infinity')
+                ) q
+                CROSS JOIN LATERAL generate_series(q.bar_time, COALESCE(q.next_at - '1 day'::interval, q.bar_time),
+                                                   '1 day'::interval) AS day
+    ''')
+
+@timed('dca_db_seconds', op='refresh_gold_usd')
+def refresh_gold_usd():
+    """
+    Recompute gold_usd_ohlc = gold_ohlc prices / same-day usd_ffill_ohlc
+    close with one set-based join, over the bar range whose gold or USD rows
+    changed since the last refresh (ohlc_changes), or every bar while
+    gold_usd_ohlc is empty. gold_ohlc itself keeps the raw IRR prices.
+    Returns the number of gold_usd_ohlc rows written or removed.
+    """
+    prices = ", ".join(f"ROUND((g.{c} / u.close)::numeric, {GOLD_USD_DECIMALS})::float8" for c in OHLC_COLUMNS)
+    return _refresh_derived("gold_usd_ohlc", f'''
+                SELECT g.interval, g.bar_time, {prices}
+                FROM gold_ohlc g
+                JOIN usd_ffill_ohlc u ON u.interval = g.interval AND u.bar_time = g.bar_time AND u.close > 0
+                WHERE g.interval = %(interval)s AND {_bar_bounds("g")}
+    ''')
+
+@timed('dca_db_seconds', op='drop_converted_gold')
+def drop_converted_gold():
+    """
+    One-time repair of databases from before gold_usd_ohlc, whose
+    convert_gold_to_usd overwrote gold_ohlc with USD prices. Rows priced
+    below the USD/IRR rate of their day (the latest usd_ohlc quote, or the
+    next one) cannot be IRR gold: they are deleted together with the
+    coverage runs they touch, so the next download fetches the raw prices
+    again, and gold_usd_ohlc is recomputed over them. Idempotent; returns
+    the number of rows deleted.
+    """
+    table_name = "gold_ohlc"
+    interval = OHLC_TABLE_INTERVALS[table_name]
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            WITH converted AS (
+                DELETE FROM gold_ohlc g
+                WHERE g.interval = %(interval)s
+                  AND g.close < COALESCE(
+                      (SELECT u.close FROM usd_ohlc u
+                       WHERE u.interval = g.interval AND u.bar_time <= g.bar_time AND u.close > 0
+                       ORDER BY u.bar_time DESC LIMIT 1),
+                      (SELECT u.close FROM usd_ohlc u
+                       WHERE u.interval = g.interval AND u.bar_time > g.bar_time AND u.close > 0
+                       ORDER BY u.bar_time LIMIT 1))
+                RETURNING bar_time
+            )
+            SELECT COUNT(*), MIN(bar_time) AT TIME ZONE 'UTC', MAX(bar_time) AT TIME ZONE 'UTC' FROM converted
+        ''', {'interval': interval})
+        dropped, first, last = cur.fetchone()
+        if dropped:
+            cur.execute('''
+                DELETE FROM ohlc_coverage
+                WHERE table_name = %s AND symbol = '' AND interval = %s AND start_at <= %s AND end_at >= %s
+            ''', (table_name, interval, last, first))
+            _log_changes(cur, table_name, interval, first, last)
+        conn.commit()
         cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         put_connection(conn)
 
-        data = []
-        for r in rows:
-            data.append({
-                'date': r[0],
-                'open': r[1],
-                'high': r[2],
-                'low':  r[3],
-                'close':r[4],
-            })
+    if dropped:
+        logger.warning(f"Dropped {dropped} gold_ohlc rows holding converted USD prices "
+                       f"({first:%Y-%m-%d}..{last:%Y-%m-%d}); they are downloaded again on the next run.")
+        _notify_insert(table_name, None, first, last, interval)
+    return dropped
+
+@timed('dca_db_seconds', op='fetch_cached_data')
+def fetch_cached_data(table_name, start_date=None, end_date=None, interval=None):
+    """
+    Retrieve data from table_name for [start_date, end_date] (unbounded when
+    None), ignoring symbol. Typically used for gold_ohlc or usd_ohlc.
+    Rows are dicts with 'date' as a naive UTC datetime.
+    """
+    try:
+        columns = fetch_ohlc_columns(table_name, start_date, end_date, interval=interval)
+        dates = pd.to_datetime(columns['bar_time']).to_pydatetime()
+        data = [
+            {'date': d, 'open': o, 'high': h, 'low': l, 'close': c}
+            for d, o, h, l, c in zip(dates, *(columns[c].tolist() for c in OHLC_COLUMNS))
+        ]
         logger.debug(f"Fetched {len(data)} rows from {table_name} in range [{start_date}, {end_date}].")
         return data
     except Exception as e:
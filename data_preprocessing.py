@@ -2,71 +2,249 @@
 """
 data_preprocessing.py
 Fetches OHLC from DB for either:
- - crypto_ohlc (4h or daily), filtered by user-chosen symbol
- - gold_ohlc (daily)
-Then we parse them accordingly, keep full timestamps, and compute returns.
+ - crypto_ohlc (any of binance_data.BINANCE_INTERVALS, 4h by default),
+   filtered by user-chosen symbol
+ - gold_usd_ohlc (daily gold in USD, derived from gold_ohlc)
+The bars come back as typed columns, memory-mapped from the local price
+store (price_store.py) or, when it is disabled or fails, read from Postgres
+with a binary COPY (cache_manager.fetch_ohlc_columns); only returns are
+computed here.
+
+Parsed series are kept in an in-process LRU/TTL cache (`price_cache`), so the
+several scenarios of one backtest share a single DB round trip per asset.
+The cache keeps the loaded arrays as they are (the store's memory map for a
+range inside one partition) and hands out frames backed by them.
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from cache_manager import fetch_cached_data
-from database_manager import get_connection, put_connection, init_db
+from cache_manager import fetch_ohlc_columns, add_insert_listener
+# Imported first so its insert listener refreshes the store before the
+# listener below drops cached series that would be reloaded from it.
+from price_store import price_store
+from database_manager import OHLC_TABLE_INTERVALS
+from metrics import register_gauges
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def get_crypto_data(symbol_pair, start_date="2020-01-01", end_date="2030-01-01"):
+PRICE_CACHE_MAX_BYTES   = 256 * 1024 * 1024
+PRICE_CACHE_TTL_SECONDS = 15 * 60
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+class PriceSeriesCache:
+    """
+    Memory-bounded LRU cache of parsed OHLC series, keyed by
+    (table, symbol, interval, start_date, end_date).
+
+    Each entry keeps the bar times (datetime64, UTC) next to the price
+    columns, so a request for a sub-range of a cached entry is answered by
+    slicing with the same bounds the SQL query would have used. Cached arrays
+    are read-only and every caller gets its own DataFrame object, but its
+    columns are views of them (except the first Return of a sub-range, and
+    where pandas consolidates columns into a copy): callers must not write
+    to them (they raise), only copy the frame or add columns.
+    """
+
+    def __init__(self, max_bytes=PRICE_CACHE_MAX_BYTES, ttl_seconds=PRICE_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, table, symbol, interval, start_date, end_date, loader):
+        """
+        Return the series for [start_date, end_date], loading it with
+        `loader()` on a miss. `loader` must return (date_keys, columns), where
+        date_keys are the sorted bar times (datetime64) and columns maps
+        'Date' and PRICE_COLUMNS to arrays aligned with them.
+        """
+        key = (table, symbol, interval, start_date, end_date)
+        with self._lock:
+            hit = self._lookup(key, time.time())
+            if hit is not None:
+                self._entries.move_to_end(hit)
+                self.hits += 1
+                return self._slice(self._entries[hit], start_date, end_date)
+            self.misses += 1
+
+        date_keys, columns = loader()
+        entry = self._make_entry(date_keys, columns)
+        if not len(entry['keys']):
+            return self._slice(entry, start_date, end_date)
+
+        with self._lock:
+            now = time.time()
+            for old in [k for k, e in self._entries.items() if now - e['loaded_at'] > self.ttl_seconds]:
+                self._drop(old)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry['nbytes']
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return self._slice(entry, start_date, end_date)
+
+    def invalidate(self, table, symbols=None, min_date=None, max_date=None, interval=None):
+        """
+        Drop entries of `table` (and of `symbols` and `interval`, if given)
+        whose range overlaps [min_date, max_date]. Without dates every entry
+        of the table/symbols is dropped.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                e_table, e_symbol, e_interval, e_start, e_end = key
+                if e_table != table:
+                    continue
+                if symbols is not None and e_symbol not in symbols:
+                    continue
+                if interval is not None and e_interval != interval:
+                    continue
+                if min_date is not None and max_date is not None and (max_date < e_start or min_date > e_end):
+                    continue
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+    def _lookup(self, key, now):
+        """Key of a fresh entry holding the range of `key` (the same key first), or None."""
+        fresh = lambda k: now - self._entries[k]['loaded_at'] <= self.ttl_seconds
+        if key in self._entries:
+            return key if fresh(key) else None
+        table, symbol, interval, start_date, end_date = key
+        for e_key in self._entries:
+            e_table, e_symbol, e_interval, e_start, e_end = e_key
+            if (e_table == table and e_symbol == symbol and e_interval == interval
+                    and e_start <= start_date and end_date <= e_end and fresh(e_key)):
+                return e_key
+        return None
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['nbytes']
+
+    @staticmethod
+    def _make_entry(date_keys, columns):
+        """Keeps the loaded arrays (made read-only) and the returns over the whole entry."""
+        columns = dict(columns)
+        close = columns['Close']
+        returns = np.full(len(close), np.nan)
+        returns[1:] = close[1:] / close[:-1] - 1.0
+        columns['Return'] = returns
+        for arr in columns.values():
+            arr.setflags(write=False)
+        keys = np.asarray(date_keys, dtype='datetime64[us]')
+        keys.setflags(write=False)
+        nbytes = keys.nbytes + sum(a.nbytes for a in columns.values())
+        return {'keys': keys, 'columns': columns, 'nbytes': nbytes, 'loaded_at': time.time()}
+
+    @staticmethod
+    def _slice(entry, start_date, end_date):
+        keys = entry['keys']
+        lo = np.searchsorted(keys, np.datetime64(start_date, 'us'), side='left')
+        hi = np.searchsorted(keys, np.datetime64(end_date, 'us'), side='right')
+        columns = {col: arr[lo:hi] for col, arr in entry['columns'].items()}
+        if lo > 0:
+            # The first bar of a sub-range has no return in it
+            columns['Return'] = columns['Return'].copy()
+            columns['Return'][:1] = np.nan
+        return pd.DataFrame(columns, copy=False)
+
+price_cache = PriceSeriesCache()
+register_gauges(lambda: [
+    ('dca_price_cache_hit_rate', "Hit rate of the in-process price cache.", price_cache.stats()['hit_rate'], {}),
+    ('dca_price_cache_bytes', "Bytes held by the in-process price cache.", price_cache.stats()['bytes'], {})
+])
+
+def _on_ohlc_insert(table_name, symbols, min_date, max_date, interval):
+    price_cache.invalidate(table_name, symbols, min_date, max_date, interval)
+
+add_insert_listener(_on_ohlc_insert)
+
+def price_cache_stats():
+    """Hit/miss counters and size of the in-process price cache."""
+    return price_cache.stats()
+
+def _load_columns(table_name, start_date, end_date, symbol=None, interval=None):
+    if price_store.enabled:
+        try:
+            return price_store.read_columns(table_name, start_date, end_date, symbol=symbol, interval=interval)
+        except Exception as e:
+            logger.error(f"Price store read failed for {table_name}, using Postgres: {e}", exc_info=True)
+    return fetch_ohlc_columns(table_name, start_date, end_date, symbol=symbol, interval=interval)
+
+def _load_frame(table_name, start_date, end_date, symbol=None, interval=None):
+    """(bar times, price cache columns); the price arrays are passed on without copying."""
+    columns = _load_columns(table_name, start_date, end_date, symbol=symbol, interval=interval)
+    date_keys = columns['bar_time']
+    return date_keys, {
+        'Open': columns['open'],
+        'High': columns['high'],
+        'Low': columns['low'],
+        'Close': columns['close'],
+        'Date': date_keys.astype('datetime64[ns]')
+    }
+
+def _load_crypto_frame(symbol_pair, start_date, end_date, interval):
+    return _load_frame("crypto_ohlc", start_date, end_date, symbol=symbol_pair, interval=interval)
+
+def _load_gold_frame(start_date, end_date):
+    return _load_frame("gold_usd_ohlc", start_date, end_date)
+
+def get_crypto_data(symbol_pair, start_date="2020-01-01", end_date="2030-01-01", interval=None):
     """
-    Pull from crypto_ohlc for the given `symbol_pair`.
+    Pull from crypto_ohlc for the given `symbol_pair` and `interval`
+    (default 4h).
     Return a DataFrame [Date, Open, High, Low, Close, Return].
-    Possibly multiple rows per day (4h).
+    Possibly multiple rows per day.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT date, open, high, low, close
-        FROM crypto_ohlc
-        WHERE symbol=%s 
-          AND date >= %s
-          AND date <= %s
-        ORDER BY date ASC
-    ''', (symbol_pair, start_date, end_date))
-    rows = cur.fetchall()
-    cur.close()
-    put_connection(conn)
-
-    df = pd.DataFrame(rows, columns=['date','Open','High','Low','Close'])
+    interval = interval or OHLC_TABLE_INTERVALS["crypto_ohlc"]
+    df = price_cache.get("crypto_ohlc", symbol_pair, interval, start_date, end_date,
+                         lambda: _load_crypto_frame(symbol_pair, start_date, end_date, interval))
     if df.empty:
-        logger.warning(f"No data returned for {symbol_pair} in range {start_date}..{end_date}.")
+        logger.warning(f"No {interval} data returned for {symbol_pair} in range {start_date}..{end_date}.")
         return df
 
-    df['Date'] = pd.to_datetime(df['date'], format="%Y-%m-%d %H:%M:%S", errors='coerce')
-    df['Date'] = df['Date'].fillna(pd.to_datetime(df['date'], format="%Y-%m-%d", errors='coerce'))
-    df.drop(columns=['date'], inplace=True)
-    df.sort_values(by='Date', inplace=True)
-    df.reset_index(drop=True, inplace=True)
-
-    df['Return'] = df['Close'].pct_change()
     logger.debug(f"get_crypto_data({symbol_pair}): {len(df)} rows. Head:\n{df.head(5)}")
     return df
 
 def get_gold_data(start_date="2020-01-01", end_date="2030-01-01"):
     """
-    Pull from gold_ohlc. 
+    Pull from gold_usd_ohlc (gold priced in USD).
     Returns a daily DF [Date, Open, High, Low, Close, Return].
     """
-    rows = fetch_cached_data("gold_ohlc", start_date, end_date)
-    df = pd.DataFrame(rows)
+    df = price_cache.get("gold_usd_ohlc", None, OHLC_TABLE_INTERVALS["gold_usd_ohlc"], start_date, end_date,
+                         lambda: _load_gold_frame(start_date, end_date))
     if df.empty:
         logger.warning(f"No gold data in range {start_date}..{end_date}.")
         return df
 
-    df.rename(columns={'open':'Open','high':'High','low':'Low','close':'Close'}, inplace=True)
-    df['Date'] = pd.to_datetime(df['date'], format="%Y-%m-%d", errors='coerce')
-    df.drop(columns=['date'], inplace=True)
-    df.sort_values(by='Date', inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    df['Return'] = df['Close'].pct_change()
     logger.debug(f"get_gold_data: {len(df)} rows. Head:\n{df.head(5)}")
     return df
@@ -6,44 +6,70 @@ Handles PostgreSQL database connections and schema creation.
 
 import os
 import logging
-import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-from credentials import postgres_user, postgres_pass, postgress_table
+import threading
+from metrics import timed
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 # Environment variables for best practice in production
 POSTGRES_HOST =  "localhost"
 POSTGRES_PORT =  "5432"
-POSTGRES_DB   = postgress_table
-POSTGRES_USER = postgres_user
-POSTGRES_PASS = postgres_pass
 
-# Initialize a connection pool (tune minconn/maxconn as needed)
+# Connection pool (tune minconn/maxconn as needed). It is created on first
+# use, so modules that only compute on injected data (benchmarks) import
+# without psycopg2, credentials or a running Postgres.
 MINCONN = 1
 MAXCONN = 10
-pool = SimpleConnectionPool(
-    MINCONN, MAXCONN,
-    host=POSTGRES_HOST,
-    port=POSTGRES_PORT,
-    database=POSTGRES_DB,
-    user=POSTGRES_USER,
-    password=POSTGRES_PASS
-)
+
+# Bar interval of every OHLC table, used by the coverage manifest (ohlc_coverage)
+OHLC_TABLE_INTERVALS = {
+    "crypto_ohlc": "4h",
+    "gold_ohlc": "1d",        # raw IRR prices from Navasan
+    "usd_ohlc": "1d",         # raw USD/IRR rates from Navasan (days with quotes)
+    "usd_ffill_ohlc": "1d",   # derived: usd_ohlc forward-filled to every day
+    "gold_usd_ohlc": "1d",    # derived: gold_ohlc / usd_ffill_ohlc
+}
+# Derived OHLC table -> the tables it is computed from. Writes to a source
+# table log their changed bar range in ohlc_changes, once per derived table,
+# for its next refresh.
+DERIVED_OHLC_SOURCES = {
+    "usd_ffill_ohlc": ("usd_ohlc",),
+    "gold_usd_ohlc": ("gold_ohlc", "usd_ffill_ohlc"),
+}
+INTERVAL_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global pool
+    with _pool_lock:
+        if pool is None:
+            from psycopg2.pool import SimpleConnectionPool
+            from credentials import postgres_user, postgres_pass, postgress_table
+            pool = SimpleConnectionPool(
+                MINCONN, MAXCONN,
+                host=POSTGRES_HOST,
+                port=POSTGRES_PORT,
+                database=postgress_table,
+                user=postgres_user,
+                password=postgres_pass
+            )
+        return pool
 
 def get_connection():
     """
     Obtain a connection from the pool.
     You MUST call `put_connection(conn)` when done to return it.
     """
-    return pool.getconn()
+    return _get_pool().getconn()
 
 def put_connection(conn):
     """
     Return a connection to the pool.
     """
-    pool.putconn(conn)
+    _get_pool().putconn(conn)
 
+@timed('dca_db_seconds', op='init_db')
 def init_db():
     """
     Create all needed tables if they don't exist yet.
@@ -52,38 +78,36 @@ def init_db():
         conn = get_connection()
         cur = conn.cursor()
 
-        # Create the crypto_ohlc table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS crypto_ohlc (
-                symbol TEXT NOT NULL,
-                date TEXT NOT NULL,
-                open DOUBLE PRECISION,
-                high DOUBLE PRECISION,
-                low DOUBLE PRECISION,
-                close DOUBLE PRECISION,
-                PRIMARY KEY (symbol, date)
-            );
-        ''')
+        # OHLC tables: typed bar times, one row per (symbol,) interval and bar
+        _check_legacy_ohlc_schema(cur)
+        for table_name in OHLC_TABLE_INTERVALS:
+            for statement in ohlc_table_ddl(table_name):
+                cur.execute(statement)
 
-        # For USD/IRR
+        # Coverage manifest: maximal runs of bars already fetched per
+        # (table, symbol, interval); symbol is '' for gold_ohlc/usd_ohlc.
+        # Both ends are inclusive bar open times (UTC).
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS usd_ohlc (
-                date TEXT PRIMARY KEY,
-                open DOUBLE PRECISION,
-                high DOUBLE PRECISION,
-                low  DOUBLE PRECISION,
-                close DOUBLE PRECISION
+            CREATE TABLE IF NOT EXISTS ohlc_coverage (
+                table_name TEXT NOT NULL,
+                symbol TEXT NOT NULL DEFAULT '',
+                interval TEXT NOT NULL,
+                start_at TIMESTAMP NOT NULL,
+                end_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (table_name, symbol, interval, start_at)
             );
         ''')
+        _bootstrap_coverage(cur)
 
-        # For Gold IRR or Gold USD
+        # Bar ranges (UTC, inclusive) changed in the sources of a derived
+        # table since its last refresh; consumed by that refresh.
         cur.execute('''
-            CREATE TABLE IF NOT EXISTS gold_ohlc (
-                date TEXT PRIMARY KEY,
-                open DOUBLE PRECISION,
-                high DOUBLE PRECISION,
-                low  DOUBLE PRECISION,
-                close DOUBLE PRECISION
+            CREATE TABLE IF NOT EXISTS ohlc_changes (
+                derived_table TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                min_at TIMESTAMP NOT NULL,
+                max_at TIMESTAMP NOT NULL
             );
         ''')
 
@@ -97,6 +121,27 @@ def init_db():
             );
         ''')
 
+        # Memoized scenario results (see result_cache.py)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS scenario_results (
+                cache_key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                asset TEXT NOT NULL,
+                symbol TEXT,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                plan BYTEA NOT NULL,
+                summary TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at DOUBLE PRECISION NOT NULL,
+                last_access DOUBLE PRECISION NOT NULL
+            );
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS scenario_results_asset_idx
+            ON scenario_results (asset, symbol, start_date, end_date);
+        ''')
+
         conn.commit()
         cur.close()
         put_connection(conn)
@@ -105,3 +150,72 @@ def init_db():
     except Exception as e:
         logger.error(f"Error initializing DB: {e}", exc_info=True)
         raise
+
+def ohlc_table_ddl(table_name, target=None):
+    """
+    CREATE statements of an OHLC table (created as `target`, default
+    table_name): bar_time is the bar open time (timestamptz), prices are
+    float8 so they can be fetched with a binary COPY. The primary key serves
+    per-symbol range scans; the BRIN index on bar_time stays tiny because
+    bars are appended in time order.
+    """
+    target = target or table_name
+    symbol = "symbol TEXT NOT NULL," if table_name == "crypto_ohlc" else ""
+    key = "symbol, interval, bar_time" if table_name == "crypto_ohlc" else "interval, bar_time"
+    return [
+        f'''
+            CREATE TABLE IF NOT EXISTS {target} (
+                {symbol}
+                interval TEXT NOT NULL DEFAULT '{OHLC_TABLE_INTERVALS[table_name]}',
+                bar_time TIMESTAMPTZ NOT NULL,
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                PRIMARY KEY ({key})
+            );
+        ''',
+        f"CREATE INDEX IF NOT EXISTS {target}_bar_time_brin ON {target} USING BRIN (bar_time);"
+    ]
+
+def legacy_ohlc_tables(cur):
+    """OHLC tables that still have the TEXT `date` column (see migrate_ohlc_schema.py)."""
+    cur.execute('''
+        SELECT table_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND column_name = 'date' AND table_name = ANY(%s)
+    ''', (list(OHLC_TABLE_INTERVALS),))
+    return [r[0] for r in cur.fetchall()]
+
+def _check_legacy_ohlc_schema(cur):
+    legacy = legacy_ohlc_tables(cur)
+    if legacy:
+        raise RuntimeError(f"{', '.join(legacy)} still use the TEXT date schema; "
+                           f"run `python migrate_ohlc_schema.py` first.")
+
+def _bootstrap_coverage(cur):
+    """
+    First run with an empty manifest: derive it from the rows already in the
+    OHLC tables (consecutive bars form one covered run).
+    """
+    cur.execute("SELECT EXISTS (SELECT 1 FROM ohlc_coverage)")
+    if cur.fetchone()[0]:
+        return
+    for table_name, interval in OHLC_TABLE_INTERVALS.items():
+        step = f"{interval[:-1]} {INTERVAL_UNITS[interval[-1]]}"
+        symbol = "symbol" if table_name == "crypto_ohlc" else "''"
+        cur.execute(f'''
+            INSERT INTO ohlc_coverage (table_name, symbol, interval, start_at, end_at)
+            SELECT %s, symbol, %s, MIN(t), MAX(t)
+            FROM (
+                SELECT symbol, t,
+                       t - ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY t) * %s::interval AS run
+                FROM (
+                    SELECT {symbol} AS symbol, bar_time AT TIME ZONE 'UTC' AS t
+                    FROM {table_name} WHERE interval = %s
+                ) bars
+            ) runs
+            GROUP BY symbol, run
+            ON CONFLICT DO NOTHING
+        ''', (table_name, interval, step, interval))
+        if cur.rowcount:
+            logger.info(f"Coverage manifest: {cur.rowcount} runs derived from {table_name}.")
@@ -0,0 +1,267 @@
+"""
+decomposition.py
+Month-by-month solve of the DCA buying model for long ranges.
+
+Months are linked only by the total budget and by the weeks that straddle a
+month boundary. The cap of each straddling week is split between its two
+months in proportion to how the fast_solver relaxation uses them, which
+leaves the total budget as the one linking constraint. The budget is priced out with
+a multiplier lam: every month solves
+
+    max sum_t (c_t - lam) x_t   s.t. its month, week-part and buy-size limits
+
+as a small MILP, all months in parallel (each CBC solve is its own process).
+lam starts at the budget price of the LP relaxation and is bracketed and
+bisected until the months together just fit the budget. Every monthly plan
+seen on the way (plus the month's part of the greedy plan) is a candidate for
+a small master MILP that picks one plan per month within the total budget and
+the full caps of the straddling weeks. What is left then goes to the cheapest bars the
+full (unsplit) caps allow. The result is feasible for the full model; its
+gap is measured by the caller against the fast_solver bound.
+"""
+
+import os
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pulp import (LpMaximize, LpProblem, LpVariable, LpAffineExpression, LpConstraint,
+                  LpConstraintLE, LpConstraintGE, LpConstraintEQ, LpBinary, LpContinuous, PULP_CBC_CMD,
+                  LpSolutionOptimal, LpSolutionIntegerFeasible)
+from fast_solver import coin_weights, greedy_allocation
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+DECOMPOSITION_WORKERS = os.cpu_count() or 1
+DECOMPOSITION_ITERATIONS = 8   # MILP rounds (one solve per month each)
+DECOMPOSITION_MONTH_TIME_LIMIT = 10   # seconds per monthly MILP
+DECOMPOSITION_MASTER_SHARE = 0.2      # share of the overall time limit kept for the master
+DECOMPOSITION_MIN_SOLVE_SECONDS = 1   # no pricing round when less is left per monthly MILP
+
+def split_week_caps(month_codes, week_codes, weekly_limit, guide):
+    """
+    Returns (part_codes, part_caps): the week part (week x month cell) of
+    every bar and the share of weekly_limit each part may use, in proportion
+    to the guide plan's use of the parts (to bar counts where it buys nothing).
+    """
+    n_months = month_codes.max() + 1
+    n_weeks = week_codes.max() + 1
+    part_ids, part_codes = np.unique(week_codes.astype(np.int64) * n_months + month_codes, return_inverse=True)
+    part_week = part_ids // n_months
+
+    used = np.bincount(part_codes, weights=guide, minlength=len(part_ids))
+    bars = np.bincount(part_codes, minlength=len(part_ids)).astype(float)
+    week_used = np.bincount(part_week, weights=used, minlength=n_weeks)[part_week]
+    week_bars = np.bincount(part_week, weights=bars, minlength=n_weeks)[part_week]
+    share = np.where(week_used > 0, used / np.where(week_used > 0, week_used, 1.0), bars / week_bars)
+    return part_codes, weekly_limit * share
+
+class _MonthModel:
+    """MILP of one month; only its objective changes between rounds."""
+
+    def __init__(self, month, positions, weights, part_codes, part_caps, month_cap,
+                 min_invest, per_buy_max):
+        self.month = month
+        self.positions = positions
+        self.c = weights[positions]
+        self.model = LpProblem(name=f"month-{month}", sense=LpMaximize)
+        self.x = [LpVariable(f"invest_{i}", lowBound=0, upBound=per_buy_max, cat=LpContinuous)
+                  for i in range(len(positions))]
+        binaries = [LpVariable(f"binary_{i}", cat=LpBinary) for i in range(len(positions))]
+
+        self.model += LpConstraint(LpAffineExpression([(v, 1) for v in self.x]),
+                                   sense=LpConstraintLE, rhs=month_cap), "MonthLimit"
+        local_parts = part_codes[positions]
+        for p in np.unique(local_parts):
+            members = np.flatnonzero(local_parts == p)
+            self.model += LpConstraint(LpAffineExpression([(self.x[i], 1) for i in members]),
+                                       sense=LpConstraintLE, rhs=float(part_caps[p])), f"WeekPart_{p}"
+        for x, b in zip(self.x, binaries):
+            self.model += LpConstraint(LpAffineExpression([(x, 1), (b, -min_invest)]), sense=LpConstraintGE, rhs=0)
+            self.model += LpConstraint(LpAffineExpression([(x, 1), (b, -per_buy_max)]), sense=LpConstraintLE, rhs=0)
+
+    def solve(self, lam, time_limit, gap_rel):
+        reduced = self.c - lam
+        if reduced.max() <= 0:
+            return np.zeros(len(self.positions))
+        self.model.setObjective(LpAffineExpression(list(zip(self.x, reduced.tolist()))))
+        self.model.solve(PULP_CBC_CMD(msg=0, timeLimit=time_limit, gapRel=gap_rel, threads=1))
+        if self.model.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+            return np.zeros(len(self.positions))
+        x = np.array([v.varValue or 0.0 for v in self.x])
+        x[x <= 0.0] = 0.0
+        return x
+
+def lp_budget_price(weights, month_codes, part_codes, part_caps, month_cap, total_investment, per_buy_max):
+    """
+    Budget price of the LP relaxation of the split model: the lam at which
+    buying every bar with c_t > lam (within the part and month caps) spends
+    exactly the total budget. 0 when the budget is not binding.
+    """
+    def spend(lam):
+        amounts = np.where(weights > lam, float(per_buy_max), 0.0)
+        parts = np.minimum(np.bincount(part_codes, weights=amounts, minlength=len(part_caps)), part_caps)
+        part_month = np.zeros(len(part_caps), dtype=np.int64)
+        part_month[part_codes] = month_codes
+        return np.minimum(np.bincount(part_month, weights=parts), month_cap).sum()
+
+    if spend(0.0) <= total_investment:
+        return 0.0
+    lo, hi = 0.0, float(weights.max())
+    for _ in range(60):
+        mid = 0.5 * (lo + hi)
+        if spend(mid) > total_investment:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+def _solve_master(months, columns, week_codes, weekly_limit, total_investment, time_limit, gap_rel):
+    """
+    Pick one candidate plan per month with the most coins, within the total
+    budget and the full caps of the weeks shared by two months.
+    """
+    model = LpProblem(name="budget-master", sense=LpMaximize)
+    picks = [[LpVariable(f"pick_{i}_{k}", cat=LpBinary) for k in range(len(col))]
+             for i, col in enumerate(columns)]
+    model += LpAffineExpression([(y, float(mm.c @ plan))
+                                 for mm, col, ys in zip(months, columns, picks)
+                                 for plan, y in zip(col, ys)])
+    for i, ys in enumerate(picks):
+        model += LpConstraint(LpAffineExpression([(y, 1) for y in ys]), sense=LpConstraintEQ, rhs=1), f"Month_{i}"
+    model += LpConstraint(LpAffineExpression([(y, float(plan.sum()))
+                                              for col, ys in zip(columns, picks)
+                                              for plan, y in zip(col, ys)]),
+                          sense=LpConstraintLE, rhs=total_investment), "TotalInvestment"
+
+    shared = {}
+    for mm, col, ys in zip(months, columns, picks):
+        weeks = week_codes[mm.positions]
+        for plan, y in zip(col, ys):
+            for w, amount in zip(*_week_sums(weeks, plan)):
+                shared.setdefault(w, {}).setdefault(mm.month, []).append((y, amount))
+    for w, by_month in shared.items():
+        if len(by_month) > 1:
+            model += LpConstraint(LpAffineExpression([t for terms in by_month.values() for t in terms]),
+                                  sense=LpConstraintLE, rhs=weekly_limit), f"WeekLimit_{w}"
+
+    model.solve(PULP_CBC_CMD(msg=0, timeLimit=time_limit, gapRel=gap_rel))
+    if model.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+        logger.warning("Budget master problem not solved; buying nothing in the decomposed plan.")
+        return [col[0] for col in columns]
+    return [col[int(np.argmax([y.varValue or 0.0 for y in ys]))] for col, ys in zip(columns, picks)]
+
+def _week_sums(weeks, plan):
+    """(week codes, amounts) of the weeks a plan buys in."""
+    bought = plan > 0
+    codes, inverse = np.unique(weeks[bought], return_inverse=True)
+    return codes.tolist(), np.bincount(inverse, weights=plan[bought]).tolist()
+
+def solve_decomposed(opens, month_codes, week_codes, total_investment, monthly_limit, weekly_limit,
+                     min_invest, per_buy_max, start_x, guide, keep=None, gap_rel=None,
+                     time_limit=None, workers=DECOMPOSITION_WORKERS,
+                     iterations=DECOMPOSITION_ITERATIONS, month_time_limit=DECOMPOSITION_MONTH_TIME_LIMIT):
+    """
+    start_x: a feasible plan (the greedy one), offered month by month to the master.
+    guide: plan whose use of straddling weeks decides how their caps are split
+        (the fast_solver relaxed plan).
+    keep: bar positions allowed in the monthly models (presolve_bars output).
+    time_limit: seconds for the whole solve (None: no overall limit).
+        DECOMPOSITION_MASTER_SHARE of it is kept for the master; every
+        monthly MILP runs for at most month_time_limit or the pricing time
+        left when it starts. A round cut short by the deadline still offers
+        its monthly plans to the master, and no round starts after it.
+    Returns (invest array aligned with opens, info) where info has 'months',
+    'rounds', 'lambda' (the budget price of the returned plan, None when no
+    round fit the budget) and 'timed_out' (rounds stopped by time_limit).
+    """
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    master_reserve = 0.0 if time_limit is None else DECOMPOSITION_MASTER_SHARE * time_limit
+
+    def time_left():
+        return math.inf if deadline is None else deadline - time.perf_counter()
+
+    weights = coin_weights(opens)
+    month_codes = np.asarray(month_codes)
+    week_codes  = np.asarray(week_codes)
+    keep = np.arange(len(opens)) if keep is None else np.asarray(keep)
+    part_codes, part_caps = split_week_caps(month_codes, week_codes, weekly_limit, guide)
+
+    month_cap = min(monthly_limit, total_investment)
+    kept_months = month_codes[keep]
+    months = [
+        _MonthModel(m, keep[kept_months == m], weights, part_codes, part_caps,
+                    month_cap, min_invest, per_buy_max)
+        for m in np.unique(kept_months)
+    ]
+    lam0 = lp_budget_price(weights, month_codes, part_codes, part_caps, month_cap,
+                           total_investment, per_buy_max)
+
+    # Candidate plans per month: nothing, the month's part of the start plan
+    # and every plan of every pricing round.
+    start_x = np.asarray(start_x, dtype=float)
+    start_spend = np.bincount(month_codes, weights=start_x, minlength=month_codes.max() + 1)
+    columns = []
+    for mm in months:
+        columns.append([np.zeros(len(mm.positions))])
+        if np.isclose(start_x[mm.positions].sum(), start_spend[mm.month]):
+            columns[-1].append(start_x[mm.positions])
+
+    rounds, timed_out = 0, False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def solve_month(mm, lam):
+            limit = min(month_time_limit, time_left() - master_reserve)
+            return mm.solve(lam, limit, gap_rel) if limit >= DECOMPOSITION_MIN_SOLVE_SECONDS else None
+
+        def solve_round(lam):
+            """Total spend of the round, or None when the deadline cut it short."""
+            nonlocal rounds
+            rounds += 1
+            xs = list(pool.map(lambda mm: solve_month(mm, lam), months))
+            for col, x in zip(columns, xs):
+                if x is not None:
+                    col.append(x)
+            if any(x is None for x in xs):
+                return None
+            return sum(x.sum() for x in xs)
+
+        # Bracket the budget price around the LP estimate, widening until the
+        # months fit the budget on one side and overspend on the other, then bisect.
+        lam_lo, lam_hi = None, None
+        lam, step = lam0, 0.01 * max(lam0, 1e-12)
+        while rounds < iterations:
+            spent = solve_round(lam)
+            if spent is None:
+                timed_out = True
+                break
+            if spent <= total_investment + 1e-6:
+                lam_hi = lam
+                if total_investment - spent < min_invest or lam == 0.0:
+                    break
+            else:
+                lam_lo = lam
+            if lam_lo is None:
+                lam, step = max(lam - step, 0.0), 2 * step
+            elif lam_hi is None:
+                lam, step = lam + step, 2 * step
+            else:
+                lam = 0.5 * (lam_lo + lam_hi)
+
+    master_limit = month_time_limit if deadline is None else max(time_left(), DECOMPOSITION_MIN_SOLVE_SECONDS)
+    plans = _solve_master(months, columns, week_codes, weekly_limit, total_investment, master_limit, gap_rel)
+    x = np.zeros(len(opens))
+    for mm, xm in zip(months, plans):
+        x[mm.positions] = xm
+    # Whatever is still unspent goes to the cheapest bars the full caps allow,
+    # including the parts of straddling weeks the split left unused.
+    x = greedy_allocation(np.argsort(-weights, kind='stable'), month_codes, week_codes,
+                          total_investment, monthly_limit, weekly_limit, min_invest, per_buy_max,
+                          start=x)
+
+    info = {'months': len(months), 'rounds': rounds,
+            'lambda': None if lam_hi is None else float(lam_hi), 'timed_out': timed_out}
+    logger.info(f"Decomposed solve: {len(months)} months, {rounds} rounds{' (time limit)' if timed_out else ''}, "
+                f"{sum(len(col) for col in columns)} candidate plans, invested={x.sum():.2f}")
+    return x, info
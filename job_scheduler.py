@@ -0,0 +1,133 @@
+"""
+job_scheduler.py
+Fixed pool of backtest worker threads fed by a bounded queue.
+One job per chat at a time; duplicate submissions are dropped.
+"""
+
+import math
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from metrics import register_gauges
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+BACKTEST_WORKERS = 2
+MAX_QUEUED_JOBS  = 20
+DEFAULT_RUN_SECONDS = 60.0  # used for wait estimates until real run times exist
+STATS_WINDOW = 100
+
+class JobScheduler:
+    """
+    submit() returns a dict with 'status':
+      - 'queued'    : accepted; 'position' (1 = next to start) and 'eta_seconds'
+      - 'duplicate' : this key already has a queued or running job
+      - 'full'      : the queue is at capacity
+    """
+
+    def __init__(self, num_workers=BACKTEST_WORKERS, max_queue=MAX_QUEUED_JOBS):
+        self.num_workers = max(1, int(num_workers))
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._active = set()
+        self._workers = []
+        self._running = 0
+        self._wait_times = deque(maxlen=STATS_WINDOW)
+        self._run_times  = deque(maxlen=STATS_WINDOW)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.duplicates = 0
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._worker_loop, name=f"backtest-worker-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+        logger.info(f"Job scheduler started with {self.num_workers} workers, queue size {self._queue.maxsize}.")
+
+    def submit(self, key, func, *args):
+        self.start()
+        with self._lock:
+            if key in self._active:
+                self.duplicates += 1
+                logger.info(f"Dropped duplicate job for {key}.")
+                return {'status': 'duplicate'}
+            try:
+                self._queue.put_nowait((key, func, args, time.time()))
+            except queue.Full:
+                self.rejected += 1
+                logger.warning(f"Job queue full, rejected job for {key}.")
+                return {'status': 'full'}
+            # Workers clear the key under the same lock, so this cannot race them.
+            self._active.add(key)
+            position = self._queue.qsize()
+            eta = self._estimate_wait(position)
+        logger.info(f"Queued job for {key}: position={position}, eta={eta:.0f}s")
+        return {'status': 'queued', 'position': position, 'eta_seconds': eta}
+
+    def _estimate_wait(self, position):
+        """Rounds of work ahead of this job times the mean run time."""
+        free = self.num_workers - self._running
+        if position <= free:
+            return 0.0
+        avg_run = sum(self._run_times) / len(self._run_times) if self._run_times else DEFAULT_RUN_SECONDS
+        return math.ceil((position - free) / self.num_workers) * avg_run
+
+    def _worker_loop(self):
+        while True:
+            key, func, args, enqueued_at = self._queue.get()
+            started = time.time()
+            with self._lock:
+                self._running += 1
+                self._wait_times.append(started - enqueued_at)
+            ok = True
+            try:
+                func(*args)
+            except Exception as e:
+                ok = False
+                logger.error(f"Job for {key} failed: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_times.append(time.time() - started)
+                    self._active.discard(key)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            waits, runs = list(self._wait_times), list(self._run_times)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'running': self._running,
+                'workers': self.num_workers,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'duplicates': self.duplicates,
+                'avg_wait_seconds': sum(waits) / len(waits) if waits else 0.0,
+                'max_wait_seconds': max(waits) if waits else 0.0,
+                'avg_run_seconds': sum(runs) / len(runs) if runs else 0.0,
+                'max_run_seconds': max(runs) if runs else 0.0
+            }
+
+job_scheduler = JobScheduler()
+
+def _scheduler_gauges():
+    stats = job_scheduler.stats()
+    return [
+        ('dca_job_queue_depth', "Backtest jobs waiting in the queue.", stats['queue_depth'], {}),
+        ('dca_jobs_running', "Backtest jobs being run.", stats['running'], {})
+    ]
+
+register_gauges(_scheduler_gauges)
@@ -44,54 +44,62 @@ MESSAGES = {
             "For example: `BTCUSDT`, `ETHUSDT`, or `SOLUSDT`.\n\n"
             "Feel free to type it in or choose from the provided options."
         ),
+        "ask_crypto_interval": (
+            "🔸 **Step 2: Candle Interval**\n\n"
+            "⏱ *Choose the candle interval of the crypto prices.*\n"
+            "The optimizer and the blind DCA can buy at the open of any candle. "
+            "Shorter candles give more buy points but take longer to download and solve."
+        ),
+        "interval_invalid": "❗ Unsupported interval. Please choose one of: {intervals}",
         "ask_total_investment": (
-            "🔸 **Step 2: Investment Amount**\n\n"
+            "🔸 **Step 3: Investment Amount**\n\n"
             "💰 *Enter your total investment budget in USDT.*\n"
             "For example: `10000`"
         ),
         "ask_start_date": (
-            "🔸 **Step 3: Backtest Start Date**\n\n"
+            "🔸 **Step 4: Backtest Start Date**\n\n"
             "📅 *Enter the start date for the backtest (YYYY-MM-DD).*\n"
             "For example: `2024-01-01`"
         ),
         "ask_end_date": (
-            "🔸 **Step 4: Backtest End Date**\n\n"
+            "🔸 **Step 5: Backtest End Date**\n\n"
             "📅 *Enter the end date for the backtest (YYYY-MM-DD).*\n"
             "For example: `2025-02-01`"
         ),
         "ask_monthly_limit": (
-            "🔸 **Step 5: Monthly Investment Limit**\n\n"
+            "🔸 **Step 6: Monthly Investment Limit**\n\n"
             "💳 *Enter the maximum amount you will invest per month (in USDT).*\n"
             "For example: `750`"
         ),
         "ask_weekly_limit": (
-            "🔸 **Step 6: Weekly Investment Limit**\n\n"
+            "🔸 **Step 7: Weekly Investment Limit**\n\n"
             "💳 *Enter the maximum amount you will invest per week (in USDT).*\n"
             "For example: `200`"
         ),
         "ask_min_invest": (
-            "🔸 **Step 7: Minimum Investment per Buy**\n\n"
+            "🔸 **Step 8: Minimum Investment per Buy**\n\n"
             "📉 *Enter the minimum amount to invest per purchase (in USDT).*\n"
             "For example: `50`"
         ),
         "ask_max_invest": (
-            "🔸 **Step 8: Maximum Investment per Buy**\n\n"
+            "🔸 **Step 9: Maximum Investment per Buy**\n\n"
             "📈 *Enter the maximum amount to invest per purchase (in USDT).*\n"
             "For example: `50`"
         ),
         "ask_blind_freq1": (
-            "🔸 **Step 9: Blind DCA Frequency (Strategy 1)**\n\n"
+            "🔸 **Step 10: Blind DCA Frequency (Strategy 1)**\n\n"
             "⏱️ *Enter the frequency (in days) for blind DCA purchases using Strategy 1.*\n"
             "For example: `7` "
         ),
         "ask_blind_freq2": (
-            "🔸 **Step 10: Blind DCA Frequency (Strategy 2)**\n\n"
+            "🔸 **Step 11: Blind DCA Frequency (Strategy 2)**\n\n"
             "⏱️ *Enter the frequency (in days) for blind DCA purchases using Strategy 2.*\n"
             "For example: `14` "
         ),
         "confirm_inputs": (
             "✅ **Please review your inputs:**\n\n"
             "• **Crypto Pair:** `{crypto_pair}`\n"
+            "• **Candle Interval:** `{crypto_interval}`\n"
             "• **Total Investment:** `{total_investment}` USDT\n"
             "• **Start Date:** `{start_date}`\n"
             "• **End Date:** `{end_date}`\n"
@@ -141,7 +149,24 @@ MESSAGES = {
             "⚠️ The end date cannot be earlier than the start date. "
             "Please enter a valid end date in the format YYYY-MM-DD."
         ),
-        "inputs_confirmed": "✅ Inputs confirmed. Proceeding with analysis..."
+        "inputs_confirmed": "✅ Inputs confirmed. Proceeding with analysis...",
+        "job_queued": (
+            "⏳ *Your backtest is number {position} in the queue.*\n"
+            "Estimated wait: about {eta_minutes} min."
+        ),
+        "job_duplicate": "⏳ Your backtest is already queued or running. Please wait for the results.",
+        "queue_full": "🚦 The bot is busy right now. Please tap *Yes* again in a few minutes.",
+        "tweak_offer": (
+            "🔧 *What if?*\n"
+            "For the next {ttl_minutes} minutes you can change one limit and get the optimized plans again in seconds."
+        ),
+        "tweak_ask_value": "✏️ Current *{param}*: `{current}` USDT. Enter the new value:",
+        "tweak_expired": "⌛ The what-if data of this run has expired. Please type /start to run a new analysis.",
+        "tweak_queue_full": "🚦 The bot is busy right now. Please send the value again in a few minutes.",
+        "tweak_param_total_investment": "Total Investment",
+        "tweak_param_monthly_limit": "Monthly Limit",
+        "tweak_param_weekly_limit": "Weekly Limit",
+        "tweak_param_per_buy_max": "Maximum per Buy"
     },
     "fa": {
         "welcome_intro": (
@@ -177,54 +202,62 @@ MESSAGES = {
             "برای مثال: `BTCUSDT`، `ETHUSDT` یا `SOLUSDT`.\n\n"
             "می‌توانید تایپ کنید یا از گزینه‌های پیشنهادی استفاده نمایید."
         ),
+        "ask_crypto_interval": (
+            "🔸 **مرحله ۲: بازه زمانی کندل**\n\n"
+            "⏱ *بازه زمانی کندل‌های قیمت ارز دیجیتال را انتخاب کنید.*\n"
+            "بهینه‌ساز و DCA کور می‌توانند در ابتدای هر کندل خرید کنند. "
+            "کندل‌های کوتاه‌تر نقاط خرید بیشتری می‌دهند اما دانلود و حل آن‌ها طولانی‌تر است."
+        ),
+        "interval_invalid": "❗ بازه زمانی پشتیبانی نمی‌شود. لطفاً یکی از این گزینه‌ها را انتخاب کنید: {intervals}",
         "ask_total_investment": (
-            "🔸 **مرحله ۲: مقدار سرمایه‌گذاری**\n\n"
+            "🔸 **مرحله ۳: مقدار سرمایه‌گذاری**\n\n"
             "💰 *بودجه کل سرمایه‌گذاری خود (به دلار) را وارد کنید.*\n"
             "برای مثال: `10000`"
         ),
         "ask_start_date": (
-            "🔸 **مرحله ۳: تاریخ شروع تحلیل**\n\n"
+            "🔸 **مرحله ۴: تاریخ شروع تحلیل**\n\n"
             "📅 *تاریخ شروع تحلیل را به فرمت YYYY-MM-DD وارد کنید.*\n"
             "برای مثال: `01-01-2024`"
         ),
         "ask_end_date": (
-            "🔸 **مرحله ۴: تاریخ پایان تحلیل**\n\n"
+            "🔸 **مرحله ۵: تاریخ پایان تحلیل**\n\n"
             "📅 *تاریخ پایان تحلیل را به فرمت YYYY-MM-DD وارد کنید.*\n"
             "برای مثال: `01-01-2025`"
         ),
         "ask_monthly_limit": (
-            "🔸 **مرحله ۵: حد سرمایه‌گذاری ماهانه**\n\n"
+            "🔸 **مرحله ۶: حد سرمایه‌گذاری ماهانه**\n\n"
             "💳 *حداکثر مبلغ سرمایه‌گذاری ماهانه (به دلار) را وارد کنید.*\n"
             "برای مثال: `750`"
         ),
         "ask_weekly_limit": (
-            "🔸 **مرحله ۶: حد سرمایه‌گذاری هفتگی**\n\n"
+            "🔸 **مرحله ۷: حد سرمایه‌گذاری هفتگی**\n\n"
             "💳 *حداکثر مبلغ سرمایه‌گذاری هفتگی (به دلار) را وارد کنید.*\n"
             "برای مثال: `200`"
         ),
         "ask_min_invest": (
-            "🔸 **مرحله ۷: حداقل سرمایه‌گذاری در هر خرید**\n\n"
+            "🔸 **مرحله ۸: حداقل سرمایه‌گذاری در هر خرید**\n\n"
             "📉 *کمترین مبلغ سرمایه‌گذاری در هر خرید (به دلار) را وارد کنید.*\n"
             "برای مثال: `50`"
         ),
         "ask_max_invest": (
-            "🔸 **مرحله ۸: حداکثر سرمایه‌گذاری در هر خرید**\n\n"
+            "🔸 **مرحله ۹: حداکثر سرمایه‌گذاری در هر خرید**\n\n"
             "📈 *بیشترین مبلغ سرمایه‌گذاری در هر خرید (به دلار) را وارد کنید.*\n"
             "برای مثال: `50`"
         ),
         "ask_blind_freq1": (
-            "🔸 **مرحله ۹: فاصله زمانی کور DCA (استراتژی ۱)**\n\n"
+            "🔸 **مرحله ۱۰: فاصله زمانی کور DCA (استراتژی ۱)**\n\n"
             "⏱️ *تعداد روزهای مد نظر برای خریدهای کور DCA (استراتژی ۱) را وارد کنید.*\n"
             "برای مثال: `7` "
         ),
         "ask_blind_freq2": (
-            "🔸 **مرحله ۱۰: فاصله زمانی کور DCA (استراتژی ۲)**\n\n"
+            "🔸 **مرحله ۱۱: فاصله زمانی کور DCA (استراتژی ۲)**\n\n"
             "⏱️ *تعداد روزهای مد نظر برای خریدهای کور DCA (استراتژی ۲) را وارد کنید.*\n"
             "برای مثال: `14` "
         ),
         "confirm_inputs": (
             "✅ **لطفاً ورودی‌های خود را مرور کنید:**\n\n"
             "• **جفت ارز:** `{crypto_pair}`\n"
+            "• **بازه زمانی کندل:** `{crypto_interval}`\n"
             "• **بودجه کل:** `{total_investment}` دلار\n"
             "• **تاریخ شروع:** `{start_date}`\n"
             "• **تاریخ پایان:** `{end_date}`\n"
@@ -274,7 +307,24 @@ MESSAGES = {
             "⚠️ تاریخ پایان نباید قبل از تاریخ شروع باشد. "
             "لطفاً یک تاریخ پایان معتبر (YYYY-MM-DD) وارد کنید."
         ),
-        "inputs_confirmed": "✅ ورودی‌ها تأیید شدند. در حال ادامه تحلیل..."
+        "inputs_confirmed": "✅ ورودی‌ها تأیید شدند. در حال ادامه تحلیل...",
+        "job_queued": (
+            "⏳ *بک‌تست شما نفر {position} در صف است.*\n"
+            "زمان تقریبی انتظار: حدود {eta_minutes} دقیقه."
+        ),
+        "job_duplicate": "⏳ بک‌تست شما در صف یا در حال اجراست. لطفاً منتظر نتایج بمانید.",
+        "queue_full": "🚦 ربات در حال حاضر مشغول است. لطفاً چند دقیقه دیگر دوباره *بله* را بزنید.",
+        "tweak_offer": (
+            "🔧 *اگر...؟*\n"
+            "تا {ttl_minutes} دقیقه می‌توانید یکی از محدودیت‌ها را تغییر دهید و برنامه‌های بهینه را در چند ثانیه دوباره ببینید."
+        ),
+        "tweak_ask_value": "✏️ مقدار فعلی *{param}*: `{current}` دلار. مقدار جدید را وارد کنید:",
+        "tweak_expired": "⌛ داده‌های این تحلیل منقضی شده است. لطفاً /start را وارد کنید تا تحلیل جدیدی شروع شود.",
+        "tweak_queue_full": "🚦 ربات در حال حاضر مشغول است. لطفاً چند دقیقه دیگر دوباره مقدار را بفرستید.",
+        "tweak_param_total_investment": "سرمایه کل",
+        "tweak_param_monthly_limit": "حد ماهانه",
+        "tweak_param_weekly_limit": "حد هفتگی",
+        "tweak_param_per_buy_max": "حداکثر در هر خرید"
     }
 }
 
@@ -0,0 +1,222 @@
+"""
+metrics.py
+In-process timers, counters and histograms for the backtest pipeline.
+
+  - timer(name, **labels): context manager observing wall seconds into the
+    histogram `name` (timed() is the decorator form)
+  - count(name, amount=1, **labels): add to the counter `name`
+  - job(label): per-job breakdown; every timer observed in the same thread
+    while the job runs is summed and logged as one line when it ends
+  - register_gauges(callback): callback() returns (name, help, value, labels)
+    tuples read at scrape time (queue depth, cache hit rates, ...)
+
+Histograms keep Prometheus buckets plus the last QUANTILE_WINDOW samples,
+from which summary_by() reports p50/p95. start_metrics_server() serves
+the Prometheus text format on METRICS_HOST:METRICS_PORT (localhost only).
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+QUANTILE_WINDOW = 1024
+
+HELP = {
+    'dca_stage_seconds': "Wall time of one pipeline stage.",
+    'dca_scenario_seconds': "Wall time of one scenario in a worker process.",
+    'dca_db_seconds': "Wall time of one database call.",
+    'dca_external_request_seconds': "Wall time of one HTTP request to a data provider.",
+    'dca_external_requests_total': "HTTP requests to data providers by outcome.",
+    'dca_jobs_total': "Finished backtest jobs by outcome."
+}
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=QUANTILE_WINDOW)
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        return float(np.quantile(self.recent, q)) if self.recent else 0.0
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = OrderedDict()  # (name, labels) -> Histogram
+        self._counters = OrderedDict()    # (name, labels) -> float
+        self._gauge_callbacks = []
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_gauges(self, callback):
+        with self._lock:
+            self._gauge_callbacks.append(callback)
+
+    def summary(self, name):
+        """{labels: {'count', 'p50', 'p95', 'sum'}} of every histogram called `name`."""
+        with self._lock:
+            return OrderedDict(
+                (labels, {'count': h.count, 'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'sum': h.sum})
+                for (n, labels), h in self._histograms.items() if n == name
+            )
+
+    def gauges(self):
+        with self._lock:
+            callbacks = list(self._gauge_callbacks)
+        values = []
+        for callback in callbacks:
+            try:
+                values.extend(callback())
+            except Exception as e:
+                logger.warning(f"Gauge callback failed: {e}")
+        return values
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        seen = set()
+        for (name, labels), h in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            for upper, n in zip(h.buckets, h.bucket_counts):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(upper)),))} {n}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {h.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {h.sum:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        for name, help_text, value, labels in self.gauges():
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+registry = MetricsRegistry()
+_current = threading.local()
+
+def observe(name, value, **labels):
+    """Record one sample in the histogram `name` (and in the running job's breakdown)."""
+    registry.observe(name, value, **labels)
+    breakdown = getattr(_current, 'breakdown', None)
+    if breakdown is not None:
+        key = ":".join([name.replace('dca_', '').replace('_seconds', '')] + [str(v) for _, v in sorted(labels.items())])
+        total, n = breakdown.get(key, (0.0, 0))
+        breakdown[key] = (total + value, n + 1)
+
+def count(name, amount=1, **labels):
+    registry.count(name, amount, **labels)
+
+def register_gauges(callback):
+    registry.register_gauges(callback)
+
+@contextmanager
+def timer(name, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+def timed(name, **labels):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def stage(name):
+    """timer() for a pipeline stage."""
+    return timer('dca_stage_seconds', stage=name)
+
+@contextmanager
+def job(label):
+    """Collect the timers of this thread until the block ends and log them as one line."""
+    _current.breakdown = OrderedDict()
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        breakdown, _current.breakdown = _current.breakdown, None
+        count('dca_jobs_total', outcome=outcome)
+        parts = [f"{key}={total:.2f}s" + (f"/{n}" if n > 1 else "") for key, (total, n) in breakdown.items()]
+        logger.info(f"Job timings {label}: total={time.perf_counter() - t0:.2f}s ({outcome}) | " + ", ".join(parts))
+
+def summary_by(name, label):
+    """{value of `label`: {'count', 'p50', 'p95', 'sum'}} of the histograms called `name`."""
+    return OrderedDict((dict(labels)[label], s) for labels, s in registry.summary(name).items())
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"metrics scrape: {format % args}")
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics from a daemon thread. Returns the server, or None if the port is taken."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+    return server
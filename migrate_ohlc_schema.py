@@ -0,0 +1,222 @@
+"""
+migrate_ohlc_schema.py
+Online migration of crypto_ohlc, gold_ohlc and usd_ohlc from the TEXT `date`
+schema to the typed one of database_manager.ohlc_table_ddl (timestamptz
+bar_time, interval column, composite primary key, BRIN index).
+
+For every table still on the TEXT schema:
+  1. create <table>_typed and a trigger mirroring every insert, update and
+     delete on the old table into it, so the bot can keep running;
+  2. copy the existing rows over in keyset-ordered batches, one short
+     transaction each (rows the trigger already mirrored are kept);
+  3. swap the tables in one short transaction after checking the row counts:
+     the old one is kept as <table>_text_legacy.
+
+Restart the bot on the new code right after the swap. The script can be
+re-run after an interruption; it resumes with the tables still on TEXT.
+After the swap it also drops the gold_ohlc rows that old versions had
+overwritten with USD prices (cache_manager.drop_converted_gold), so the bot
+downloads the raw IRR prices again; re-running it is harmless.
+
+    python migrate_ohlc_schema.py
+    python migrate_ohlc_schema.py --no-swap        # backfill only, keep mirroring
+    python migrate_ohlc_schema.py --drop-legacy    # drop the *_text_legacy tables
+"""
+
+import time
+import logging
+import argparse
+from database_manager import (get_connection, put_connection, init_db, ohlc_table_ddl,
+                              legacy_ohlc_tables, OHLC_TABLE_INTERVALS)
+from cache_manager import drop_converted_gold
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+MIGRATION_BATCH_ROWS = 50000
+LEGACY_SUFFIX = "_text_legacy"
+# Rows whose TEXT date cannot be a bar time are skipped (and counted)
+VALID_DATE = r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}(:\d{2})?)?$"
+
+def _keys(table_name):
+    return ['symbol', 'date'] if table_name == "crypto_ohlc" else ['date']
+
+def _typed_columns(table_name):
+    return (['symbol'] if table_name == "crypto_ohlc" else []) + ['interval', 'bar_time', 'open', 'high', 'low', 'close']
+
+def _typed_values(table_name, row):
+    """SQL expressions of the typed columns from a legacy row alias (`row.date` etc.)."""
+    interval = OHLC_TABLE_INTERVALS[table_name]
+    symbol = [f"{row}.symbol"] if table_name == "crypto_ohlc" else []
+    return symbol + [f"'{interval}'", f"{row}.date::timestamp AT TIME ZONE 'UTC'",
+                     f"{row}.open", f"{row}.high", f"{row}.low", f"{row}.close"]
+
+def _conflict_key(table_name):
+    return "symbol, interval, bar_time" if table_name == "crypto_ohlc" else "interval, bar_time"
+
+def _run(statements, params=None):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        for statement in statements:
+            cur.execute(statement, params)
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        put_connection(conn)
+
+def create_mirror(table_name):
+    typed = f"{table_name}_typed"
+    interval = OHLC_TABLE_INTERVALS[table_name]
+    symbol_match = "symbol = OLD.symbol AND " if table_name == "crypto_ohlc" else ""
+    columns = ", ".join(_typed_columns(table_name))
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in ('open', 'high', 'low', 'close'))
+    _run(ohlc_table_ddl(table_name, target=typed) + [
+        f'''
+        CREATE OR REPLACE FUNCTION {table_name}_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.date ~ '{VALID_DATE}' THEN
+                DELETE FROM {typed}
+                WHERE {symbol_match}interval = '{interval}'
+                  AND bar_time = OLD.date::timestamp AT TIME ZONE 'UTC';
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF NEW.date ~ '{VALID_DATE}' THEN
+                    INSERT INTO {typed} ({columns})
+                    VALUES ({", ".join(_typed_values(table_name, "NEW"))})
+                    ON CONFLICT ({_conflict_key(table_name)}) DO UPDATE SET {updates};
+                END IF;
+                RETURN NEW;
+            END IF;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql;
+        ''',
+        f"DROP TRIGGER IF EXISTS {table_name}_mirror ON {table_name};",
+        f'''
+        CREATE TRIGGER {table_name}_mirror
+        AFTER INSERT OR UPDATE OR DELETE ON {table_name}
+        FOR EACH ROW EXECUTE FUNCTION {table_name}_mirror();
+        '''
+    ])
+    logger.info(f"{table_name}: created {typed} and the mirror trigger.")
+
+def backfill(table_name, batch_rows=MIGRATION_BATCH_ROWS):
+    """Copy the legacy rows in key order; returns the number of rows copied."""
+    keys = _keys(table_name)
+    key_list = ", ".join(keys)
+    columns = ", ".join(_typed_columns(table_name))
+    last, copied = None, 0
+    t0 = time.perf_counter()
+    while True:
+        after = f"AND ({key_list}) > ({', '.join(['%s'] * len(keys))})" if last else ""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f'''
+                WITH batch AS (
+                    SELECT * FROM {table_name}
+                    WHERE date ~ %s {after}
+                    ORDER BY {key_list}
+                    LIMIT %s
+                ), copied AS (
+                    INSERT INTO {table_name}_typed ({columns})
+                    SELECT {", ".join(_typed_values(table_name, "batch"))} FROM batch
+                    ON CONFLICT ({_conflict_key(table_name)}) DO NOTHING
+                )
+                SELECT {key_list}, (SELECT COUNT(*) FROM batch)
+                FROM batch ORDER BY {", ".join(f"{k} DESC" for k in keys)} LIMIT 1
+            ''', [VALID_DATE] + list(last or []) + [batch_rows])
+            row = cur.fetchone()
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            put_connection(conn)
+        if row is None:
+            break
+        last, copied = row[:-1], copied + row[-1]
+        logger.info(f"{table_name}: {copied} rows copied ({copied / (time.perf_counter() - t0):,.0f} rows/s).")
+    return copied
+
+def swap(table_name):
+    """Replace the legacy table by the typed one if both hold the same bars."""
+    legacy = f"{table_name}{LEGACY_SUFFIX}"
+    typed = f"{table_name}_typed"
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"LOCK TABLE {table_name} IN EXCLUSIVE MODE")  # readers go on, writers wait
+        symbol = "symbol, " if table_name == "crypto_ohlc" else ""
+        cur.execute(f'''
+            SELECT (SELECT COUNT(*) FROM {table_name}),
+                   (SELECT COUNT(*) FROM (
+                        SELECT DISTINCT {symbol}date::timestamp FROM {table_name} WHERE date ~ %s
+                    ) bars)
+        ''', (VALID_DATE,))
+        total, valid = cur.fetchone()
+        cur.execute(f"SELECT COUNT(*) FROM {typed}")
+        typed_rows = cur.fetchone()[0]
+        if typed_rows != valid:
+            raise RuntimeError(f"{table_name}: {valid} legacy bars but {typed_rows} typed rows; not swapping.")
+        cur.execute(f"DROP TRIGGER {table_name}_mirror ON {table_name}")
+        cur.execute(f"DROP FUNCTION {table_name}_mirror()")
+        cur.execute(f"ALTER TABLE {table_name} RENAME TO {legacy}")
+        cur.execute(f"ALTER INDEX IF EXISTS {table_name}_pkey RENAME TO {legacy}_pkey")
+        cur.execute(f"ALTER TABLE {typed} RENAME TO {table_name}")
+        cur.execute(f"ALTER INDEX {typed}_pkey RENAME TO {table_name}_pkey")
+        cur.execute(f"ALTER INDEX {typed}_bar_time_brin RENAME TO {table_name}_bar_time_brin")
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        put_connection(conn)
+    if total != valid:
+        logger.warning(f"{table_name}: {total - valid} rows had an unparseable or duplicate date (kept in {legacy}).")
+    logger.info(f"{table_name}: swapped in the typed table ({typed_rows} rows); old one kept as {legacy}.")
+
+def drop_legacy():
+    for table_name in OHLC_TABLE_INTERVALS:
+        _run([f"DROP TABLE IF EXISTS {table_name}{LEGACY_SUFFIX}"])
+        logger.info(f"Dropped {table_name}{LEGACY_SUFFIX} (if it existed).")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-rows', type=int, default=MIGRATION_BATCH_ROWS)
+    parser.add_argument('--no-swap', action='store_true', help="backfill only; the trigger keeps mirroring")
+    parser.add_argument('--drop-legacy', action='store_true', help="drop the *_text_legacy tables and exit")
+    args = parser.parse_args()
+
+    if args.drop_legacy:
+        drop_legacy()
+        return
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        legacy = legacy_ohlc_tables(cur)
+        cur.close()
+    finally:
+        put_connection(conn)
+    if not legacy:
+        logger.info("All OHLC tables already use the typed schema.")
+    for table_name in legacy:
+        create_mirror(table_name)
+        backfill(table_name, args.batch_rows)
+        if not args.no_swap:
+            swap(table_name)
+
+    if not args.no_swap:
+        init_db()  # creates whatever is missing (ohlc_coverage, ...)
+        drop_converted_gold()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+milp_solvers.py
+Pluggable MILP engines for the DCA buying model of optimization_model.py.
+
+Every engine is called as engine(df, month_codes, week_codes, total_investment,
+monthly_limit, weekly_limit, min_invest, per_buy_max, fee_percent, context,
+time_limit, gap_rel, threads, start) and returns (invest, status, bound):
+  - invest: amounts aligned with the rows of df (None when no plan was found)
+  - status: "optimal", "time_limit", or the engine's status text on failure
+  - bound:  the engine's proven upper bound on the coins (None if unknown)
+
+Engines:
+  - "highs": the constraint matrix is built directly from the arrays as a
+             scipy sparse matrix and solved in-process by HiGHS through
+             scipy.optimize.milp; no model file, no subprocess. HiGHS via
+             scipy takes no start solution and no thread count.
+             HighsModel keeps that matrix for re-solves with other limits.
+  - "cbc"  : the PuLP model from define_ilp_model solved by the CBC binary,
+             warm-started from `start`; kept for cross-checking.
+"""
+
+import os
+import re
+import logging
+import tempfile
+import numpy as np
+from pulp import PULP_CBC_CMD, LpStatus, LpSolution, LpSolutionOptimal, LpSolutionIntegerFeasible, value
+from optimization_model import define_ilp_model
+from fast_solver import coin_weights
+
+try:
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from scipy.sparse import coo_matrix
+except ImportError:  # scipy < 1.9 or not installed
+    milp = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+MILP_ENGINES = {}
+
+def register_engine(name):
+    def register(func):
+        MILP_ENGINES[name] = func
+        return func
+    return register
+
+def available_engines():
+    return [name for name in MILP_ENGINES if name != "highs" or milp is not None]
+
+def get_engine(name):
+    """The engine called `name`; "highs" falls back to "cbc" when scipy.optimize.milp is missing."""
+    if name == "highs" and milp is None:
+        logger.warning("scipy.optimize.milp not available, using CBC instead of HiGHS.")
+        name = "cbc"
+    if name not in MILP_ENGINES:
+        raise ValueError(f"Unknown MILP engine '{name}'.")
+    return name, MILP_ENGINES[name]
+
+def dca_constraint_matrix(month_codes, week_codes, min_invest, per_buy_max):
+    """
+    Sparse rows of the model over the columns [x_0..x_{n-1}, b_0..b_{n-1}]:
+    total, one row per month, one row per week, then x_t - min_invest*b_t
+    and x_t - per_buy_max*b_t for every bar. Returns (A, n_months, n_weeks).
+    """
+    n = len(month_codes)
+    n_months = int(month_codes.max()) + 1
+    n_weeks = int(week_codes.max()) + 1
+    bars = np.arange(n)
+    link_min = 1 + n_months + n_weeks
+    link_max = link_min + n
+
+    rows = np.concatenate([
+        np.zeros(n, dtype=np.int64),            # total
+        1 + month_codes,                        # months
+        1 + n_months + week_codes,              # weeks
+        link_min + bars, link_min + bars,       # x - min*b >= 0
+        link_max + bars, link_max + bars,       # x - max*b <= 0
+    ])
+    cols = np.concatenate([bars, bars, bars, bars, n + bars, bars, n + bars])
+    data = np.concatenate([
+        np.ones(3 * n),
+        np.ones(n), np.full(n, -float(min_invest)),
+        np.ones(n), np.full(n, -float(per_buy_max)),
+    ])
+    A = coo_matrix((data, (rows, cols)), shape=(link_max + n, 2 * n)).tocsr()
+    return A, n_months, n_weeks
+
+class HighsModel:
+    """
+    The sparse model of one price series, kept between solves. The limits
+    only set row bounds and per_buy_max only the x - per_buy_max*b
+    coefficients and the x bounds, so a re-solve with other limits
+    (what_if.py) reuses the matrix instead of building a new one.
+    """
+
+    def __init__(self, weights, month_codes, week_codes, min_invest, per_buy_max):
+        self.weights = np.asarray(weights, dtype=float)
+        self.n = len(self.weights)
+        self.A, self.n_months, self.n_weeks = dca_constraint_matrix(
+            np.asarray(month_codes), np.asarray(week_codes), min_invest, per_buy_max)
+        self.n_caps = 1 + self.n_months + self.n_weeks
+        self.row_lb = np.concatenate([np.full(self.n_caps, -np.inf), np.zeros(self.n), np.full(self.n, -np.inf)])
+        self.row_ub = np.concatenate([np.full(self.n_caps, np.inf), np.full(self.n, np.inf), np.zeros(self.n)])
+        rows = np.repeat(np.arange(self.A.shape[0]), np.diff(self.A.indptr))
+        self._max_entries = np.flatnonzero((rows >= self.n_caps + self.n) & (self.A.indices >= self.n))
+        self.per_buy_max = float(per_buy_max)
+
+    def set_limits(self, total_investment, monthly_limit, weekly_limit):
+        self.row_ub[0] = total_investment
+        self.row_ub[1:1 + self.n_months] = monthly_limit
+        self.row_ub[1 + self.n_months:self.n_caps] = weekly_limit
+
+    def set_per_buy_max(self, per_buy_max):
+        self.per_buy_max = float(per_buy_max)
+        self.A.data[self._max_entries] = -self.per_buy_max
+
+    def solve(self, time_limit, gap_rel, keep=None):
+        """
+        Solve over the bars in `keep` (all bars by default). Returns
+        (invest aligned with all bars or None, status, bound) like an engine.
+        """
+        n = self.n
+        keep = np.arange(n) if keep is None else np.asarray(keep)
+        A, row_lb, row_ub = self.A, self.row_lb, self.row_ub
+        if len(keep) < n:
+            rows = np.concatenate([np.arange(self.n_caps), self.n_caps + keep, self.n_caps + n + keep])
+            A = A[rows][:, np.concatenate([keep, n + keep])]
+            row_lb, row_ub = row_lb[rows], row_ub[rows]
+        m = len(keep)
+        weights = self.weights[keep]
+        # Coins per USDT are tiny for expensive assets; scale to keep HiGHS tolerances meaningful.
+        scale = 1.0 / weights.max()
+
+        res = milp(
+            c=np.concatenate([-weights * scale, np.zeros(m)]),
+            integrality=np.concatenate([np.zeros(m), np.ones(m)]),
+            bounds=Bounds(np.zeros(2 * m), np.concatenate([np.full(m, self.per_buy_max), np.ones(m)])),
+            constraints=LinearConstraint(A, row_lb, row_ub),
+            options={'time_limit': time_limit, 'mip_rel_gap': gap_rel, 'disp': False}
+        )
+        logger.info(f"HiGHS status {res.status}: {res.message}")
+        bound = getattr(res, 'mip_dual_bound', None)
+        bound = -bound / scale if bound is not None and np.isfinite(bound) else None
+        if res.x is None:
+            return None, res.message, bound
+
+        invest = np.zeros(n)
+        invest[keep] = res.x[:m]
+        # Amounts below min_invest only appear through integrality tolerance on b.
+        invest[invest < 1e-6] = 0.0
+        return invest, "optimal" if res.status == 0 else "time_limit", bound
+
+@register_engine("highs")
+def solve_highs(df, month_codes, week_codes, total_investment, monthly_limit, weekly_limit,
+                min_invest, per_buy_max, fee_percent, context, time_limit, gap_rel, threads, start):
+    model = HighsModel(coin_weights(df['Open'].to_numpy(dtype=float)), month_codes, week_codes,
+                       min_invest, per_buy_max)
+    model.set_limits(total_investment, monthly_limit, weekly_limit)
+    return model.solve(time_limit, gap_rel)
+
+_CBC_BOUND_RE = re.compile(r"best possible (-?[0-9.eE+-]+)")
+
+def _cbc_best_bound(log_path):
+    """Last 'best possible' objective CBC logged (absolute value: CBC logs maximization negated)."""
+    try:
+        with open(log_path) as f:
+            found = _CBC_BOUND_RE.findall(f.read())
+    except OSError:
+        return None
+    return abs(float(found[-1])) if found else None
+
+@register_engine("cbc")
+def solve_cbc(df, month_codes, week_codes, total_investment, monthly_limit, weekly_limit,
+              min_invest, per_buy_max, fee_percent, context, time_limit, gap_rel, threads, start):
+    model, invest_vars, invest_binary = define_ilp_model(
+        df, total_investment, monthly_limit, weekly_limit,
+        min_invest, per_buy_max, fee_percent, context
+    )
+    invest_list = list(invest_vars.values())
+    warm_start = start is not None
+    if warm_start:
+        for x, b, amount in zip(invest_list, invest_binary.values(), start):
+            x.setInitialValue(float(amount))
+            b.setInitialValue(1 if amount > 0 else 0)
+
+    fd, log_path = tempfile.mkstemp(suffix="-cbc.log")
+    os.close(fd)
+    try:
+        solver = PULP_CBC_CMD(msg=0, timeLimit=time_limit, gapRel=gap_rel,
+                              threads=threads, warmStart=warm_start, logPath=log_path)
+        model.solve(solver)
+        bound = _cbc_best_bound(log_path)
+    finally:
+        os.remove(log_path)
+
+    status_str = LpStatus[model.status]
+    sol_status = getattr(model, 'sol_status', None)
+    logger.info(f"CBC status: {status_str}, solution: {LpSolution.get(sol_status, sol_status)}")
+    if sol_status == LpSolutionOptimal or (sol_status is None and status_str == "Optimal"):
+        status = "optimal"
+    elif sol_status == LpSolutionIntegerFeasible:
+        status = "time_limit"
+    else:
+        return None, status_str, bound
+
+    invest = np.array([var.varValue or 0.0 for var in invest_list])
+    invest[invest <= 0.0] = 0.0
+    logger.debug(f"CBC objective={value(model.objective):.6f}, bound={bound}")
+    return invest, status, bound
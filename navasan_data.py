@@ -1,123 +1,204 @@
 # navasan_data.py
+"""
+navasan_data.py
+Downloads Navasan USD (usd_sell) and 18k gold (18ayar) daily prices into
+usd_ohlc and gold_ohlc, and derives gold in USD from them.
+
+Only the days of the requested Gregorian range missing from the coverage
+manifest are fetched. Gaps are split into NAVASAN_CHUNK_DAYS windows that
+are requested concurrently over one keep-alive session; every window that
+succeeds is marked as covered (Fridays and holidays without quotes too).
+Navasan speaks Shamsi dates: they are converted with a day-by-day
+Gregorian/Shamsi table built once with NumPy.
+"""
+
 import requests
 import jdatetime
 import logging
-import time
-import os
+import threading
+import functools
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from cache_manager import insert_ohlc_data, fetch_cached_data
+from requests.adapters import HTTPAdapter
+from cache_manager import (insert_ohlc_data, record_coverage, get_missing_date_ranges,
+                           refresh_usd_ffill, refresh_gold_usd)
 from database_manager import init_db
+from metrics import timer, count
 from credentials import navasan_api_key
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 API_KEY = navasan_api_key
 BASE_URL = "http://api.navasan.tech/ohlcSearch/"
+NAVASAN_ITEMS = {
+    "usd_ohlc": "usd_sell",
+    "gold_ohlc": "18ayar",
+}
+NAVASAN_CHUNK_DAYS = 90
+NAVASAN_MAX_WORKERS = 4
+NAVASAN_TIMEOUT = (5, 30)  # connect, read seconds
+# Shamsi years of the conversion table (1991-03-21 .. 2042-03-20)
+SHAMSI_TABLE_YEARS = (1370, 1420)
+
+@functools.lru_cache(maxsize=1)
+def _shamsi_calendar():
+    """
+    (Gregorian days as datetime64[D], Shamsi days as YYYYMMDD ints), one
+    entry per day of SHAMSI_TABLE_YEARS; both arrays are sorted.
+    """
+    first_year, last_year = SHAMSI_TABLE_YEARS
+    keys = []
+    for year in range(first_year, last_year + 1):
+        esfand = 30 if jdatetime.date(year, 1, 1).isleap() else 29
+        for month, length in enumerate([31] * 6 + [30] * 5 + [esfand], start=1):
+            keys.append(year * 10000 + month * 100 + np.arange(1, length + 1))
+    keys = np.concatenate(keys)
+    first_day = np.datetime64(jdatetime.date(first_year, 1, 1).togregorian(), 'D')
+    return first_day + np.arange(len(keys)), keys
+
+def shamsi_to_gregorian(shamsi_dates):
+    """Shamsi 'Y-M-D' strings -> Gregorian datetime64[D] array."""
+    days, keys = _shamsi_calendar()
+    parts = pd.Series(shamsi_dates, dtype=str).str.split('-', expand=True).astype(int).to_numpy()
+    if not len(parts):
+        return days[:0]
+    wanted = parts[:, 0] * 10000 + parts[:, 1] * 100 + parts[:, 2]
+    idx = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    if (keys[idx] != wanted).any():
+        raise ValueError(f"Shamsi dates outside {SHAMSI_TABLE_YEARS} or invalid: {wanted[keys[idx] != wanted][:5]}")
+    return days[idx]
+
+def gregorian_to_shamsi(date):
+    """Gregorian date (or 'YYYY-MM-DD') -> Shamsi 'YYYY-MM-DD' string."""
+    days, keys = _shamsi_calendar()
+    i = int((np.datetime64(pd.Timestamp(date), 'D') - days[0]).astype(int))
+    if not 0 <= i < len(keys):
+        raise ValueError(f"{date} is outside the Shamsi years {SHAMSI_TABLE_YEARS}.")
+    key = int(keys[i])
+    return f"{key // 10000:04d}-{key // 100 % 100:02d}-{key % 100:02d}"
 
 def persian_to_gregorian(persian_date_str):
-    y, m, d = map(int, persian_date_str.split('-'))
-    import jdatetime
-    gdate = jdatetime.date(y, m, d).togregorian()
-    return gdate.strftime("%Y-%m-%d")
+    return pd.Timestamp(shamsi_to_gregorian([persian_date_str])[0]).strftime("%Y-%m-%d")
 
-def fetch_navasan_data(item, start_shamsi, end_shamsi):
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=NAVASAN_MAX_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def _decode_ohlc(raw):
+    """Navasan rows -> DataFrame (date: Gregorian datetime64, open/high/low/close)."""
+    df = pd.DataFrame(raw, columns=['date', 'open', 'high', 'low', 'close'])
+    ohlc = {'date': shamsi_to_gregorian(df['date'])}
+    for c in ('open', 'high', 'low', 'close'):
+        ohlc[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0).to_numpy()
+    return pd.DataFrame(ohlc)
+
+def _fetch_window(item, start_shamsi, end_shamsi):
+    """One Navasan request; raises on failure."""
     params = {
         "api_key": API_KEY,
         "item": item,
         "start": start_shamsi,
         "end": end_shamsi
     }
+    logger.info(f"Requesting {item} from Navasan: {start_shamsi} -> {end_shamsi}")
+    try:
+        with timer('dca_external_request_seconds', service='navasan'):
+            resp = _get_session().get(BASE_URL, params=params, timeout=NAVASAN_TIMEOUT)
+    except Exception:
+        count('dca_external_requests_total', service='navasan', outcome='error')
+        raise
+    count('dca_external_requests_total', service='navasan', outcome=str(resp.status_code))
+    resp.raise_for_status()
+    data = _decode_ohlc(resp.json())
+    logger.info(f"Fetched {len(data)} records for {item}.")
+    return data
+
+def fetch_navasan_data(item, start_shamsi, end_shamsi):
+    """Rows of `item` for [start_shamsi, end_shamsi] as a DataFrame (empty on errors)."""
     try:
-        logger.info(f"Requesting {item} from Navasan: {start_shamsi} -> {end_shamsi}")
-        resp = requests.get(BASE_URL, params=params)
-        resp.raise_for_status()
-        raw = resp.json()
-        cleaned = []
-        for row in raw:
-            gdate = persian_to_gregorian(row['date'])
-            cleaned.append({
-                'date': gdate,
-                'open': float(row.get('open', 0.0)),
-                'high': float(row.get('high', 0.0)),
-                'low':  float(row.get('low',  0.0)),
-                'close':float(row.get('close',0.0)),
-            })
-        logger.info(f"Fetched {len(cleaned)} records for {item}.")
-        return cleaned
+        return _fetch_window(item, start_shamsi, end_shamsi)
     except Exception as e:
         logger.error(f"Error fetching {item} from Navasan: {e}", exc_info=True)
-        return []
+        return _decode_ohlc([])
 
-def download_usd_data(start_shamsi, end_shamsi):
-    init_db()
-    data = fetch_navasan_data("usd_sell", start_shamsi, end_shamsi)
-    insert_ohlc_data("usd_ohlc", data)
+def _missing_windows(start_date, end_date):
+    """
+    (table, first, last) windows of at most NAVASAN_CHUNK_DAYS days covering
+    the missing days of each Navasan table. Gaps less than NAVASAN_CHUNK_DAYS
+    apart (the Fridays and holidays of an old manifest) are merged first, so
+    they cost one request per window rather than one each; the cached days in
+    between are fetched again and upserted unchanged.
+    """
+    windows = []
+    chunk = timedelta(days=NAVASAN_CHUNK_DAYS)
+    for table_name in NAVASAN_ITEMS:
+        spans = []
+        for first, last in sorted(get_missing_date_ranges(table_name, start_date, end_date)):
+            if spans and first - spans[-1][1] <= chunk:
+                spans[-1][1] = max(spans[-1][1], last)
+            else:
+                spans.append([first, last])
+        for first, last in spans:
+            while first <= last:
+                windows.append((table_name, first, min(first + chunk - timedelta(days=1), last)))
+                first += chunk
+    return windows
 
-def download_gold_data(start_shamsi, end_shamsi):
+def download_navasan_data(start_date, end_date, max_workers=NAVASAN_MAX_WORKERS):
+    """
+    Fetch the USD and gold days of [start_date, end_date] (Gregorian
+    'YYYY-MM-DD') that are not cached yet, NAVASAN_CHUNK_DAYS per request and
+    up to max_workers requests at a time.
+    """
     init_db()
-    data = fetch_navasan_data("18ayar", start_shamsi, end_shamsi)
-    insert_ohlc_data("gold_ohlc", data)
+    windows = _missing_windows(start_date, end_date)
+    if not windows:
+        logger.info(f"Navasan USD and gold fully cached for {start_date}..{end_date}. No download needed.")
+        return
+
+    def fetch(window):
+        table_name, first, last = window
+        try:
+            return _fetch_window(NAVASAN_ITEMS[table_name], gregorian_to_shamsi(first), gregorian_to_shamsi(last))
+        except Exception as e:
+            logger.error(f"Giving up on Navasan {table_name} {first:%Y-%m-%d}..{last:%Y-%m-%d}: {e}", exc_info=True)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as pool:
+        for (table_name, first, last), data in zip(windows, pool.map(fetch, windows)):
+            if data is None:
+                continue
+            if len(data):
+                insert_ohlc_data(table_name, data)
+            record_coverage(table_name, first, last)
 
 def forward_fill_usd_data():
+    """Bring usd_ffill_ohlc (every day, latest quote carried forward) up to date with usd_ohlc."""
     logger.info("Starting forward-fill for USD data to handle missing days.")
-    usd_all = fetch_cached_data("usd_ohlc", "0000-01-01", "9999-12-31")
-    if not usd_all:
-        logger.warning("No USD data found, cannot forward-fill.")
-        return
-
-    df = pd.DataFrame(usd_all)
-    df['Date'] = pd.to_datetime(df['date'], format="%Y-%m-%d", errors='coerce')
-    df.drop(columns=['date'], inplace=True, errors='ignore')
-    df.sort_values('Date', inplace=True)
-    df.set_index('Date', inplace=True)
-
-    all_days = pd.date_range(start=df.index.min(), end=df.index.max(), freq='D')
-    df = df.reindex(all_days)
-    df[['open','high','low','close']] = df[['open','high','low','close']].ffill()
-
-    fill_data = []
-    for idx, row in df.iterrows():
-        fill_data.append({
-            'date': idx.strftime("%Y-%m-%d"),
-            'open': row['open'] if not pd.isnull(row['open']) else 0.0,
-            'high': row['high'] if not pd.isnull(row['high']) else 0.0,
-            'low':  row['low']  if not pd.isnull(row['low'])  else 0.0,
-            'close':row['close']if not pd.isnull(row['close'])else 0.0
-        })
-    insert_ohlc_data("usd_ohlc", fill_data)
-    logger.info("USD forward-fill completed and reinserted into DB.")
+    filled = refresh_usd_ffill()
+    logger.info(f"USD forward-fill completed ({filled} days written or removed).")
 
 def convert_gold_to_usd():
+    """
+    Forward-fill USD, then refresh gold_usd_ohlc for the days whose gold or
+    forward-filled USD prices changed. The IRR prices in gold_ohlc are left untouched.
+    """
     forward_fill_usd_data()
+    refresh_gold_usd()
 
-    gold_all = fetch_cached_data("gold_ohlc", "0000-01-01", "9999-12-31")
-    if not gold_all:
-        logger.warning("No gold data to convert.")
-        return
-
-    usd_all  = fetch_cached_data("usd_ohlc",  "0000-01-01", "9999-12-31")
-    usd_map  = {u['date']: u for u in usd_all if u['close'] != 0}
-
-    updated = []
-    for g in gold_all:
-        date_str = g['date']
-        usd = usd_map.get(date_str, None)
-        if usd:
-            factor = float(usd['close'])
-            if factor > 0:
-                g['open']  = round(g['open'] / factor, 4)
-                g['high']  = round(g['high'] / factor, 4)
-                g['low']   = round(g['low']  / factor, 4)
-                g['close'] = round(g['close']/ factor, 4)
-        updated.append(g)
-
-    logger.info(f"Converted {len(updated)} gold records from IRR to USD using forward-filled USD.")
-    insert_ohlc_data("gold_ohlc", updated)
-
-def main_download_and_convert_gold(start_shamsi, end_shamsi):
-    logger.info(f"=== Downloading USD & Gold from Navasan in range {start_shamsi}-{end_shamsi} ===")
-    download_usd_data(start_shamsi, end_shamsi)
-    download_gold_data(start_shamsi, end_shamsi)
+def main_download_and_convert_gold(start_date, end_date):
+    logger.info(f"=== Downloading USD & Gold from Navasan in range {start_date}..{end_date} ===")
+    download_navasan_data(start_date, end_date)
     convert_gold_to_usd()
     logger.info("Finished Gold & USD updates (with forward fill).")
@@ -4,64 +4,76 @@ Defines an ILP model for either 'crypto' or 'gold'.
 """
 
 import logging
+import numpy as np
 import pandas as pd
-from pulp import LpMaximize, LpProblem, LpVariable, lpSum, LpBinary, LpContinuous
+from pulp import (LpMaximize, LpProblem, LpVariable, LpAffineExpression, LpConstraint,
+                  LpConstraintLE, LpConstraintGE, LpBinary, LpContinuous)
 from data_preprocessing import get_crypto_data, get_gold_data
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+def _group_positions(codes, n_groups):
+    """Row positions of every bucket code, in row order, from one stable sort."""
+    order = np.argsort(codes, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(codes, minlength=n_groups))[:-1])
+
 def define_ilp_model(df, total_investment, monthly_limit, weekly_limit,
-                     min_invest, per_buy_max, fee_percent=0.1):
-    df = df.copy()
-    df.set_index('Date', inplace=True)
-    periods = df.index.tolist()
+                     min_invest, per_buy_max, fee_percent=0.1, context=None):
+    """
+    Build the model from column arrays: variable names, objective
+    coefficients and month/week membership are computed once for all bars
+    and each constraint is created directly from (variable, coefficient) pairs.
+    If a ScenarioContext is given, its precomputed month/week bucket codes
+    are used instead of re-deriving them from the dates.
+    """
+    date_index = pd.DatetimeIndex(df['Date'])
+    periods = date_index.tolist()
+    names = date_index.strftime("%Y%m%d_%H%M")
+    opens = df['Open'].to_numpy(dtype=float)
+    coin_coefs = (1.0 / np.where(opens <= 0, 1e-9, opens)).tolist()
 
     model = LpProblem(name="asset-buying-optimization", sense=LpMaximize)
 
-    invest_vars = {}
-    invest_binaries = {}
-
-    for period in periods:
-        var_name = period.strftime("%Y%m%d_%H%M")
-        invest_vars[period] = LpVariable(f"invest_{var_name}", lowBound=0, upBound=per_buy_max, cat=LpContinuous)
-        invest_binaries[period] = LpVariable(f"binary_{var_name}", cat=LpBinary)
+    invest_list = [LpVariable(f"invest_{n}", lowBound=0, upBound=per_buy_max, cat=LpContinuous) for n in names]
+    binary_list = [LpVariable(f"binary_{n}", cat=LpBinary) for n in names]
+    invest_vars = dict(zip(periods, invest_list))
+    invest_binaries = dict(zip(periods, binary_list))
 
     # Objective
-    objective_terms = []
-    for period in periods:
-        open_price = float(df.loc[period, 'Open'])
-        if open_price <= 0:
-            open_price = 1e-9
-        objective_terms.append(invest_vars[period] * (1.0 / open_price))
-    model += lpSum(objective_terms), "TotalCoins"
+    model += LpAffineExpression(list(zip(invest_list, coin_coefs))), "TotalCoins"
 
     # Constraints
-    model += (lpSum(invest_vars.values()) <= total_investment), "TotalInvestment"
+    model += LpConstraint(LpAffineExpression([(v, 1) for v in invest_list]),
+                          sense=LpConstraintLE, rhs=total_investment), "TotalInvestment"
+
+    if context is not None:
+        month_codes, month_labels = context.month_codes, context.month_labels
+        week_codes,  week_labels  = context.week_codes,  context.week_labels
+    else:
+        month_codes, month_labels = pd.factorize(date_index.to_period('M'))
+        week_codes,  week_labels  = pd.factorize(date_index.to_period('W'))
 
-    df['Month'] = df.index.to_period('M')
-    for m in df['Month'].unique():
-        subset_idx = df[df['Month'] == m].index
-        model += (lpSum(invest_vars[i] for i in subset_idx) <= monthly_limit), f"MonthLimit_{m}"
+    for m, subset_idx in zip(month_labels, _group_positions(month_codes, len(month_labels))):
+        model += LpConstraint(LpAffineExpression([(invest_list[i], 1) for i in subset_idx]),
+                              sense=LpConstraintLE, rhs=monthly_limit), f"MonthLimit_{m}"
 
-    df['Week'] = df.index.to_period('W')
-    for w in df['Week'].unique():
-        subset_idx = df[df['Week'] == w].index
-        model += (lpSum(invest_vars[i] for i in subset_idx) <= weekly_limit), f"WeekLimit_{w}"
+    for w, subset_idx in zip(week_labels, _group_positions(week_codes, len(week_labels))):
+        model += LpConstraint(LpAffineExpression([(invest_list[i], 1) for i in subset_idx]),
+                              sense=LpConstraintLE, rhs=weekly_limit), f"WeekLimit_{w}"
 
-    for period in periods:
-        model += invest_vars[period] >= (min_invest * invest_binaries[period])
-        model += invest_vars[period] <= (per_buy_max * invest_binaries[period])
+    for x, b in zip(invest_list, binary_list):
+        model += LpConstraint(LpAffineExpression([(x, 1), (b, -min_invest)]), sense=LpConstraintGE, rhs=0)
+        model += LpConstraint(LpAffineExpression([(x, 1), (b, -per_buy_max)]), sense=LpConstraintLE, rhs=0)
 
     logger.debug("ILP model defined successfully.")
     return model, invest_vars, invest_binaries
 
-def build_model_for_asset(asset_type, start_date, end_date,
-                          total_investment, monthly_limit, weekly_limit,
-                          min_invest, per_buy_max, fee_percent=0.1,
-                          symbol=None):
-    logger.info(f"Building ILP model for {asset_type}, symbol={symbol}, range [{start_date}, {end_date}]")
-    if asset_type == "crypto":
+def load_asset_frame(asset_type, start_date, end_date, symbol=None, context=None):
+    """Price frame for the optimization, taken from the context when given."""
+    if context is not None:
+        df = context.frame
+    elif asset_type == "crypto":
         if not symbol:
             raise ValueError("Must specify 'symbol' for crypto optimization.")
         df = get_crypto_data(symbol, start_date, end_date)
@@ -70,10 +82,18 @@ def build_model_for_asset(asset_type, start_date, end_date,
 
     if df.empty:
         raise Exception(f"No data for {asset_type} in that date range. Cannot build ILP model.")
+    return df
+
+def build_model_for_asset(asset_type, start_date, end_date,
+                          total_investment, monthly_limit, weekly_limit,
+                          min_invest, per_buy_max, fee_percent=0.1,
+                          symbol=None, context=None):
+    logger.info(f"Building ILP model for {asset_type}, symbol={symbol}, range [{start_date}, {end_date}]")
+    df = load_asset_frame(asset_type, start_date, end_date, symbol, context)
 
     model, invest_vars, invest_binaries = define_ilp_model(
         df, total_investment, monthly_limit, weekly_limit,
-        min_invest, per_buy_max, fee_percent
+        min_invest, per_buy_max, fee_percent, context
     )
     logger.info(f"Model built for {asset_type}, rows={len(df)}.")
     return model, invest_vars, invest_binaries, df
@@ -0,0 +1,160 @@
+"""
+price_store.py
+Local columnar copy of the OHLC tables for the backtest read path.
+
+Bars are kept as memory-mapped .npy files, one per table, symbol, interval
+and calendar year (calendar month below PRICE_STORE_MONTHLY_BELOW, so a 1m
+partition stays around 45k bars):
+
+    <PRICE_STORE_DIR>/<table>/<symbol or _>/<interval>/<2024 or 2024-03>.npy
+
+Each file is a record array (bar_time datetime64[us] UTC, open, high, low,
+close) sorted by bar_time. Postgres stays the source of truth: a partition
+is always a full export of that period from Postgres, one query per
+partition. Partitions touched by insert_ohlc_data are re-exported right
+after the insert commits (insert listener), and a partition missing on read
+is exported on the spot. A range inside one partition is served as views on
+the memory map, which the price cache keeps without copying; longer ranges
+concatenate the partition slices.
+
+PRICE_STORE_DIR defaults to data/price_store next to this file (not the
+working directory). The store needs fcntl (POSIX) for its locks and is off
+without it; reads then go to Postgres.
+
+Writes bypassing insert_ohlc_data (manual SQL, another host) are not seen;
+call `price_store.clear()` after those.
+"""
+
+import os
+import shutil
+import datetime
+import logging
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from cache_manager import fetch_ohlc_columns, add_insert_listener, interval_step, OHLC_COLUMNS
+from database_manager import OHLC_TABLE_INTERVALS
+from metrics import timed, count
+try:
+    import fcntl
+except ImportError:  # not POSIX
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+PRICE_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "price_store")
+PRICE_STORE_ENABLED = fcntl is not None
+PRICE_STORE_MONTHLY_BELOW = datetime.timedelta(hours=1)
+
+STORE_DTYPE = np.dtype([('bar_time', '<M8[us]')] + [(c, '<f8') for c in OHLC_COLUMNS])
+
+class PriceStore:
+    def __init__(self, store_dir=PRICE_STORE_DIR, enabled=PRICE_STORE_ENABLED):
+        self.store_dir = store_dir
+        self.enabled = enabled
+
+    def _series_dir(self, table_name, symbol, interval):
+        return os.path.join(self.store_dir, table_name, symbol or "_", interval)
+
+    def _path(self, table_name, symbol, interval, period):
+        return os.path.join(self._series_dir(table_name, symbol, interval), f"{period}.npy")
+
+    @staticmethod
+    def _periods(interval, start, end):
+        """Partitions (numpy years or months) holding the bars of [start, end]."""
+        unit = 'M' if interval_step(interval) < PRICE_STORE_MONTHLY_BELOW else 'Y'
+        return np.arange(np.datetime64(start, unit), np.datetime64(end, unit) + 1)
+
+    @contextmanager
+    def _series_lock(self, table_name, symbol, interval):
+        """
+        Exclusive lock on one series across threads and processes, held from
+        the Postgres export to the file swap so an older export never
+        replaces a newer one.
+        """
+        series_dir = self._series_dir(table_name, symbol, interval)
+        os.makedirs(series_dir, exist_ok=True)
+        with open(os.path.join(series_dir, ".lock"), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _export(self, table_name, symbol, interval, periods):
+        """Write the partitions `periods` from Postgres (caller holds the lock)."""
+        bars = 0
+        for period in periods:
+            period_start = period.astype('datetime64[us]').astype(datetime.datetime)
+            period_end = ((period + 1).astype('datetime64[us]') - 1).astype(datetime.datetime)
+            columns = fetch_ohlc_columns(table_name, period_start, period_end, symbol=symbol, interval=interval)
+            records = np.empty(len(columns['bar_time']), dtype=STORE_DTYPE)
+            for name in STORE_DTYPE.names:
+                records[name] = columns[name]
+            path = self._path(table_name, symbol, interval, period)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, records)
+            os.replace(tmp_path, path)  # readers keep their map of the old file
+            bars += len(records)
+        count('dca_price_store_exports_total', table=table_name)
+        logger.debug(f"Price store: exported {bars} {table_name} bars ({symbol or '-'}, {interval}) "
+                     f"for {periods[0]}..{periods[-1]}.")
+
+    @timed('dca_db_seconds', op='price_store_read')
+    def read_columns(self, table_name, start_date, end_date, symbol=None, interval=None):
+        """
+        Same result as cache_manager.fetch_ohlc_columns for [start_date,
+        end_date], read from the partitions (exported first if missing).
+        """
+        interval = interval or OHLC_TABLE_INTERVALS[table_name]
+        start = np.datetime64(pd.Timestamp(start_date), 'us')
+        end = np.datetime64(pd.Timestamp(end_date), 'us')
+        periods = self._periods(interval, start, end)
+
+        missing = [p for p in periods if not os.path.isfile(self._path(table_name, symbol, interval, p))]
+        if missing:
+            with self._series_lock(table_name, symbol, interval):
+                missing = [p for p in missing if not os.path.isfile(self._path(table_name, symbol, interval, p))]
+                if missing:
+                    self._export(table_name, symbol, interval, missing)
+        count('dca_price_store_reads_total', outcome='export' if missing else 'hit')
+
+        parts = []
+        for i, period in enumerate(periods):
+            records = np.load(self._path(table_name, symbol, interval, period), mmap_mode='r')
+            times = records['bar_time']
+            lo = np.searchsorted(times, start, side='left') if i == 0 else 0
+            hi = np.searchsorted(times, end, side='right') if i == len(periods) - 1 else len(times)
+            parts.append(records[lo:hi])
+        records = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return {name: records[name] for name in STORE_DTYPE.names}
+
+    def refresh(self, table_name, symbols, min_date, max_date, interval=None):
+        """Re-export the partitions of [min_date, max_date] for `symbols` (None for gold/usd)."""
+        interval = interval or OHLC_TABLE_INTERVALS[table_name]
+        periods = self._periods(interval, np.datetime64(pd.Timestamp(min_date), 'us'),
+                                np.datetime64(pd.Timestamp(max_date), 'us'))
+        for symbol in symbols or [None]:
+            with self._series_lock(table_name, symbol, interval):
+                self._export(table_name, symbol, interval, periods)
+
+    def clear(self, table_name=None):
+        """Delete the store (or one table of it); it refills from Postgres on read."""
+        path = os.path.join(self.store_dir, table_name) if table_name else self.store_dir
+        shutil.rmtree(path, ignore_errors=True)
+
+price_store = PriceStore()
+
+def _on_ohlc_insert(table_name, symbols, min_date, max_date, interval):
+    if not price_store.enabled:
+        return
+    try:
+        price_store.refresh(table_name, symbols, min_date, max_date, interval)
+    except Exception as e:
+        # A partition that may now be stale must not be served
+        logger.error(f"Price store refresh failed for {table_name}, dropping it: {e}", exc_info=True)
+        price_store.clear(table_name)
+
+add_insert_listener(_on_ohlc_insert)
@@ -8,23 +8,31 @@ import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def generate_scenario_report_en(scenario_label, total_invested, profit, portfolio_value, freq_days=None):
+def generate_scenario_report_en(scenario_label, total_invested, profit, portfolio_value, freq_days=None, solve_info=None):
     msg = f"🔹 *{scenario_label}*\n"
     msg += f"   - Total Invested: {total_invested:.2f} USDT\n"
     msg += f"   - Profit: {profit:.2f} USDT\n"
     msg += f"   - Portfolio Value: {portfolio_value:.2f} USDT\n"
     if freq_days is not None:
         msg += f"   - Frequency (days): {freq_days}\n"
+    if solve_info is not None:
+        status = {"time_limit": "time limit reached", "coarsened": "daily bars",
+                  "decomposed": "monthly decomposition"}.get(solve_info['status'], "optimal")
+        msg += f"   - Solver: {status}, gap {solve_info['gap'] * 100:.2f}%, {solve_info['solve_seconds']:.1f}s\n"
     msg += "\n"
     return msg
 
-def generate_scenario_report_fa(scenario_label, total_invested, profit, portfolio_value, freq_days=None):
+def generate_scenario_report_fa(scenario_label, total_invested, profit, portfolio_value, freq_days=None, solve_info=None):
     msg = f"🔹 *{scenario_label}*\n"
     msg += f"   - سرمایه‌گذاری کل: {total_invested:.2f} USDT\n"
     msg += f"   - سود: {profit:.2f} USDT\n"
     msg += f"   - ارزش سبد: {portfolio_value:.2f} USDT\n"
     if freq_days is not None:
         msg += f"   - فاصله: {freq_days} روز\n"
+    if solve_info is not None:
+        status = {"time_limit": "پایان مهلت زمانی", "coarsened": "کندل روزانه",
+                  "decomposed": "تجزیه ماهانه"}.get(solve_info['status'], "بهینه")
+        msg += f"   - حل‌کننده: {status}، فاصله از بهینه {solve_info['gap'] * 100:.2f}٪، {solve_info['solve_seconds']:.1f} ثانیه\n"
     msg += "\n"
     return msg
 
@@ -32,12 +40,12 @@ def generate_final_report_en(crypto_opt, crypto_dca1, crypto_dca2, gold_opt, gol
     msg = "✨ *Detailed Multi-Scenario Report* ✨\n\n"
 
     # Crypto
-    msg += generate_scenario_report_en(crypto_opt['label'], crypto_opt['invested'], crypto_opt['profit'], crypto_opt['value'])
+    msg += generate_scenario_report_en(crypto_opt['label'], crypto_opt['invested'], crypto_opt['profit'], crypto_opt['value'], solve_info=crypto_opt.get('solve'))
     msg += generate_scenario_report_en(crypto_dca1['label'], crypto_dca1['invested'], crypto_dca1['profit'], crypto_dca1['value'], crypto_dca1['freq'])
     msg += generate_scenario_report_en(crypto_dca2['label'], crypto_dca2['invested'], crypto_dca2['profit'], crypto_dca2['value'], crypto_dca2['freq'])
 
     # Gold
-    msg += generate_scenario_report_en(gold_opt['label'], gold_opt['invested'], gold_opt['profit'], gold_opt['value'])
+    msg += generate_scenario_report_en(gold_opt['label'], gold_opt['invested'], gold_opt['profit'], gold_opt['value'], solve_info=gold_opt.get('solve'))
     msg += generate_scenario_report_en(gold_dca1['label'], gold_dca1['invested'], gold_dca1['profit'], gold_dca1['value'], gold_dca1['freq'])
     msg += generate_scenario_report_en(gold_dca2['label'], gold_dca2['invested'], gold_dca2['profit'], gold_dca2['value'], gold_dca2['freq'])
 
@@ -51,12 +59,12 @@ def generate_final_report_fa(crypto_opt, crypto_dca1, crypto_dca2, gold_opt, gol
     msg = "✨ *گزارش چند سناریویی* ✨\n\n"
 
     # Crypto
-    msg += generate_scenario_report_fa(crypto_opt['label'], crypto_opt['invested'], crypto_opt['profit'], crypto_opt['value'])
+    msg += generate_scenario_report_fa(crypto_opt['label'], crypto_opt['invested'], crypto_opt['profit'], crypto_opt['value'], solve_info=crypto_opt.get('solve'))
     msg += generate_scenario_report_fa(crypto_dca1['label'], crypto_dca1['invested'], crypto_dca1['profit'], crypto_dca1['value'], crypto_dca1['freq'])
     msg += generate_scenario_report_fa(crypto_dca2['label'], crypto_dca2['invested'], crypto_dca2['profit'], crypto_dca2['value'], crypto_dca2['freq'])
 
     # Gold
-    msg += generate_scenario_report_fa(gold_opt['label'], gold_opt['invested'], gold_opt['profit'], gold_opt['value'])
+    msg += generate_scenario_report_fa(gold_opt['label'], gold_opt['invested'], gold_opt['profit'], gold_opt['value'], solve_info=gold_opt.get('solve'))
     msg += generate_scenario_report_fa(gold_dca1['label'], gold_dca1['invested'], gold_dca1['profit'], gold_dca1['value'], gold_dca1['freq'])
     msg += generate_scenario_report_fa(gold_dca2['label'], gold_dca2['invested'], gold_dca2['profit'], gold_dca2['value'], gold_dca2['freq'])
 
@@ -65,3 +73,38 @@ def generate_final_report_fa(crypto_opt, crypto_dca1, crypto_dca2, gold_opt, gol
     msg += "می‌توانید نمودارها و فایل‌های اکسل هر سناریو را برای جزئیات بیشتر بررسی کنید.\n\n"
     msg += "💡 *سپاس از استفاده از ربات DCA!* 💰🚀"
     return msg
+
+def generate_tweak_report_en(param_label, value, opt_infos):
+    msg = f"🔧 *What if {param_label} = {value:.2f} USDT*\n\n"
+    for info in opt_infos:
+        msg += generate_scenario_report_en(info['label'], info['invested'], info['profit'], info['value'], solve_info=info.get('solve'))
+    return msg
+
+def generate_tweak_report_fa(param_label, value, opt_infos):
+    msg = f"🔧 *اگر {param_label} = {value:.2f} دلار باشد*\n\n"
+    for info in opt_infos:
+        msg += generate_scenario_report_fa(info['label'], info['invested'], info['profit'], info['value'], solve_info=info.get('solve'))
+    return msg
+
+def _latency_table(title, summary):
+    msg = f"*{title}*\n```\n"
+    msg += f"{'':<20}{'n':>6}{'p50 s':>9}{'p95 s':>9}\n"
+    for name, s in summary.items():
+        msg += f"{str(name)[:20]:<20}{s['count']:>6}{s['p50']:>9.2f}{s['p95']:>9.2f}\n"
+    msg += "```\n"
+    return msg
+
+def generate_stats_report(stages, scenarios, requests, scheduler, price_cache, result_cache):
+    """Admin-only summary (English): latency per stage/scenario/provider, queue and cache state."""
+    msg = "📊 *Pipeline Stats*\n\n"
+    msg += _latency_table("Stages", stages)
+    msg += _latency_table("Scenarios", scenarios)
+    msg += _latency_table("Provider requests", requests)
+    msg += (f"*Queue:* {scheduler['queue_depth']} waiting, {scheduler['running']}/{scheduler['workers']} running, "
+            f"{scheduler['completed']} done, {scheduler['failed']} failed, {scheduler['rejected']} rejected\n")
+    msg += (f"*Price cache:* {price_cache['hit_rate'] * 100:.0f}% hits "
+            f"({price_cache['hits']}/{price_cache['hits'] + price_cache['misses']}), "
+            f"{price_cache['bytes'] / 1e6:.1f} MB\n")
+    msg += (f"*Result cache:* {result_cache['hit_rate'] * 100:.0f}% hits "
+            f"({result_cache['hits']}/{result_cache['hits'] + result_cache['misses']})\n")
+    return msg
@@ -0,0 +1,339 @@
+"""
+result_cache.py
+Persistent memoization of scenario results (optimized and blind DCA).
+
+Results are stored in the Postgres table `scenario_results` and, optionally,
+mirrored as pickle files on local disk. The key is a hash of the scenario
+function, its parameters (asset, symbol, date range, limits, frequency), the
+effective solver settings of optimizations and the ScenarioContext.data_version
+fingerprint of the prices it ran on, so a change to the underlying OHLC rows
+can never return a stale result. Only optimizations solved to optimality are
+stored: a time-limited, coarsened or decomposed plan is recomputed next time. Entries
+overlapping newly inserted rows are also deleted right away, and the cache is
+trimmed by age and total size.
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import psycopg2
+from cache_manager import add_insert_listener
+from database_manager import get_connection, put_connection
+from metrics import timed, register_gauges
+from solver import solver_settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Bump when solver/blind DCA output changes so old entries stop matching.
+RESULT_CACHE_VERSION = 5
+RESULT_CACHE_DIR = "data/result_cache"
+RESULT_CACHE_DISK_MIRROR = True
+RESULT_CACHE_MAX_AGE_SECONDS = 30 * 24 * 3600
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+ASSET_TABLES = {"crypto_ohlc": "crypto", "gold_usd_ohlc": "gold"}
+
+def _jsonable(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _pack_optimization(result):
+    plan_df, total_invested, total_profit, portfolio_value, solve_info = result
+    return plan_df, {
+        'total_invested': _jsonable(total_invested),
+        'total_profit': _jsonable(total_profit),
+        'portfolio_value': _jsonable(portfolio_value),
+        'solve_info': {k: _jsonable(v) for k, v in solve_info.items()}
+    }
+
+def _unpack_optimization(plan_df, summary):
+    return (plan_df, summary['total_invested'], summary['total_profit'],
+            summary['portfolio_value'], summary['solve_info'])
+
+def _pack_blind(result):
+    plan_df, summary = result
+    return plan_df, {k: _jsonable(v) for k, v in summary.items()}
+
+def _unpack_blind(plan_df, summary):
+    return plan_df, summary
+
+# Scenario function name -> (pack, unpack)
+RESULT_KINDS = {
+    'solve_asset_optimization': (_pack_optimization, _unpack_optimization),
+    'simulate_blind_dca': (_pack_blind, _unpack_blind),
+}
+
+def _solved_optimally(result):
+    return result[4]['status'] == "optimal"
+
+# Scenario function name -> whether one of its results may be stored (default: always)
+RESULT_STORABLE = {
+    'solve_asset_optimization': _solved_optimally,
+}
+SOLVER_SETTING_KEYS = ('backend', 'time_limit', 'gap_rel', 'threads', 'warm_start', 'presolve', 'coarsen')
+
+def scenario_key(func, kwargs):
+    """
+    Hash of the scenario function, its parameters (with the effective
+    solver settings of an optimization) and the context's data version. Returns None when the scenario cannot be memoized (unknown
+    function or no ScenarioContext to fingerprint).
+    """
+    context = kwargs.get('context')
+    if func.__name__ not in RESULT_KINDS or context is None:
+        return None
+    optimization = func.__name__ == 'solve_asset_optimization'
+    params = {}
+    for k, v in kwargs.items():
+        if k == 'context' or (optimization and k in SOLVER_SETTING_KEYS):
+            continue
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            v = float(v)
+        params[k] = v
+    payload = json.dumps({
+        'kind': func.__name__,
+        'version': RESULT_CACHE_VERSION,
+        'params': params,
+        'solver': solver_settings(**{k: kwargs.get(k) for k in SOLVER_SETTING_KEYS}) if optimization else None,
+        'data_version': context.data_version
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, disk_mirror=RESULT_CACHE_DISK_MIRROR,
+                 max_age_seconds=RESULT_CACHE_MAX_AGE_SECONDS, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.disk_mirror = disk_mirror
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key, kind):
+        """Return the cached result for `key`, or None."""
+        try:
+            plan_summary = self._get_disk(key) if self.disk_mirror else None
+            if plan_summary is None:
+                plan_summary = self._get_db(key)
+                if plan_summary is not None and self.disk_mirror:
+                    self._put_disk(key, plan_summary)
+        except Exception as e:
+            logger.error(f"Result cache lookup failed for {key}: {e}", exc_info=True)
+            plan_summary = None
+
+        with self._lock:
+            if plan_summary is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        _, unpack = RESULT_KINDS[kind]
+        return unpack(*plan_summary)
+
+    def put(self, key, kind, kwargs, result):
+        pack, _ = RESULT_KINDS[kind]
+        plan_df, summary = pack(result)
+        try:
+            self._put_db(key, kind, kwargs, plan_df, summary)
+            if self.disk_mirror:
+                self._put_disk(key, (plan_df, summary))
+            self.evict()
+        except Exception as e:
+            logger.error(f"Result cache store failed for {key}: {e}", exc_info=True)
+
+    def _get_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.isfile(path):
+            return None
+        if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+            os.remove(path)
+            return None
+        with open(path, 'rb') as f:
+            plan_summary = pickle.load(f)
+        os.utime(path)
+        return plan_summary
+
+    def _put_disk(self, key, plan_summary):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._disk_path(key) + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(plan_summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._disk_path(key))
+
+    @timed('dca_db_seconds', op='result_cache_get_db')
+    def _get_db(self, key):
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE scenario_results SET last_access=%s
+                WHERE cache_key=%s AND created_at >= %s
+                RETURNING plan, summary
+            ''', (time.time(), key, time.time() - self.max_age_seconds))
+            row = cur.fetchone()
+            conn.commit()
+            cur.close()
+        finally:
+            put_connection(conn)
+        if not row:
+            return None
+        return pickle.loads(bytes(row[0])), json.loads(row[1])
+
+    @timed('dca_db_seconds', op='result_cache_put_db')
+    def _put_db(self, key, kind, kwargs, plan_df, summary):
+        plan_bytes = pickle.dumps(plan_df, protocol=pickle.HIGHEST_PROTOCOL)
+        summary_json = json.dumps(summary)
+        now = time.time()
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO scenario_results
+                    (cache_key, kind, asset, symbol, start_date, end_date,
+                     plan, summary, size_bytes, created_at, last_access)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (cache_key)
+                DO UPDATE SET
+                    plan = EXCLUDED.plan,
+                    summary = EXCLUDED.summary,
+                    size_bytes = EXCLUDED.size_bytes,
+                    created_at = EXCLUDED.created_at,
+                    last_access = EXCLUDED.last_access
+            ''', (key, kind, kwargs.get('asset_type'), kwargs.get('symbol'),
+                  kwargs.get('start_date'), kwargs.get('end_date'),
+                  psycopg2.Binary(plan_bytes), summary_json,
+                  len(plan_bytes) + len(summary_json), now, now))
+            conn.commit()
+            cur.close()
+        finally:
+            put_connection(conn)
+
+    @timed('dca_db_seconds', op='result_cache_evict')
+    def evict(self):
+        """Drop entries older than max_age_seconds, then least recently used ones over max_bytes."""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM scenario_results WHERE created_at < %s",
+                        (time.time() - self.max_age_seconds,))
+            cur.execute('''
+                DELETE FROM scenario_results WHERE cache_key IN (
+                    SELECT cache_key FROM (
+                        SELECT cache_key,
+                               SUM(size_bytes) OVER (ORDER BY last_access DESC) AS running_bytes
+                        FROM scenario_results
+                    ) t
+                    WHERE running_bytes > %s
+                )
+            ''', (self.max_bytes,))
+            conn.commit()
+            cur.close()
+        finally:
+            put_connection(conn)
+
+        if self.disk_mirror and os.path.isdir(self.cache_dir):
+            now = time.time()
+            files = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if not name.endswith(".pkl"):
+                    continue
+                st = os.stat(path)
+                if now - st.st_mtime > self.max_age_seconds:
+                    os.remove(path)
+                else:
+                    files.append((st.st_mtime, st.st_size, path))
+            total = 0
+            for _, size, path in sorted(files, reverse=True):
+                total += size
+                if total > self.max_bytes:
+                    os.remove(path)
+
+    @timed('dca_db_seconds', op='result_cache_invalidate')
+    def invalidate(self, asset, symbols=None, min_date=None, max_date=None):
+        """
+        Delete DB entries of `asset` (and `symbols`) whose date range overlaps
+        [min_date, max_date]. Disk mirror files are keyed by the data
+        fingerprint, so they simply stop matching and age out.
+        """
+        sql = "DELETE FROM scenario_results WHERE asset=%s"
+        params = [asset]
+        if symbols is not None:
+            sql += " AND symbol = ANY(%s)"
+            params.append(list(symbols))
+        if min_date is not None and max_date is not None:
+            sql += " AND start_date <= %s AND end_date >= %s"
+            params += [max_date, min_date]
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            deleted = cur.rowcount
+            conn.commit()
+            cur.close()
+        finally:
+            put_connection(conn)
+        if deleted:
+            logger.info(f"Invalidated {deleted} cached {asset} results after OHLC update.")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+result_cache = ResultCache()
+register_gauges(lambda: [('dca_result_cache_hit_rate', "Hit rate of the scenario result cache.",
+                          result_cache.stats()['hit_rate'], {})])
+
+def _on_ohlc_insert(table_name, symbols, min_date, max_date, interval):
+    asset = ASSET_TABLES.get(table_name)
+    if asset:
+        result_cache.invalidate(asset, symbols, min_date, max_date)
+
+add_insert_listener(_on_ohlc_insert)
+
+def run_memoized(executor, scenarios):
+    """
+    Like executor.run(scenarios), but scenarios whose result is cached are not
+    recomputed and new results are stored. Returns an OrderedDict in the
+    original order.
+    """
+    cached, pending, keys = {}, [], {}
+    for name, func, kwargs in scenarios:
+        key = scenario_key(func, kwargs)
+        hit = result_cache.get(key, func.__name__) if key else None
+        if hit is not None:
+            cached[name] = hit
+        else:
+            keys[name] = key
+            pending.append((name, func, kwargs))
+
+    logger.info(f"Result cache: {len(cached)} hits, {len(pending)} scenarios to compute.")
+    computed = executor.run(pending) if pending else {}
+    for name, func, kwargs in pending:
+        if not keys[name]:
+            continue
+        storable = RESULT_STORABLE.get(func.__name__)
+        if storable is None or storable(computed[name]):
+            result_cache.put(keys[name], func.__name__, kwargs, computed[name])
+        else:
+            logger.info(f"Result cache: not storing {name}, it was not solved to optimality.")
+
+    return OrderedDict(
+        (name, cached[name] if name in cached else computed[name])
+        for name, _, _ in scenarios
+    )
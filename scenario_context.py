@@ -0,0 +1,78 @@
+"""
+scenario_context.py
+Market data for one asset, loaded and parsed once per backtest job and
+shared by the solver, blind DCA, analytics and plotting.
+"""
+
+import hashlib
+import logging
+import pandas as pd
+from data_preprocessing import get_crypto_data, get_gold_data
+from database_manager import OHLC_TABLE_INTERVALS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class ScenarioContext:
+    """
+    Holds the sorted price frame of one asset plus the arrays every stage needs:
+      - dates, opens, closes: numpy arrays aligned with `frame`
+      - month_codes / week_codes: bucket index of every bar
+      - month_labels / week_labels: the Period of each bucket code
+      - data_version: fingerprint of the bar times and prices
+    """
+
+    def __init__(self, asset_type, frame, start_date, end_date, symbol=None, interval=None):
+        if frame.empty:
+            raise Exception(f"No data for {asset_type} in range {start_date}..{end_date}.")
+        self.asset_type = asset_type
+        self.symbol = symbol
+        self.start_date = start_date
+        self.end_date = end_date
+        self.frequency = interval or OHLC_TABLE_INTERVALS["crypto_ohlc" if asset_type == "crypto" else "gold_usd_ohlc"]
+
+        self.frame  = frame
+        self.dates  = frame['Date'].values
+        self.opens  = frame['Open'].to_numpy(dtype=float)
+        self.closes = frame['Close'].to_numpy(dtype=float)
+
+        date_index = pd.DatetimeIndex(self.dates)
+        self.month_codes, self.month_labels = pd.factorize(date_index.to_period('M'))
+        self.week_codes,  self.week_labels  = pd.factorize(date_index.to_period('W'))
+        self._data_version = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def data_version(self):
+        """Changes whenever any bar time, open or close in the range changes."""
+        if self._data_version is None:
+            h = hashlib.sha256()
+            h.update(self.dates.astype('datetime64[ns]').view('i8').tobytes())
+            h.update(self.opens.tobytes())
+            h.update(self.closes.tobytes())
+            self._data_version = h.hexdigest()[:16]
+        return self._data_version
+
+    @property
+    def asset_name(self):
+        return self.symbol if self.asset_type == "crypto" else "gold"
+
+def load_scenario_context(asset_type, start_date, end_date, symbol=None, interval=None):
+    """
+    Fetch and parse the asset's prices once and wrap them in a ScenarioContext.
+    asset_type: "crypto" (needs symbol; `interval` defaults to 4h) or "gold".
+    """
+    if asset_type == "crypto":
+        if not symbol:
+            raise ValueError("Must provide 'symbol' for crypto context.")
+        df = get_crypto_data(symbol, start_date, end_date, interval)
+    else:
+        interval = None
+        df = get_gold_data(start_date, end_date)
+
+    context = ScenarioContext(asset_type, df, start_date, end_date, symbol, interval)
+    logger.info(f"Loaded {asset_type} context symbol={symbol}: {len(context)} bars, "
+                f"{len(context.month_labels)} months, {len(context.week_labels)} weeks")
+    return context
@@ -0,0 +1,101 @@
+"""
+scenario_executor.py
+Run independent backtest scenarios (optimized / blind DCA for crypto and gold)
+at the same time on a process pool and hand the results back in a fixed order.
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Degree of parallelism; 1 runs every scenario in the calling thread.
+SCENARIO_WORKERS = min(6, os.cpu_count() or 1)
+WORKER_LOG_FILE = 'logs/scenario_workers.log'
+
+def _init_worker(log_file):
+    """
+    Send the worker's logs to log_file. force=True replaces whatever handlers
+    the re-imported main module of the bot may have installed.
+    """
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    logging.basicConfig(
+        filename=log_file,
+        filemode='a',
+        format='%(asctime)s - %(process)d - %(levelname)s - %(message)s',
+        level=logging.DEBUG,
+        force=True
+    )
+
+def _timed_call(func, kwargs):
+    """Run one scenario in the worker and return (result, seconds) for the parent's metrics."""
+    t0 = time.perf_counter()
+    result = func(**kwargs)
+    return result, time.perf_counter() - t0
+
+class ScenarioExecutor:
+    """
+    Thin wrapper around a ProcessPoolExecutor.
+    Workers are spawned (not forked) because the bot process is multi-threaded.
+    The pool is created on first use and shared by every job.
+    """
+
+    def __init__(self, max_workers=SCENARIO_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(WORKER_LOG_FILE,)
+                )
+                logger.info(f"Started scenario pool with {self.max_workers} workers.")
+            return self._pool
+
+    def run(self, scenarios):
+        """
+        scenarios: list of (name, func, kwargs). func must be a module-level
+        function so it can be sent to a worker process.
+        Returns an OrderedDict name -> result in the order given. If any
+        scenario fails, the first failure (in that order) is re-raised.
+        """
+        if self.max_workers == 1:
+            results = OrderedDict()
+            for name, func, kwargs in scenarios:
+                results[name], seconds = _timed_call(func, kwargs)
+                observe('dca_scenario_seconds', seconds, scenario=name)
+            return results
+
+        pool = self._get_pool()
+        futures = [(name, pool.submit(_timed_call, func, kwargs)) for name, func, kwargs in scenarios]
+        results = OrderedDict()
+        for name, future in futures:
+            try:
+                results[name], seconds = future.result()
+                observe('dca_scenario_seconds', seconds, scenario=name)
+            except Exception:
+                logger.error(f"Scenario '{name}' failed.", exc_info=True)
+                for _, other in futures:
+                    other.cancel()
+                raise
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+scenario_executor = ScenarioExecutor()
@@ -1,53 +1,84 @@
 """
 solver.py
 Build and solve the ILP model for either a chosen crypto or gold.
+
+Backends:
+  - "highs"  : milp_solvers.py; sparse model solved in-process by HiGHS
+  - "cbc"    : milp_solvers.py; the PuLP model solved by CBC (cross-checks)
+  - "greedy" : fast_solver.py; used when its certified gap is within
+               FAST_GAP_TOLERANCE, otherwise the solve falls back to
+               DEFAULT_MILP_ENGINE
+  - "decomposed" : decomposition.py; monthly MILPs solved in parallel and
+               tied together by a price on the total budget (long ranges)
+
+Before the MILP, presolve.py drops bars that can never be needed (and, for
+very long ranges, optionally everything but the cheapest bar of each day).
+
+The greedy plan is always computed first: it warm-starts CBC, and its
+Lagrangian upper bound gives a proven gap for whatever plan is returned.
+The MILP (or the whole decomposed solve) runs under SOLVER_TIME_LIMIT; if
+the limit is hit, the best incumbent (the engine's or the greedy one,
+whichever buys more coins) is returned with its gap.
 """
 
+import time
 import logging
+import numpy as np
 import pandas as pd
-from pulp import PULP_CBC_CMD, LpStatus
-from optimization_model import build_model_for_asset
+from optimization_model import load_asset_frame
+from fast_solver import solve_dca_greedy, coin_weights, FAST_GAP_TOLERANCE
+from presolve import presolve_bars, SOLVER_PRESOLVE, SOLVER_COARSEN, COARSEN_MIN_BARS
+from decomposition import solve_decomposed
+from milp_solvers import MILP_ENGINES, get_engine
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def solve_asset_optimization(asset_type, start_date, end_date,
-                             total_investment, monthly_limit, weekly_limit,
-                             min_invest, per_buy_max, fee_percent=0.1,
-                             symbol=None):
+SOLVER_BACKEND = "highs"
+DEFAULT_MILP_ENGINE = "highs"
+SOLVER_TIME_LIMIT = 120      # seconds per MILP solve
+SOLVER_GAP_REL = 1e-4        # relative MIP gap at which the MILP stops
+SOLVER_THREADS = 1           # scenarios already run in parallel processes
+SOLVER_WARM_START = True     # CBC only; HiGHS via scipy takes no start
+
+def solver_settings(backend=None, time_limit=None, gap_rel=None, threads=None, warm_start=None,
+                    presolve=None, coarsen=None):
+    """The settings solve_asset_optimization runs with (None -> module default)."""
+    return {
+        'backend': backend or SOLVER_BACKEND,
+        'time_limit': SOLVER_TIME_LIMIT if time_limit is None else time_limit,
+        'gap_rel': SOLVER_GAP_REL if gap_rel is None else gap_rel,
+        'threads': SOLVER_THREADS if threads is None else threads,
+        'warm_start': SOLVER_WARM_START if warm_start is None else warm_start,
+        'presolve': SOLVER_PRESOLVE if presolve is None else presolve,
+        'coarsen': SOLVER_COARSEN if coarsen is None else coarsen
+    }
+
+def _bucket_codes(df, context):
+    if context is not None:
+        return context.month_codes, context.week_codes
+    date_index = pd.DatetimeIndex(df['Date'])
+    month_codes = pd.factorize(date_index.to_period('M'))[0]
+    week_codes  = pd.factorize(date_index.to_period('W'))[0]
+    return month_codes, week_codes
+
+def _relative_gap(objective, upper_bound):
+    if upper_bound <= 0:
+        return 0.0
+    return max(0.0, (upper_bound - objective) / upper_bound)
+
+def plan_summary(df, invest, asset_type):
     """
-    asset_type: "crypto" or "gold"
-    If asset_type="crypto", pass e.g. symbol="BTCUSDT"
-    Returns plan_df, total_invested, total_profit, portfolio_value
+    Buy plan of `invest` (amounts aligned with the rows of df) valued at the
+    last close. Returns plan_df, total_invested, total_profit, portfolio_value.
     """
-    logger.info(f"Solve optimization for {asset_type} in [{start_date}..{end_date}] symbol={symbol}")
-    model, invest_vars, invest_binary, df = build_model_for_asset(
-        asset_type, start_date, end_date,
-        total_investment, monthly_limit, weekly_limit,
-        min_invest, per_buy_max, fee_percent,
-        symbol
-    )
-
-    solver = PULP_CBC_CMD(msg=0)
-    model.solve(solver)
-
-    status_str = LpStatus[model.status]
-    logger.info(f"{asset_type} solver status: {status_str}")
-    if status_str != "Optimal":
-        raise Exception(f"Solver not optimal for {asset_type}. Status={status_str}")
-
-    df.set_index('Date', inplace=True)
-    plan_list = []
-    for period, var in invest_vars.items():
-        val = var.varValue
-        if val is not None and val > 0.0:
-            open_price = float(df.loc[period, 'Open'])
-            plan_list.append({
-                'Date': period,
-                'Investment (USDT)': val,
-                'Buy Price (USDT)': open_price
-            })
-    plan_df = pd.DataFrame(plan_list)
+    opens = df['Open'].to_numpy(dtype=float)
+    bought = np.flatnonzero(invest > 0)
+    plan_df = pd.DataFrame({
+        'Date': df['Date'].iloc[bought].to_numpy(),
+        'Investment (USDT)': invest[bought],
+        'Buy Price (USDT)': opens[bought]
+    }) if len(bought) else pd.DataFrame()
     if plan_df.empty:
         logger.warning(f"No invests found by solver for {asset_type}.")
         total_invested  = 0.0
@@ -62,3 +93,129 @@ def solve_asset_optimization(asset_type, start_date, end_date,
 
     logger.info(f"{asset_type} Optimize => Invested={total_invested:.2f}, Profit={total_profit:.2f}, Value={portfolio_value:.2f}")
     return plan_df, total_invested, total_profit, portfolio_value
+
+def solve_asset_optimization(asset_type, start_date, end_date,
+                             total_investment, monthly_limit, weekly_limit,
+                             min_invest, per_buy_max, fee_percent=0.1,
+                             symbol=None, context=None, backend=None,
+                             time_limit=None, gap_rel=None, threads=None, warm_start=None,
+                             presolve=None, coarsen=None):
+    """
+    asset_type: "crypto" or "gold"
+    If asset_type="crypto", pass e.g. symbol="BTCUSDT"
+    context: optional ScenarioContext with the already loaded prices
+    backend: "highs", "cbc", "greedy" or "decomposed" (default SOLVER_BACKEND)
+    time_limit, gap_rel, threads, warm_start: MILP settings
+        (default SOLVER_TIME_LIMIT, SOLVER_GAP_REL, SOLVER_THREADS, SOLVER_WARM_START)
+    presolve, coarsen: model reduction before the MILP (default SOLVER_PRESOLVE,
+        SOLVER_COARSEN; coarsening only applies from COARSEN_MIN_BARS bars)
+    Returns plan_df, total_invested, total_profit, portfolio_value, solve_info
+    where solve_info has 'backend', 'status' ("optimal", "time_limit",
+    "coarsened" when only the daily-bar model was solved to optimality or
+    "decomposed" for a month-by-month plan),
+    'gap' (proven relative gap of the plan), 'solve_seconds', 'presolve'
+    (presolve_bars stats, or None when the ILP was not presolved) and
+    'decomposition' (months, rounds, reached budget price 'lambda' and
+    'timed_out' of the decomposed backend, else None).
+    """
+    settings = solver_settings(backend, time_limit, gap_rel, threads, warm_start, presolve, coarsen)
+    backend, time_limit, gap_rel = settings['backend'], settings['time_limit'], settings['gap_rel']
+    threads, warm_start = settings['threads'], settings['warm_start']
+    presolve, coarsen = settings['presolve'], settings['coarsen']
+    if backend not in ("greedy", "decomposed") and backend not in MILP_ENGINES:
+        raise ValueError(f"Unknown solver backend '{backend}'.")
+    logger.info(f"Solve optimization for {asset_type} in [{start_date}..{end_date}] symbol={symbol} backend={backend}")
+
+    t0 = time.perf_counter()
+    df = load_asset_frame(asset_type, start_date, end_date, symbol, context)
+    month_codes, week_codes = _bucket_codes(df, context)
+    opens = df['Open'].to_numpy(dtype=float)
+    invest, info = solve_dca_greedy(
+        opens, month_codes, week_codes,
+        total_investment, monthly_limit, weekly_limit,
+        min_invest, per_buy_max
+    )
+    upper_bound = info['upper_bound']
+    presolve_stats = None
+    decomposition_info = None
+
+    if backend == "greedy" and info['certified']:
+        logger.info(f"{asset_type} greedy solve certified: gap={info['gap']:.2e}")
+        used_backend, status, gap = "greedy", "optimal", info['gap']
+    else:
+        if backend == "greedy":
+            logger.info(f"{asset_type} greedy gap {info['gap']:.2e} > {FAST_GAP_TOLERANCE:.0e}, "
+                        f"falling back to {DEFAULT_MILP_ENGINE}.")
+        keep = np.arange(len(df))
+        if presolve:
+            keep, presolve_stats = presolve_bars(
+                df['Date'].values, opens, month_codes, week_codes,
+                total_investment, monthly_limit, weekly_limit, min_invest,
+                coarsen=coarsen and len(df) >= COARSEN_MIN_BARS
+            )
+        exact = presolve_stats is None or presolve_stats['exact']
+        if backend == "decomposed":
+            solved_by = "decomposed"
+            solved_invest, decomposition_info = solve_decomposed(
+                opens, month_codes, week_codes,
+                total_investment, monthly_limit, weekly_limit,
+                min_invest, per_buy_max, invest, info['relaxed_plan'], keep, gap_rel,
+                time_limit=max(0.0, time_limit - (time.perf_counter() - t0))
+            )
+            status, milp_bound = "decomposed", None
+        else:
+            solved_by, engine = get_engine(DEFAULT_MILP_ENGINE if backend == "greedy" else backend)
+            if len(keep) < len(df):
+                ilp_df, ilp_context = df.iloc[keep].reset_index(drop=True), None
+            else:
+                ilp_df, ilp_context = df, context
+
+            # Dropping buys keeps a plan feasible, so the greedy start stays valid on the reduced bars.
+            milp_invest, status, milp_bound = engine(
+                ilp_df, np.asarray(month_codes)[keep], np.asarray(week_codes)[keep],
+                total_investment, monthly_limit, weekly_limit,
+                min_invest, per_buy_max, fee_percent, ilp_context,
+                time_limit, gap_rel, threads, invest[keep] if warm_start else None
+            )
+            solved_invest = None
+            if milp_invest is not None:
+                solved_invest = np.zeros(len(df))
+                solved_invest[keep] = milp_invest
+            if not exact:
+                # The engine only bounds the coarsened model; keep the bound of the full one.
+                milp_bound = None
+                if status == "optimal":
+                    status = "coarsened"
+
+        c = coin_weights(opens)
+        if solved_invest is None:
+            logger.warning(f"{asset_type} {solved_by} returned no plan ({status}); using the greedy plan.")
+            used_backend, status = "greedy", "time_limit"
+        elif c @ solved_invest + 1e-12 < info['objective']:
+            # CBC can lose a MIP start of a maximization model when stopped early,
+            # and daily-bar or split-week plans can buy fewer coins than the greedy one.
+            logger.warning(f"{asset_type} {solved_by} plan is worse than the greedy plan; using the greedy plan.")
+            used_backend = "greedy"
+        else:
+            used_backend, invest = solved_by, solved_invest
+        objective = float(c @ invest)
+        if milp_bound is not None and objective * (1 - 1e-9) <= milp_bound < upper_bound:
+            upper_bound = milp_bound
+        gap = _relative_gap(objective, upper_bound)
+        if used_backend in MILP_ENGINES and status == "optimal" and exact:
+            # The engine proved the gap against its own, usually tighter, bound.
+            gap = min(gap, gap_rel)
+
+    solve_info = {
+        'backend': used_backend,
+        'status': status,
+        'gap': float(gap),
+        'solve_seconds': time.perf_counter() - t0,
+        'presolve': presolve_stats,
+        'decomposition': decomposition_info
+    }
+    logger.info(f"{asset_type} solved by {used_backend}: status={status}, "
+                f"gap={gap:.2e}, {solve_info['solve_seconds']:.2f}s")
+
+    plan_df, total_invested, total_profit, portfolio_value = plan_summary(df, invest, asset_type)
+    return plan_df, total_invested, total_profit, portfolio_value, solve_info
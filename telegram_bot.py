@@ -1,7 +1,6 @@
 # telegram_bot.py
 
 import os
-import threading
 import time
 import logging
 from datetime import datetime
@@ -11,35 +10,44 @@ import pandas as pd
 
 import user_sessions
 from database_manager import init_db
-from binance_data import download_binance_data
+from binance_data import download_binance_data, INTERVAL, BINANCE_INTERVALS
 from navasan_data import main_download_and_convert_gold
 from solver import solve_asset_optimization
 from blind_dca import simulate_blind_dca
-from data_preprocessing import get_crypto_data, get_gold_data
+from scenario_context import load_scenario_context
+from scenario_executor import scenario_executor
+from job_scheduler import job_scheduler
+from result_cache import run_memoized, result_cache
+from data_preprocessing import price_cache_stats
+import metrics
+from what_if import WhatIfModel, what_if_store, tweak, TWEAK_PARAMS, WHAT_IF_TTL_SECONDS
 from analytics import compute_analytics
 from visualization import plot_scenario
 import reporting
+import credentials
 from credentials import telegram_bot_token
 import ui_helpers
 from messages import get_message
 
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    filename='logs/telegram_bot.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 BOT_TOKEN = telegram_bot_token
-if not BOT_TOKEN:
-    raise Exception("BOT_TOKEN not set.")
-
-bot = telebot.TeleBot(BOT_TOKEN)
+# Built by create_bot() in the bot process only: spawned scenario workers
+# re-import this module as __mp_main__ and must not configure logging or
+# build a bot.
+bot = None
 last_message_time = {}
 RATE_LIMIT_SECONDS = 0.5
+# Chats allowed to use /stats (optional `admin_chat_ids` list in credentials.py)
+ADMIN_CHAT_IDS = {str(c) for c in getattr(credentials, 'admin_chat_ids', [])}
+# what_if parameter -> key of the conversation inputs
+TWEAK_INPUT_KEYS = {
+    'total_investment': 'total_investment',
+    'monthly_limit': 'monthly_limit',
+    'weekly_limit': 'weekly_limit',
+    'per_buy_max': 'max_invest'
+}
 
 def get_language(chat_id):
     """Retrieve the language from the user's session; default is 'en'."""
@@ -65,7 +73,6 @@ def rate_limited(func):
         return func(message, *args, **kwargs)
     return wrapper
 
-@bot.message_handler(commands=['start'])
 @rate_limited
 def handle_start(message):
     chat_id = message.chat.id
@@ -80,7 +87,6 @@ def handle_start(message):
         parse_mode="Markdown"
     )
 
-@bot.message_handler(commands=['help'])
 @rate_limited
 def handle_help(message):
     chat_id = message.chat.id
@@ -92,7 +98,22 @@ def handle_help(message):
         reply_markup=ui_helpers.get_main_menu_keyboard(get_language(chat_id))
     )
 
-@bot.message_handler(func=lambda m: True)
+@rate_limited
+def handle_stats(message):
+    chat_id = message.chat.id
+    if str(chat_id) not in ADMIN_CHAT_IDS:
+        logger.warning(f"Ignored /stats from non-admin chat_id={chat_id}.")
+        return
+    stats_text = reporting.generate_stats_report(
+        metrics.summary_by('dca_stage_seconds', 'stage'),
+        metrics.summary_by('dca_scenario_seconds', 'scenario'),
+        metrics.summary_by('dca_external_request_seconds', 'service'),
+        job_scheduler.stats(),
+        price_cache_stats(),
+        result_cache.stats()
+    )
+    bot.send_message(chat_id, stats_text, parse_mode="Markdown")
+
 @rate_limited
 def handle_all_messages(message):
     chat_id = message.chat.id
@@ -129,6 +150,25 @@ def handle_all_messages(message):
         # ========== Ask Crypto Pair ==========
         elif state == "ask_crypto_pair":
             inputs['crypto_pair'] = text.upper()
+            user_sessions.update_session(chat_id, "ask_crypto_interval", inputs)
+            bot.send_message(
+                chat_id,
+                bot_message(chat_id, 'ask_crypto_interval'),
+                reply_markup=ui_helpers.get_crypto_interval_keyboard(BINANCE_INTERVALS),
+                parse_mode="Markdown"
+            )
+
+        # ========== Ask Crypto Interval ==========
+        elif state == "ask_crypto_interval":
+            if text.lower() not in BINANCE_INTERVALS:
+                bot.send_message(
+                    chat_id,
+                    bot_message(chat_id, 'interval_invalid', intervals=", ".join(BINANCE_INTERVALS)),
+                    reply_markup=ui_helpers.get_crypto_interval_keyboard(BINANCE_INTERVALS),
+                    parse_mode="Markdown"
+                )
+                return
+            inputs['crypto_interval'] = text.lower()
             user_sessions.update_session(chat_id, "ask_total_investment", inputs)
             bot.send_message(chat_id, bot_message(chat_id, 'ask_total_investment'), parse_mode="Markdown")
 
@@ -232,6 +272,7 @@ def handle_all_messages(message):
             confirm_text = bot_message(
                 chat_id, 'confirm_inputs',
                 crypto_pair=inputs.get('crypto_pair'),
+                crypto_interval=inputs.get('crypto_interval', INTERVAL),
                 total_investment=inputs.get('total_investment'),
                 start_date=inputs.get('start_date'),
                 end_date=inputs.get('end_date'),
@@ -249,6 +290,41 @@ def handle_all_messages(message):
                 reply_markup=ui_helpers.get_confirmation_inline_keyboard(get_language(chat_id))
             )
 
+        # ========== What-if Value ==========
+        elif state == "tweak_value":
+            param = inputs['tweak_param']
+            entry = what_if_store.get(chat_id)
+            if entry is None:
+                user_sessions.delete_session(chat_id)
+                bot.send_message(chat_id, bot_message(chat_id, 'tweak_expired'), parse_mode="Markdown")
+                return
+            try:
+                value = float(text)
+            except ValueError:
+                bot.send_message(chat_id, bot_message(chat_id, 'input_error'), parse_mode="Markdown")
+                return
+            if value <= 0 or (param == 'per_buy_max' and value < entry['inputs']['min_invest']):
+                bot.send_message(chat_id, bot_message(chat_id, 'input_error'), parse_mode="Markdown")
+                return
+            # Re-solves can take up to SOLVER_TIME_LIMIT: run them on the job
+            # workers, not in the message handler thread.
+            ticket = job_scheduler.submit(chat_id, run_tweak, chat_id, entry, param, value)
+            if ticket['status'] == 'duplicate':
+                bot.send_message(chat_id, bot_message(chat_id, 'job_duplicate'), parse_mode="Markdown")
+                return
+            if ticket['status'] == 'full':
+                bot.send_message(chat_id, bot_message(chat_id, 'tweak_queue_full'), parse_mode="Markdown")
+                return
+            user_sessions.delete_session(chat_id)
+            if ticket['eta_seconds'] > 0:
+                bot.send_message(
+                    chat_id,
+                    get_message(entry['inputs'].get('language', 'en'), 'job_queued',
+                                position=ticket['position'],
+                                eta_minutes=max(1, round(ticket['eta_seconds'] / 60))),
+                    parse_mode="Markdown"
+                )
+
         # ========== Processing State ==========
         elif state == "processing":
             bot.send_message(chat_id, bot_message(chat_id, 'processing'), parse_mode="Markdown")
@@ -260,7 +336,6 @@ def handle_all_messages(message):
         logger.error(f"Error processing input from {chat_id}: {e}", exc_info=True)
         bot.send_message(chat_id, bot_message(chat_id, 'error', error=str(e)), parse_mode="Markdown")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_"))
 def handle_confirmation(call):
     chat_id = call.message.chat.id
     session = user_sessions.get_session(chat_id)
@@ -269,6 +344,15 @@ def handle_confirmation(call):
         return
 
     if call.data == "confirm_yes":
+        ticket = job_scheduler.submit(chat_id, run_pipeline, chat_id, session['inputs'])
+        if ticket['status'] == 'duplicate':
+            bot.answer_callback_query(call.id, bot_message(chat_id, 'job_duplicate'))
+            return
+        if ticket['status'] == 'full':
+            # Keep the confirmation keyboard so the user can retry later
+            bot.answer_callback_query(call.id, bot_message(chat_id, 'queue_full'), show_alert=True)
+            return
+
         # Combine the "Inputs confirmed" text with the existing "processing" text if you wish:
         confirmed_msg = bot_message(chat_id, 'inputs_confirmed') + " " + bot_message(chat_id, 'processing')
         bot.edit_message_text(
@@ -277,8 +361,14 @@ def handle_confirmation(call):
             call.message.message_id,
             parse_mode="Markdown"
         )
-        thread = threading.Thread(target=run_pipeline, args=(chat_id, session['inputs']))
-        thread.start()
+        if ticket['eta_seconds'] > 0:
+            bot.send_message(
+                chat_id,
+                bot_message(chat_id, 'job_queued',
+                            position=ticket['position'],
+                            eta_minutes=max(1, round(ticket['eta_seconds'] / 60))),
+                parse_mode="Markdown"
+            )
 
     else:  # "confirm_no"
         bot.edit_message_text(
@@ -289,207 +379,293 @@ def handle_confirmation(call):
         )
         user_sessions.delete_session(chat_id)
 
-def run_pipeline(chat_id, inputs):
-    lang = inputs.get('language', 'en')
-    try:
-        bot.send_message(chat_id, "🔄 Downloading data and starting analysis...", parse_mode="Markdown")
-        init_db()
-        symbol_pair = inputs['crypto_pair']
-        start_date  = inputs['start_date']
-        end_date    = inputs['end_date']
-
-        # 1) Download crypto data
-        download_binance_data(symbol_pair, start_date, end_date)
-        bot.send_message(chat_id, "✅ Crypto data downloaded.", parse_mode="Markdown")
-
-        # 2) Download & convert gold data
-        start_shamsi = "1399-10-12"
-        end_shamsi   = "1403-11-16"
-        main_download_and_convert_gold(start_shamsi, end_shamsi)
-        bot.send_message(chat_id, "✅ Gold data downloaded and converted.", parse_mode="Markdown")
-
-        # 3) Run Crypto scenarios
-        bot.send_message(chat_id, "🔹 Running crypto scenarios...", parse_mode="Markdown")
-        crypto_opt_df, crypto_opt_invested, crypto_opt_profit, crypto_opt_value = solve_asset_optimization(
-            asset_type='crypto',
-            start_date=start_date,
-            end_date=end_date,
-            total_investment=inputs['total_investment'],
-            monthly_limit=inputs['monthly_limit'],
-            weekly_limit=inputs['weekly_limit'],
-            min_invest=inputs['min_invest'],
-            per_buy_max=inputs['max_invest'],
-            fee_percent=0.1,
-            symbol=symbol_pair
-        )
-        crypto_blind1_df, crypto_blind1_sum = simulate_blind_dca(
-            "crypto",
-            inputs['total_investment'],
-            start_date, end_date,
-            inputs['blind_freq1'],
-            symbol=symbol_pair
-        )
-        crypto_blind2_df, crypto_blind2_sum = simulate_blind_dca(
-            "crypto",
-            inputs['total_investment'],
-            start_date, end_date,
-            inputs['blind_freq2'],
-            symbol=symbol_pair
-        )
+def handle_tweak(call):
+    chat_id = call.message.chat.id
+    param = call.data[len("tweak_"):]
+    entry = what_if_store.get(chat_id)
+    if entry is None or param not in TWEAK_PARAMS:
+        bot.answer_callback_query(call.id, bot_message(chat_id, 'tweak_expired'), show_alert=True)
+        return
 
-        # 4) Run Gold scenarios
-        bot.send_message(chat_id, "🔹 Running gold scenarios...", parse_mode="Markdown")
-        gold_opt_df, gold_opt_invested, gold_opt_profit, gold_opt_value = solve_asset_optimization(
-            asset_type='gold',
-            start_date=start_date,
-            end_date=end_date,
-            total_investment=inputs['total_investment'],
-            monthly_limit=inputs['monthly_limit'],
-            weekly_limit=inputs['weekly_limit'],
-            min_invest=inputs['min_invest'],
-            per_buy_max=inputs['max_invest'],
-            fee_percent=0.1
-        )
-        gold_blind1_df, gold_blind1_sum = simulate_blind_dca(
-            "gold",
-            inputs['total_investment'],
-            start_date, end_date,
-            inputs['blind_freq1']
-        )
-        gold_blind2_df, gold_blind2_sum = simulate_blind_dca(
-            "gold",
-            inputs['total_investment'],
-            start_date, end_date,
-            inputs['blind_freq2']
-        )
+    # The run's session is gone by now; keep its language for the what-if prompts.
+    lang = entry['inputs'].get('language', 'en')
+    user_sessions.update_session(chat_id, "tweak_value", {"language": lang, "tweak_param": param})
+    bot.answer_callback_query(call.id)
+    bot.send_message(
+        chat_id,
+        get_message(lang, 'tweak_ask_value',
+                    param=get_message(lang, f'tweak_param_{param}'),
+                    current=entry['inputs'][TWEAK_INPUT_KEYS[param]]),
+        parse_mode="Markdown"
+    )
 
-        # 5) Compute analytics & save
-        crypto_df = get_crypto_data(symbol_pair, start_date, end_date)
-        gold_df   = get_gold_data(start_date, end_date)
-        analytics_crypto = compute_analytics(crypto_df, frequency='4h')
-        analytics_gold   = compute_analytics(gold_df, frequency='1d')
-
-        os.makedirs("data/excels", exist_ok=True)
-        os.makedirs("data/charts", exist_ok=True)
-        crypto_opt_excel    = f"data/excels/{symbol_pair}_optimized.xlsx"
-        crypto_blind1_excel = f"data/excels/{symbol_pair}_blind1.xlsx"
-        crypto_blind2_excel = f"data/excels/{symbol_pair}_blind2.xlsx"
-        gold_opt_excel      = "data/excels/gold_optimized.xlsx"
-        gold_blind1_excel   = "data/excels/gold_blind1.xlsx"
-        gold_blind2_excel   = "data/excels/gold_blind2.xlsx"
-
-        if not crypto_opt_df.empty:      crypto_opt_df.to_excel(crypto_opt_excel, index=False)
-        if not crypto_blind1_df.empty:   crypto_blind1_df.to_excel(crypto_blind1_excel, index=False)
-        if not crypto_blind2_df.empty:   crypto_blind2_df.to_excel(crypto_blind2_excel, index=False)
-        if not gold_opt_df.empty:        gold_opt_df.to_excel(gold_opt_excel, index=False)
-        if not gold_blind1_df.empty:     gold_blind1_df.to_excel(gold_blind1_excel, index=False)
-        if not gold_blind2_df.empty:     gold_blind2_df.to_excel(gold_blind2_excel, index=False)
-
-        crypto_opt_png    = f"data/charts/{symbol_pair}_optimized.png"
-        crypto_blind1_png = f"data/charts/{symbol_pair}_blind1.png"
-        crypto_blind2_png = f"data/charts/{symbol_pair}_blind2.png"
-        gold_opt_png      = "data/charts/gold_optimized.png"
-        gold_blind1_png   = "data/charts/gold_blind1.png"
-        gold_blind2_png   = "data/charts/gold_blind2.png"
-
-        plot_scenario(symbol_pair, "Optimized", crypto_opt_df, crypto_df, crypto_opt_png)
-        plot_scenario(symbol_pair, f"Blind DCA (freq={inputs['blind_freq1']})", crypto_blind1_df, crypto_df, crypto_blind1_png)
-        plot_scenario(symbol_pair, f"Blind DCA (freq={inputs['blind_freq2']})", crypto_blind2_df, crypto_df, crypto_blind2_png)
-        plot_scenario("gold", "Optimized", gold_opt_df, gold_df, gold_opt_png)
-        plot_scenario("gold", f"Blind DCA (freq={inputs['blind_freq1']})", gold_blind1_df, gold_df, gold_blind1_png)
-        plot_scenario("gold", f"Blind DCA (freq={inputs['blind_freq2']})", gold_blind2_df, gold_df, gold_blind2_png)
-
-        # 6) Prepare final report data
-        crypto_opt_info = {
-            'label': f"{symbol_pair} Optimized",
-            'invested': crypto_opt_invested,
-            'profit':   crypto_opt_profit,
-            'value':    crypto_opt_value,
-            'freq':     None
-        }
-        crypto_blind1_info = {
-            'label': f"{symbol_pair} Blind DCA #1",
-            'invested': crypto_blind1_sum['total_invested'],
-            'profit':   crypto_blind1_sum['profit'],
-            'value':    crypto_blind1_sum['portfolio_value'],
-            'freq':     crypto_blind1_sum['frequency_days']
-        }
-        crypto_blind2_info = {
-            'label': f"{symbol_pair} Blind DCA #2",
-            'invested': crypto_blind2_sum['total_invested'],
-            'profit':   crypto_blind2_sum['profit'],
-            'value':    crypto_blind2_sum['portfolio_value'],
-            'freq':     crypto_blind2_sum['frequency_days']
-        }
-        gold_opt_info = {
-            'label': "Gold Optimized",
-            'invested': gold_opt_invested,
-            'profit':   gold_opt_profit,
-            'value':    gold_opt_value,
-            'freq':     None
-        }
-        gold_blind1_info = {
-            'label': "Gold Blind DCA #1",
-            'invested': gold_blind1_sum['total_invested'],
-            'profit':   gold_blind1_sum['profit'],
-            'value':    gold_blind1_sum['portfolio_value'],
-            'freq':     gold_blind1_sum['frequency_days']
-        }
-        gold_blind2_info = {
-            'label': "Gold Blind DCA #2",
-            'invested': gold_blind2_sum['total_invested'],
-            'profit':   gold_blind2_sum['profit'],
-            'value':    gold_blind2_sum['portfolio_value'],
-            'freq':     gold_blind2_sum['frequency_days']
-        }
-
-        # Final completion message
-        bot.send_message(chat_id, bot_message(chat_id, 'pipeline_complete'), parse_mode="Markdown")
-
-        # Generate final multi-scenario report in chosen language
+def run_tweak(chat_id, entry, param, value):
+    """Re-solve the optimized scenarios of the last run with param=value."""
+    inputs = entry['inputs']
+    lang = inputs.get('language', 'en')
+    try:
+        results = tweak(entry, param, value)
+        inputs[TWEAK_INPUT_KEYS[param]] = value
+        opt_infos = []
+        for label, (plan_df, invested, profit, portfolio_value, solve_info) in results.items():
+            opt_infos.append({
+                'label': label,
+                'invested': invested,
+                'profit':   profit,
+                'value':    portfolio_value,
+                'freq':     None,
+                'solve':    solve_info
+            })
+        param_label = get_message(lang, f'tweak_param_{param}')
         if lang == 'en':
-            final_msg = reporting.generate_final_report_en(
-                crypto_opt_info, crypto_blind1_info, crypto_blind2_info,
-                gold_opt_info, gold_blind1_info, gold_blind2_info
-            )
+            msg = reporting.generate_tweak_report_en(param_label, value, opt_infos)
         else:
-            final_msg = reporting.generate_final_report_fa(
-                crypto_opt_info, crypto_blind1_info, crypto_blind2_info,
-                gold_opt_info, gold_blind1_info, gold_blind2_info
+            msg = reporting.generate_tweak_report_fa(param_label, value, opt_infos)
+        bot.send_message(chat_id, msg, parse_mode="Markdown",
+                         reply_markup=ui_helpers.get_tweak_inline_keyboard(lang))
+    except Exception as e:
+        logger.error(f"What-if error for chat_id={chat_id}: {e}", exc_info=True)
+        bot.send_message(chat_id, get_message(lang, 'error', error=str(e)), parse_mode="Markdown")
+
+def run_pipeline(chat_id, inputs):
+    lang = inputs.get('language', 'en')
+    try:
+        with metrics.job(f"chat_id={chat_id}"):
+            bot.send_message(chat_id, "🔄 Downloading data and starting analysis...", parse_mode="Markdown")
+            init_db()
+            symbol_pair = inputs['crypto_pair']
+            interval    = inputs.get('crypto_interval', INTERVAL)
+            start_date  = inputs['start_date']
+            end_date    = inputs['end_date']
+
+            # 1) Download crypto data
+            with metrics.stage('download_binance'):
+                download_binance_data(symbol_pair, start_date, end_date, interval)
+            bot.send_message(chat_id, "✅ Crypto data downloaded.", parse_mode="Markdown")
+
+            # 2) Download (missing days only) & convert gold data
+            with metrics.stage('download_gold'):
+                main_download_and_convert_gold(start_date, end_date)
+            bot.send_message(chat_id, "✅ Gold data downloaded and converted.", parse_mode="Markdown")
+
+            # Load & parse each asset's prices once for every scenario below
+            with metrics.stage('load_prices'):
+                crypto_ctx = load_scenario_context('crypto', start_date, end_date, symbol=symbol_pair, interval=interval)
+                gold_ctx   = load_scenario_context('gold', start_date, end_date)
+
+            # 3) & 4) Run crypto and gold scenarios side by side
+            bot.send_message(chat_id, "🔹 Running crypto and gold scenarios...", parse_mode="Markdown")
+            opt_kwargs = dict(
+                start_date=start_date,
+                end_date=end_date,
+                total_investment=inputs['total_investment'],
+                monthly_limit=inputs['monthly_limit'],
+                weekly_limit=inputs['weekly_limit'],
+                min_invest=inputs['min_invest'],
+                per_buy_max=inputs['max_invest'],
+                fee_percent=0.1
+            )
+            blind_kwargs = dict(
+                total_investment=inputs['total_investment'],
+                start_date=start_date,
+                end_date=end_date
+            )
+            with metrics.stage('scenarios'):
+                results = run_memoized(scenario_executor, [
+                    ("crypto_opt", solve_asset_optimization,
+                     dict(opt_kwargs, asset_type='crypto', symbol=symbol_pair, context=crypto_ctx)),
+                    ("crypto_blind1", simulate_blind_dca,
+                     dict(blind_kwargs, asset_type='crypto', frequency_days=inputs['blind_freq1'], symbol=symbol_pair, context=crypto_ctx)),
+                    ("crypto_blind2", simulate_blind_dca,
+                     dict(blind_kwargs, asset_type='crypto', frequency_days=inputs['blind_freq2'], symbol=symbol_pair, context=crypto_ctx)),
+                    ("gold_opt", solve_asset_optimization,
+                     dict(opt_kwargs, asset_type='gold', context=gold_ctx)),
+                    ("gold_blind1", simulate_blind_dca,
+                     dict(blind_kwargs, asset_type='gold', frequency_days=inputs['blind_freq1'], context=gold_ctx)),
+                    ("gold_blind2", simulate_blind_dca,
+                     dict(blind_kwargs, asset_type='gold', frequency_days=inputs['blind_freq2'], context=gold_ctx)),
+                ])
+            crypto_opt_df, crypto_opt_invested, crypto_opt_profit, crypto_opt_value, crypto_opt_solve = results["crypto_opt"]
+            crypto_blind1_df, crypto_blind1_sum = results["crypto_blind1"]
+            crypto_blind2_df, crypto_blind2_sum = results["crypto_blind2"]
+            gold_opt_df, gold_opt_invested, gold_opt_profit, gold_opt_value, gold_opt_solve = results["gold_opt"]
+            gold_blind1_df, gold_blind1_sum = results["gold_blind1"]
+            gold_blind2_df, gold_blind2_sum = results["gold_blind2"]
+
+            # 5) Compute analytics & save
+            with metrics.stage('analytics'):
+                analytics_crypto = compute_analytics(frequency=crypto_ctx.frequency, context=crypto_ctx)
+                analytics_gold   = compute_analytics(frequency=gold_ctx.frequency, context=gold_ctx)
+
+            os.makedirs("data/excels", exist_ok=True)
+            os.makedirs("data/charts", exist_ok=True)
+            crypto_opt_excel    = f"data/excels/{symbol_pair}_optimized.xlsx"
+            crypto_blind1_excel = f"data/excels/{symbol_pair}_blind1.xlsx"
+            crypto_blind2_excel = f"data/excels/{symbol_pair}_blind2.xlsx"
+            gold_opt_excel      = "data/excels/gold_optimized.xlsx"
+            gold_blind1_excel   = "data/excels/gold_blind1.xlsx"
+            gold_blind2_excel   = "data/excels/gold_blind2.xlsx"
+
+            with metrics.stage('excel_export'):
+                if not crypto_opt_df.empty:      crypto_opt_df.to_excel(crypto_opt_excel, index=False)
+                if not crypto_blind1_df.empty:   crypto_blind1_df.to_excel(crypto_blind1_excel, index=False)
+                if not crypto_blind2_df.empty:   crypto_blind2_df.to_excel(crypto_blind2_excel, index=False)
+                if not gold_opt_df.empty:        gold_opt_df.to_excel(gold_opt_excel, index=False)
+                if not gold_blind1_df.empty:     gold_blind1_df.to_excel(gold_blind1_excel, index=False)
+                if not gold_blind2_df.empty:     gold_blind2_df.to_excel(gold_blind2_excel, index=False)
+
+            crypto_opt_png    = f"data/charts/{symbol_pair}_optimized.png"
+            crypto_blind1_png = f"data/charts/{symbol_pair}_blind1.png"
+            crypto_blind2_png = f"data/charts/{symbol_pair}_blind2.png"
+            gold_opt_png      = "data/charts/gold_optimized.png"
+            gold_blind1_png   = "data/charts/gold_blind1.png"
+            gold_blind2_png   = "data/charts/gold_blind2.png"
+
+            with metrics.stage('charts'):
+                plot_scenario(symbol_pair, "Optimized", crypto_opt_df, None, crypto_opt_png, context=crypto_ctx)
+                plot_scenario(symbol_pair, f"Blind DCA (freq={inputs['blind_freq1']})", crypto_blind1_df, None, crypto_blind1_png, context=crypto_ctx)
+                plot_scenario(symbol_pair, f"Blind DCA (freq={inputs['blind_freq2']})", crypto_blind2_df, None, crypto_blind2_png, context=crypto_ctx)
+                plot_scenario("gold", "Optimized", gold_opt_df, None, gold_opt_png, context=gold_ctx)
+                plot_scenario("gold", f"Blind DCA (freq={inputs['blind_freq1']})", gold_blind1_df, None, gold_blind1_png, context=gold_ctx)
+                plot_scenario("gold", f"Blind DCA (freq={inputs['blind_freq2']})", gold_blind2_df, None, gold_blind2_png, context=gold_ctx)
+
+            # 6) Prepare final report data
+            crypto_opt_info = {
+                'label': f"{symbol_pair} Optimized",
+                'invested': crypto_opt_invested,
+                'profit':   crypto_opt_profit,
+                'value':    crypto_opt_value,
+                'freq':     None,
+                'solve':    crypto_opt_solve
+            }
+            crypto_blind1_info = {
+                'label': f"{symbol_pair} Blind DCA #1",
+                'invested': crypto_blind1_sum['total_invested'],
+                'profit':   crypto_blind1_sum['profit'],
+                'value':    crypto_blind1_sum['portfolio_value'],
+                'freq':     crypto_blind1_sum['frequency_days']
+            }
+            crypto_blind2_info = {
+                'label': f"{symbol_pair} Blind DCA #2",
+                'invested': crypto_blind2_sum['total_invested'],
+                'profit':   crypto_blind2_sum['profit'],
+                'value':    crypto_blind2_sum['portfolio_value'],
+                'freq':     crypto_blind2_sum['frequency_days']
+            }
+            gold_opt_info = {
+                'label': "Gold Optimized",
+                'invested': gold_opt_invested,
+                'profit':   gold_opt_profit,
+                'value':    gold_opt_value,
+                'freq':     None,
+                'solve':    gold_opt_solve
+            }
+            gold_blind1_info = {
+                'label': "Gold Blind DCA #1",
+                'invested': gold_blind1_sum['total_invested'],
+                'profit':   gold_blind1_sum['profit'],
+                'value':    gold_blind1_sum['portfolio_value'],
+                'freq':     gold_blind1_sum['frequency_days']
+            }
+            gold_blind2_info = {
+                'label': "Gold Blind DCA #2",
+                'invested': gold_blind2_sum['total_invested'],
+                'profit':   gold_blind2_sum['profit'],
+                'value':    gold_blind2_sum['portfolio_value'],
+                'freq':     gold_blind2_sum['frequency_days']
+            }
+
+            # Final completion message
+            bot.send_message(chat_id, bot_message(chat_id, 'pipeline_complete'), parse_mode="Markdown")
+
+            # Generate final multi-scenario report in chosen language
+            if lang == 'en':
+                final_msg = reporting.generate_final_report_en(
+                    crypto_opt_info, crypto_blind1_info, crypto_blind2_info,
+                    gold_opt_info, gold_blind1_info, gold_blind2_info
+                )
+            else:
+                final_msg = reporting.generate_final_report_fa(
+                    crypto_opt_info, crypto_blind1_info, crypto_blind2_info,
+                    gold_opt_info, gold_blind1_info, gold_blind2_info
+                )
+            bot.send_message(chat_id, final_msg, parse_mode="Markdown")
+
+            # Telegram uploads of the charts and Excel files
+            with metrics.stage('telegram_upload'):
+                # Send charts
+                for png in [
+                    crypto_opt_png, crypto_blind1_png, crypto_blind2_png,
+                    gold_opt_png, gold_blind1_png, gold_blind2_png
+                ]:
+                    if os.path.isfile(png):
+                        with open(png, 'rb') as f:
+                            bot.send_photo(chat_id, f, caption=os.path.basename(png))
+
+                # Send Excel files
+                for xls in [
+                    crypto_opt_excel, crypto_blind1_excel, crypto_blind2_excel,
+                    gold_opt_excel, gold_blind1_excel, gold_blind2_excel
+                ]:
+                    if os.path.isfile(xls):
+                        with open(xls, 'rb') as f:
+                            bot.send_document(chat_id, f, caption=os.path.basename(xls))
+
+            # Keep the solved models for what-if tweaks of the limits
+            limits = dict(
+                total_investment=inputs['total_investment'],
+                monthly_limit=inputs['monthly_limit'],
+                weekly_limit=inputs['weekly_limit'],
+                min_invest=inputs['min_invest'],
+                per_buy_max=inputs['max_invest']
+            )
+            what_if_store.put(chat_id, inputs, {
+                crypto_opt_info['label']: WhatIfModel(crypto_ctx, **limits, plan_df=crypto_opt_df),
+                gold_opt_info['label']:   WhatIfModel(gold_ctx, **limits, plan_df=gold_opt_df)
+            })
+            bot.send_message(
+                chat_id,
+                get_message(lang, 'tweak_offer', ttl_minutes=WHAT_IF_TTL_SECONDS // 60),
+                reply_markup=ui_helpers.get_tweak_inline_keyboard(lang),
+                parse_mode="Markdown"
+            )
+
+            # Clear session and show main menu
+            user_sessions.delete_session(chat_id)
+            bot.send_message(
+                chat_id,
+                bot_message(chat_id, 'main_menu'),
+                reply_markup=ui_helpers.get_main_menu_keyboard(get_language(chat_id)),
+                parse_mode="Markdown"
             )
-        bot.send_message(chat_id, final_msg, parse_mode="Markdown")
-
-        # Send charts
-        for png in [
-            crypto_opt_png, crypto_blind1_png, crypto_blind2_png,
-            gold_opt_png, gold_blind1_png, gold_blind2_png
-        ]:
-            if os.path.isfile(png):
-                with open(png, 'rb') as f:
-                    bot.send_photo(chat_id, f, caption=os.path.basename(png))
-
-        # Send Excel files
-        for xls in [
-            crypto_opt_excel, crypto_blind1_excel, crypto_blind2_excel,
-            gold_opt_excel, gold_blind1_excel, gold_blind2_excel
-        ]:
-            if os.path.isfile(xls):
-                with open(xls, 'rb') as f:
-                    bot.send_document(chat_id, f, caption=os.path.basename(xls))
-
-        # Clear session and show main menu
-        user_sessions.delete_session(chat_id)
-        bot.send_message(
-            chat_id,
-            bot_message(chat_id, 'main_menu'),
-            reply_markup=ui_helpers.get_main_menu_keyboard(get_language(chat_id)),
-            parse_mode="Markdown"
-        )
 
     except Exception as e:
         logger.error(f"Pipeline error for chat_id={chat_id}: {e}", exc_info=True)
         bot.send_message(chat_id, bot_message(chat_id, 'error', error=str(e)), parse_mode="Markdown")
 
+def create_bot():
+    """Build the TeleBot and register the handlers above."""
+    global bot
+    if not BOT_TOKEN:
+        raise Exception("BOT_TOKEN not set.")
+    bot = telebot.TeleBot(BOT_TOKEN)
+    bot.register_message_handler(handle_start, commands=['start'])
+    bot.register_message_handler(handle_help, commands=['help'])
+    bot.register_message_handler(handle_stats, commands=['stats'])
+    bot.register_message_handler(handle_all_messages, func=lambda m: True)
+    bot.register_callback_query_handler(handle_confirmation, func=lambda call: call.data.startswith("confirm_"))
+    bot.register_callback_query_handler(handle_tweak, func=lambda call: call.data.startswith("tweak_"))
+    return bot
+
 if __name__ == "__main__":
+    os.makedirs('logs', exist_ok=True)
+    logging.basicConfig(
+        filename='logs/telegram_bot.log',
+        filemode='a',
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        level=logging.DEBUG
+    )
+    create_bot()
+    metrics.start_metrics_server()
     logger.info("Starting bot polling...")
     bot.infinity_polling()
@@ -15,6 +15,12 @@ def get_predefined_crypto_keyboard():
     markup.row("BTCUSDT", "ETHUSDT", "SOLUSDT", "SUIUSDT", "XRPUSDT")
     return markup
 
+def get_crypto_interval_keyboard(intervals):
+    """Return a reply keyboard with one button per candle interval."""
+    markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
+    markup.row(*intervals)
+    return markup
+
 def get_confirmation_inline_keyboard(language="en"):
     """Return an inline keyboard for confirming user inputs."""
     markup = types.InlineKeyboardMarkup()
@@ -38,3 +44,18 @@ def get_main_menu_keyboard(language="en"):
     else:
         markup.row("Start New Analysis", "Help")
     return markup
+
+def get_tweak_inline_keyboard(language="en"):
+    """Return an inline keyboard with one what-if button per tweakable limit."""
+    markup = types.InlineKeyboardMarkup()
+    if language == "fa":
+        labels = {"total_investment": "💰 سرمایه کل", "monthly_limit": "📅 حد ماهانه",
+                  "weekly_limit": "🗓 حد هفتگی", "per_buy_max": "📈 حداکثر هر خرید"}
+    else:
+        labels = {"total_investment": "💰 Total", "monthly_limit": "📅 Monthly",
+                  "weekly_limit": "🗓 Weekly", "per_buy_max": "📈 Per Buy"}
+    buttons = [types.InlineKeyboardButton(text=text, callback_data=f"tweak_{param}")
+               for param, text in labels.items()]
+    markup.row(*buttons[:2])
+    markup.row(*buttons[2:])
+    return markup
@@ -4,6 +4,7 @@ import json
 import time
 import logging
 from database_manager import get_connection, put_connection, init_db
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -12,6 +13,7 @@ def init_sessions_table():
     # Ensure the sessions table exists (already done in init_db, but you can call again if needed)
     init_db()
 
+@timed('dca_db_seconds', op='get_session')
 def get_session(chat_id):
     init_sessions_table()
     conn = get_connection()
@@ -27,6 +29,7 @@ def get_session(chat_id):
     else:
         return None
 
+@timed('dca_db_seconds', op='update_session')
 def update_session(chat_id, state, inputs):
     init_sessions_table()
     conn = get_connection()
@@ -48,6 +51,7 @@ def update_session(chat_id, state, inputs):
     put_connection(conn)
     logger.debug(f"Updated session for chat_id={chat_id}, state={state}.")
 
+@timed('dca_db_seconds', op='delete_session')
 def delete_session(chat_id):
     init_sessions_table()
     conn = get_connection()
@@ -13,7 +13,7 @@ import pandas as pd
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-def plot_scenario(asset_name, scenario_name, plan_df, market_df, output_path):
+def plot_scenario(asset_name, scenario_name, plan_df, market_df, output_path, context=None):
     """
     Plots the asset's Close price vs. the scenario's buy points.
     Saves as a PNG file at output_path.
@@ -21,14 +21,19 @@ def plot_scenario(asset_name, scenario_name, plan_df, market_df, output_path):
       - scenario_name: e.g. "Optimized" or "Blind DCA #1"
       - plan_df: DataFrame with 'Date', 'Buy Price (USDT)' columns
       - market_df: DataFrame with 'Date', 'Close' columns
+      - context: optional ScenarioContext; its date/close arrays replace market_df
     """
     try:
-        if market_df.empty:
-            raise ValueError("market_df is empty, cannot plot scenario.")
+        if context is not None:
+            dates, closes = context.dates, context.closes
+        else:
+            if market_df is None or market_df.empty:
+                raise ValueError("market_df is empty, cannot plot scenario.")
+            dates, closes = market_df['Date'], market_df['Close']
         plt.figure(figsize=(12, 6))
         
         # Plot the asset's close price
-        plt.plot(market_df['Date'], market_df['Close'], label=f"{asset_name.title()} Price", color='blue')
+        plt.plot(dates, closes, label=f"{asset_name.title()} Price", color='blue')
         
         # Plot the scenario's buy points, if any
         if not plan_df.empty:
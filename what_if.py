@@ -0,0 +1,215 @@
+"""
+what_if.py
+Parametric re-solve of a finished backtest (the bot's "tweak" action).
+
+After a run the bot keeps, per chat and for WHAT_IF_TTL_SECONDS after its
+last use, every asset's ScenarioContext, its sparse HiGHS model
+(milp_solvers.HighsModel) and the last optimized plan. Changing the total
+investment, the monthly or weekly limit or the per-buy cap then only updates
+row bounds or the per-buy coefficients of the kept model; nothing is
+downloaded, loaded or built again.
+
+The previous plan, trimmed to the new limits and topped up greedily, is the
+warm start. When the fast_solver bound already certifies it (or the greedy
+plan) within SOLVER_GAP_REL, no MILP is solved at all; otherwise the MILP
+runs on the presolved bars and the better plan is kept, as in solver.py.
+Without scipy.optimize.milp the CBC engine is used, warm-started from it.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from fast_solver import coin_weights, greedy_allocation, solve_dca_greedy
+from presolve import presolve_bars
+from milp_solvers import HighsModel, get_engine, milp
+from solver import plan_summary, SOLVER_TIME_LIMIT, SOLVER_GAP_REL, SOLVER_THREADS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+WHAT_IF_TTL_SECONDS = 10 * 60
+WHAT_IF_MAX_SESSIONS = 50
+TWEAK_PARAMS = ('total_investment', 'monthly_limit', 'weekly_limit', 'per_buy_max')
+
+def plan_to_array(context, plan_df):
+    """Investment of every bar of the context for a plan_df from solver.py."""
+    x = np.zeros(len(context))
+    if not plan_df.empty:
+        positions = np.searchsorted(context.dates, plan_df['Date'].to_numpy())
+        x[positions] = plan_df['Investment (USDT)'].to_numpy(dtype=float)
+    return x
+
+def trim_plan(x, weights, month_codes, week_codes, total_investment, monthly_limit,
+              weekly_limit, min_invest, per_buy_max):
+    """
+    Cut a plan down to new limits: buys are capped at per_buy_max, then the
+    most expensive buys are reduced (or dropped once below min_invest) while
+    their week, their month or the total is over its cap.
+    """
+    x = np.minimum(np.asarray(x, dtype=float), per_buy_max)
+    x[x < min_invest] = 0.0
+    month_over = np.bincount(month_codes, weights=x, minlength=month_codes.max() + 1) - monthly_limit
+    week_over  = np.bincount(week_codes, weights=x, minlength=week_codes.max() + 1) - weekly_limit
+    total_over = x.sum() - total_investment
+    bought = np.flatnonzero(x > 0)
+    for i in bought[np.argsort(weights[bought], kind='stable')]:
+        m, w = month_codes[i], week_codes[i]
+        cut = min(x[i], max(week_over[w], month_over[m], total_over))
+        if cut <= 0:
+            continue
+        if x[i] - cut < min_invest:
+            cut = x[i]
+        x[i] -= cut
+        month_over[m] -= cut
+        week_over[w]  -= cut
+        total_over    -= cut
+    return x
+
+class WhatIfModel:
+    """The model and last plan of one asset, re-solved after its limits change."""
+
+    def __init__(self, context, total_investment, monthly_limit, weekly_limit,
+                 min_invest, per_buy_max, plan_df, fee_percent=0.1):
+        self.context = context
+        self.fee_percent = fee_percent
+        self.limits = {
+            'total_investment': float(total_investment),
+            'monthly_limit': float(monthly_limit),
+            'weekly_limit': float(weekly_limit),
+            'min_invest': float(min_invest),
+            'per_buy_max': float(per_buy_max)
+        }
+        self.weights = coin_weights(context.opens)
+        self.model = None
+        if milp is not None:
+            self.model = HighsModel(self.weights, context.month_codes, context.week_codes, min_invest, per_buy_max)
+            self.model.set_limits(total_investment, monthly_limit, weekly_limit)
+        self.plan = plan_to_array(context, plan_df)
+
+    def update(self, **changes):
+        """Change some of TWEAK_PARAMS; only the affected bounds/coefficients of the model are touched."""
+        unknown = set(changes) - set(TWEAK_PARAMS)
+        if unknown:
+            raise ValueError(f"Cannot tweak {sorted(unknown)}.")
+        self.limits.update({k: float(v) for k, v in changes.items()})
+        if self.model is None:
+            return
+        if 'per_buy_max' in changes:
+            self.model.set_per_buy_max(self.limits['per_buy_max'])
+        if set(changes) & {'total_investment', 'monthly_limit', 'weekly_limit'}:
+            self.model.set_limits(self.limits['total_investment'], self.limits['monthly_limit'],
+                                  self.limits['weekly_limit'])
+
+    def solve(self, time_limit=SOLVER_TIME_LIMIT, gap_rel=SOLVER_GAP_REL):
+        """Same return values as solver.solve_asset_optimization."""
+        t0 = time.perf_counter()
+        ctx, lim = self.context, self.limits
+        args = (ctx.month_codes, ctx.week_codes, lim['total_investment'], lim['monthly_limit'],
+                lim['weekly_limit'], lim['min_invest'], lim['per_buy_max'])
+        c = self.weights
+
+        warm = greedy_allocation(np.argsort(-c, kind='stable'), *args,
+                                 start=trim_plan(self.plan, c, *args))
+        invest, info = solve_dca_greedy(ctx.opens, *args)
+        used_backend = "greedy"
+        if c @ warm >= c @ invest:
+            invest, used_backend = warm, "warm_start"
+        upper_bound = info['upper_bound']
+        status = "optimal"
+
+        gap = max(0.0, (upper_bound - c @ invest) / upper_bound) if upper_bound > 0 else 0.0
+        if gap > gap_rel:
+            keep, _ = presolve_bars(ctx.dates, ctx.opens, *args[:-1])
+            if self.model is not None:
+                solved_by = "highs"
+                milp_invest, status, milp_bound = self.model.solve(time_limit, gap_rel, keep)
+            else:
+                solved_by, engine = get_engine("cbc")
+                kept_invest, status, milp_bound = engine(
+                    ctx.frame.iloc[keep].reset_index(drop=True), ctx.month_codes[keep], ctx.week_codes[keep],
+                    *args[2:], self.fee_percent, None, time_limit, gap_rel, SOLVER_THREADS, invest[keep]
+                )
+                milp_invest = None
+                if kept_invest is not None:
+                    milp_invest = np.zeros(len(ctx))
+                    milp_invest[keep] = kept_invest
+
+            if milp_invest is None:
+                logger.warning(f"What-if {ctx.asset_name}: {solved_by} returned no plan ({status}).")
+                status = "time_limit"
+            elif c @ milp_invest > c @ invest:
+                invest, used_backend = milp_invest, solved_by
+            objective = float(c @ invest)
+            if milp_bound is not None and objective * (1 - 1e-9) <= milp_bound < upper_bound:
+                upper_bound = milp_bound
+            gap = max(0.0, (upper_bound - objective) / upper_bound) if upper_bound > 0 else 0.0
+            if status == "optimal":
+                gap = min(gap, gap_rel)
+
+        self.plan = invest
+        solve_info = {
+            'backend': used_backend,
+            'status': status,
+            'gap': float(gap),
+            'solve_seconds': time.perf_counter() - t0,
+            'presolve': None,
+            'decomposition': None
+        }
+        logger.info(f"What-if {ctx.asset_name} solved by {used_backend}: status={status}, "
+                    f"gap={gap:.2e}, {solve_info['solve_seconds']:.2f}s")
+        plan_df, total_invested, total_profit, portfolio_value = plan_summary(ctx.frame, invest, ctx.asset_type)
+        return plan_df, total_invested, total_profit, portfolio_value, solve_info
+
+class WhatIfStore:
+    """
+    What-if state per chat: the run's inputs, a WhatIfModel per scenario
+    label and a lock serializing the tweaks of the entry. Entries expire WHAT_IF_TTL_SECONDS after their last use; beyond
+    WHAT_IF_MAX_SESSIONS the least recently used one is dropped.
+    """
+
+    def __init__(self, ttl_seconds=WHAT_IF_TTL_SECONDS, max_sessions=WHAT_IF_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, chat_id, inputs, models):
+        with self._lock:
+            self._entries.pop(chat_id, None)
+            self._entries[chat_id] = {'inputs': dict(inputs), 'models': models, 'used_at': time.time(),
+                                      'lock': threading.Lock()}
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def get(self, chat_id):
+        """The entry of chat_id (refreshing its TTL), or None when there is none or it expired."""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if now - e['used_at'] > self.ttl_seconds]:
+                del self._entries[key]
+            entry = self._entries.get(chat_id)
+            if entry is not None:
+                entry['used_at'] = now
+                self._entries.move_to_end(chat_id)
+            return entry
+
+    def drop(self, chat_id):
+        with self._lock:
+            self._entries.pop(chat_id, None)
+
+def tweak(entry, param, value):
+    """
+    Apply param=value to every model of a WhatIfStore entry and re-solve them,
+    holding the entry's lock (the models are changed in place). Returns
+    {label: solve result} in the entry's model order.
+    """
+    results = {}
+    with entry['lock']:
+        for label, model in entry['models'].items():
+            model.update(**{param: value})
+            results[label] = model.solve()
+    return results
+
+what_if_store = WhatIfStore()